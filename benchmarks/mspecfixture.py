@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+# Synthetic mspec files of any size, in the Fortran unformatted record
+# layout written by mgenkennett and read by specfile.load_specfile, so
+# benchmarks do not need a real reflectivity run. Spectra are random, only
+# the layout and sizes are realistic.
+#
+import os
+import struct
+import argparse
+import numpy
+
+HEADER_FMT = '3fifi3if'
+
+def fortran_record(data):
+    """Bytes wrapped in the 4 byte length markers of a Fortran record."""
+    marker = struct.pack('i', len(data))
+    return marker + data + marker
+
+def write_mspec(filename, nranges=10, ndepths=1, nsrc=1, nfreq=512, delta_freq=0.01, fmin=0.0,
+                azimuth=0.0, seed=1):
+    """
+    Write an mspec file with nranges distances, ndepths source depths,
+    nsrc sources, 1 for a moment tensor or 6 for the mechanisms, and nfreq
+    frequencies from fmin to the nyquist. Returns the file size.
+    """
+    rng = numpy.random.default_rng(seed)
+    nfpts = nfreq
+    fny = (nfpts-1)*delta_freq
+    ifmin = round(fmin/delta_freq)
+    nffpts = nfpts - ifmin
+    fmax = (ifmin+nffpts-1)*delta_freq
+    ranges = numpy.linspace(100.0, 100.0*nranges, nranges, dtype=numpy.float32)
+    depths = numpy.linspace(1.0, 1.0+5.0*(ndepths-1), ndepths, dtype=numpy.float32)
+    # each record is 4 byte marker, 6 floats u, w, tn real and imag, 4 byte marker
+    record_dtype = numpy.dtype([("start", "i4"), ("values", "f4", (6,)), ("end", "i4")])
+    with open(filename, "wb") as f:
+        f.write(fortran_record(struct.pack(HEADER_FMT, fmin, fmax, delta_freq, nffpts, fny, nfpts,
+                                           nranges, nsrc, ndepths, azimuth)))
+        f.write(fortran_record(ranges.tobytes()))
+        f.write(fortran_record(depths.tobytes()))
+        for r in range(nranges):
+            records = numpy.empty(ndepths*nsrc*nffpts, dtype=record_dtype)
+            records["start"] = 24
+            records["end"] = 24
+            values = rng.standard_normal((len(records), 6)).astype(numpy.float32)
+            # decay with frequency, like a real spectrum
+            values *= numpy.tile(numpy.exp(-numpy.arange(nffpts)/nffpts*4), ndepths*nsrc).reshape((-1, 1))
+            records["values"] = values
+            f.write(records.tobytes())
+    return os.path.getsize(filename)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic mspec file")
+    parser.add_argument("filename")
+    parser.add_argument("--nranges", type=int, default=10)
+    parser.add_argument("--ndepths", type=int, default=1)
+    parser.add_argument("--nsrc", type=int, default=1)
+    parser.add_argument("--nfreq", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    size = write_mspec(args.filename, nranges=args.nranges, ndepths=args.ndepths, nsrc=args.nsrc,
+                       nfreq=args.nfreq, seed=args.seed)
+    print(f"wrote {args.filename}, {size} bytes")
+
+if __name__ == "__main__":
+    main()
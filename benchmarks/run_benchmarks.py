@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+#
+# Benchmarks of the main pyreflect code paths at several sizes, using
+# synthetic mspec files from mspecfixture so no reflectivity run is needed.
+# Results are written as JSON, one file per run, and a previous run can be
+# given with --compare to show the change of each timing, for example
+#
+#   python benchmarks/run_benchmarks.py --scales small,medium
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/<old>.json
+#
+# results_to_stream needs obspy and is skipped if it is not installed.
+#
+import os
+import sys
+import json
+import time
+import copy
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy
+from pyreflect import specfile, velocitymodel, distaz
+from pyreflect.earthmodel import EarthModel
+from mspecfixture import write_mspec
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+MIN_TIME = 0.5 # seconds, each benchmark is repeated until at least this long
+MAX_REPEATS = 50
+REGRESSION_FACTOR = 1.2 # slower than this ratio to the baseline is reported
+
+# mspec size and model size for each scale
+SCALES = {
+    "small": {"nranges": 10, "ndepths": 1, "nsrc": 1, "nfreq": 256, "maxdepth": 100, "npairs": 100,
+              "ndlines": 10000},
+    "medium": {"nranges": 50, "ndepths": 1, "nsrc": 6, "nfreq": 1024, "maxdepth": 660, "npairs": 1000,
+               "ndlines": 100000},
+    "large": {"nranges": 100, "ndepths": 2, "nsrc": 6, "nfreq": 2048, "maxdepth": 2890, "npairs": 10000,
+              "ndlines": 1000000},
+}
+
+class Fixtures:
+    """Inputs shared by the benchmarks of one scale, created on first use."""
+    def __init__(self, scale, directory):
+        self.params = SCALES[scale]
+        self.directory = directory
+        self.scale = scale
+        self._cache = {}
+    def get(self, key, create):
+        if key not in self._cache:
+            self._cache[key] = create()
+        return self._cache[key]
+    def mspec_filename(self):
+        def create():
+            filename = os.path.join(self.directory, f"mspec_{self.scale}")
+            write_mspec(filename, nranges=self.params["nranges"], ndepths=self.params["ndepths"],
+                        nsrc=self.params["nsrc"], nfreq=self.params["nfreq"])
+            return filename
+        return self.get("mspec", create)
+    def results(self):
+        return self.get("results", lambda: specfile.load_specfile(self.mspec_filename()))
+    def model(self):
+        return self.get("model", lambda: EarthModel.loadAk135f(self.params["maxdepth"]))
+    def gradient_model(self):
+        def create():
+            model = self.model().clone()
+            for layer in model.layers:
+                layer.vp_gradient = 0.01
+                layer.vs_gradient = 0.005
+            return model
+        return self.get("gradient_model", create)
+    def ger_lines(self):
+        return self.get("ger", lambda: self.model().eft().asGER())
+    def points(self):
+        def create():
+            rng = numpy.random.default_rng(1)
+            n = self.params["npairs"]
+            return (rng.uniform(-90, 90, n), rng.uniform(-180, 180, n),
+                    rng.uniform(-90, 90, n), rng.uniform(-180, 180, n))
+        return self.get("points", create)
+    def nd_arrays(self):
+        def create():
+            # ndlines depth points, 6 decimal values, in the four .nd sections
+            rng = numpy.random.default_rng(2)
+            n = self.params["ndlines"]
+            arrays = {"depth": numpy.round(numpy.linspace(0.0, 6371.0, n), 6)}
+            for key, low, high in [("vp", 5.0, 13.7), ("vs", 0.0, 7.3), ("rho", 2.6, 13.1),
+                                   ("qp", 57.0, 1500.0), ("qs", 0.0, 600.0)]:
+                arrays[key] = numpy.round(rng.uniform(low, high, n), 6)
+            arrays["vs"] = numpy.minimum(arrays["vs"], arrays["vp"]/2)
+            arrays["type"] = numpy.repeat(["crust", "mantle", "outer-core", "inner-core"],
+                                          [n//100, n//2, n//4, n - n//100 - n//2 - n//4])
+            return arrays
+        return self.get("nd_arrays", create)
+
+def bench_load_specfile(fixtures):
+    filename = fixtures.mspec_filename()
+    return lambda: specfile.load_specfile(filename)
+
+def bench_to_time_domain(fixtures):
+    results = fixtures.results()
+    return lambda: specfile.to_time_domain(results)
+
+def bench_results_to_stream(fixtures):
+    from pyreflect import optionalutil
+    if not optionalutil.obspy_available():
+        return None
+    results = fixtures.results()
+    model = EarthModel()
+    model.extra["phase_list"] = None
+    # build the tau model before timing, it is cached after the first call
+    optionalutil.cached_taupymodel(model)
+    return lambda: optionalutil.results_to_stream(copy.copy(results), model)
+
+def bench_eft(fixtures):
+    model = fixtures.model()
+    return lambda: model.eft()
+
+def bench_evalGradients(fixtures):
+    model = fixtures.gradient_model()
+    return lambda: model.evalGradients()
+
+def bench_parseGER(fixtures):
+    lines = fixtures.ger_lines()
+    return lambda: EarthModel.parseGER(lines)
+
+def bench_asGER(fixtures):
+    model = fixtures.model().eft()
+    return lambda: model.asGER()
+
+def bench_load_nd_as_depth_points(fixtures):
+    return lambda: velocitymodel.load_nd_as_depth_points(velocitymodel.AK135F)
+
+def bench_save_nd(fixtures):
+    points = velocitymodel.depth_points_from_arrays(fixtures.nd_arrays())
+    filename = os.path.join(fixtures.directory, f"save_nd_{fixtures.scale}.nd")
+    return lambda: velocitymodel.save_nd(points, filename)
+
+def bench_save_nd_arrays(fixtures):
+    arrays = fixtures.nd_arrays()
+    filename = os.path.join(fixtures.directory, f"save_nd_arrays_{fixtures.scale}.nd")
+    return lambda: velocitymodel.save_nd_arrays(arrays, filename)
+
+def bench_DistAz(fixtures):
+    lat1, lon1, lat2, lon2 = fixtures.points()
+    pairs = list(zip(lat1.tolist(), lon1.tolist(), lat2.tolist(), lon2.tolist()))
+    return lambda: [distaz.DistAz(*p).getDelta() for p in pairs]
+
+def bench_distaz_many(fixtures):
+    lat1, lon1, lat2, lon2 = fixtures.points()
+    return lambda: distaz.distaz_many(lat1, lon1, lat2, lon2)
+
+BENCHMARKS = {
+    "load_specfile": bench_load_specfile,
+    "to_time_domain": bench_to_time_domain,
+    "results_to_stream": bench_results_to_stream,
+    "EarthModel.eft": bench_eft,
+    "EarthModel.evalGradients": bench_evalGradients,
+    "EarthModel.parseGER": bench_parseGER,
+    "EarthModel.asGER": bench_asGER,
+    "load_nd_as_depth_points": bench_load_nd_as_depth_points,
+    "save_nd": bench_save_nd,
+    "save_nd_arrays": bench_save_nd_arrays,
+    "DistAz": bench_DistAz,
+    "distaz_many": bench_distaz_many,
+}
+
+def time_call(fn, min_time=MIN_TIME, max_repeats=MAX_REPEATS):
+    """Seconds for each call of fn, after one warm up call, repeated until min_time or max_repeats."""
+    fn()
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_repeats and (len(times) < 3 or time.perf_counter()-start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter()-t0)
+    return times
+
+def run_info():
+    """Versions and machine, so results from different runs can be compared."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except OSError:
+        commit = ""
+    info = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import obspy
+        info["obspy"] = obspy.__version__
+    except ImportError:
+        info["obspy"] = None
+    return info
+
+def run_benchmarks(scales, names=None, min_time=MIN_TIME, verbose=True):
+    out = {"info": run_info(), "results": []}
+    directory = tempfile.mkdtemp(prefix="pyreflect-bench-")
+    try:
+        for scale in scales:
+            fixtures = Fixtures(scale, directory)
+            for name, bench in BENCHMARKS.items():
+                if names is not None and name not in names:
+                    continue
+                fn = bench(fixtures)
+                if fn is None:
+                    if verbose:
+                        print(f"{scale:8s} {name:28s} skipped")
+                    continue
+                times = time_call(fn, min_time=min_time)
+                result = {
+                    "name": name,
+                    "scale": scale,
+                    "params": SCALES[scale],
+                    "repeats": len(times),
+                    "min": min(times),
+                    "median": statistics.median(times),
+                    "mean": statistics.mean(times),
+                }
+                out["results"].append(result)
+                if verbose:
+                    print(f"{scale:8s} {name:28s} {result['min']*1000:12.3f} ms  median {result['median']*1000:12.3f} ms  n={len(times)}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return out
+
+def compare(results, baseline, factor=REGRESSION_FACTOR):
+    """
+    Ratio of the min time of each benchmark to the baseline, and the list
+    of (name, scale, ratio) slower than factor.
+    """
+    base = {(r["name"], r["scale"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"compared to {baseline['info'].get('commit')} {baseline['info'].get('timestamp')}")
+    for r in results["results"]:
+        key = (r["name"], r["scale"])
+        if key not in base:
+            continue
+        ratio = r["min"]/base[key]["min"]
+        r["baseline_ratio"] = ratio
+        flag = ""
+        if ratio > factor:
+            flag = "  SLOWER"
+            regressions.append((r["name"], r["scale"], ratio))
+        print(f"{r['scale']:8s} {r['name']:28s} {ratio:8.2f}x{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run pyreflect benchmarks")
+    parser.add_argument("--scales", default="small,medium", help="comma separated, from: "+", ".join(SCALES))
+    parser.add_argument("--bench", default=None, help="comma separated benchmark names, default all")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME)
+    parser.add_argument("--output", default=None, help="JSON results file, default in benchmarks/results")
+    parser.add_argument("--compare", default=None, help="previous JSON results to compare with")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    scales = args.scales.split(",")
+    for scale in scales:
+        if scale not in SCALES:
+            parser.error(f"unknown scale: {scale}")
+    names = args.bench.split(",") if args.bench else None
+    results = run_benchmarks(scales, names=names, min_time=args.min_time)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{results['info']['commit'] or 'unknown'}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results in {output}")
+    if args.fail_on_regression and len(regressions) > 0:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
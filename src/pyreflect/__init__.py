@@ -1,3 +1,16 @@
 
-__all__ =  ["earthmodel", "earthflatten", "gradient", "momenttensor", "distaz"
-            "velocitymodel", "specfile", "stationmetadata", "optionalutil"]
+__all__ =  ["earthmodel", "earthflatten", "gradient", "momenttensor", "distaz",
+            "velocitymodel", "specfile", "stationmetadata", "optionalutil",
+            "crustonecache", "tilecache", "ensemble",
+            "binarymodel", "traveltimetable",
+            "runplanner", "finitefault", "misfit", "sacwriter"]
+
+def __getattr__(name):
+    # submodules are imported on first use, so import pyreflect is cheap
+    if name in __all__:
+        import importlib
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
@@ -0,0 +1,220 @@
+import os
+import json
+import struct
+import numpy
+from .earthmodel import EarthModel, COPY_ON_WRITE
+from .velocitymodel import LAYER_COLUMNS, layers_as_arrays, layers_from_arrays
+
+#
+# Compact binary form of EarthModel, a small JSON header with the non-layer
+# parameters followed by the layers as a numpy structured array, so loading
+# is a memory map instead of parsing. The layer_arrays of a record are views
+# of the memory map, without a copy, while loading an EarthModel still
+# creates its layer objects. Files are a sequence of records, so
+# many models can be appended to one archive, with a sidecar .idx file of
+# record offsets for direct access.
+#
+# Record layout, all little endian:
+#   8 bytes   magic, RECORD_MAGIC
+#   8 bytes   uint64 length of JSON header, padded to multiple of 8
+#   8 bytes   uint64 number of layers
+#   header    utf-8 JSON, space padded
+#   layers    nlayers * LAYER_DTYPE
+#
+
+RECORD_MAGIC = b"PYRFMOD1"
+RECORD_PREFIX = struct.Struct("<8sQQ")
+INDEX_SUFFIX = ".idx"
+LAYER_DTYPE = numpy.dtype([(key, "<f8") for key in LAYER_COLUMNS] + [("type", "<u2")])
+HEADER_KEYS = ["name", "gradientthick", "eftthick", "isEFT", "slowness", "frequency", "distance",
+               "sourceDepths", "receiverDepth", "momentTensor", "extra"]
+
+def model_as_record(model):
+    """Bytes of the binary record for a model."""
+    arrays = layers_as_arrays(model.peek_layers())
+    layer_types = sorted(set(arrays["type"].tolist()))
+    # read copy on write values without marking them handed out, so clones
+    # of the model still share them
+    header = {key: model.peek(key) if key in COPY_ON_WRITE else getattr(model, key) for key in HEADER_KEYS}
+    header["layer_types"] = layer_types
+    for key in ["vp_factor", "vs_factor"]:
+        if hasattr(model, key):
+            header[key] = getattr(model, key)
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 8)
+    layers = numpy.empty(len(arrays["thick"]), dtype=LAYER_DTYPE)
+    for key in LAYER_COLUMNS:
+        layers[key] = arrays[key]
+    type_codes = {name: idx for idx, name in enumerate(layer_types)}
+    layers["type"] = [type_codes[t] for t in arrays["type"].tolist()]
+    return RECORD_PREFIX.pack(RECORD_MAGIC, len(header_bytes), len(layers)) + header_bytes + layers.tobytes()
+
+def read_record(buffer, offset):
+    """
+    Header dict, layer structured array and offset of the next record for
+    the record at offset. The layer array is a view into buffer, so no copy
+    is made if buffer is a memory map.
+    """
+    magic, header_len, nlayers = RECORD_PREFIX.unpack_from(buffer, offset)
+    if magic != RECORD_MAGIC:
+        raise ValueError(f"not a model record at offset {offset}, magic: {magic}")
+    header_start = offset + RECORD_PREFIX.size
+    header = json.loads(bytes(buffer[header_start:header_start+header_len]).decode("utf-8"))
+    layers = numpy.frombuffer(buffer, dtype=LAYER_DTYPE, count=nlayers, offset=header_start+header_len)
+    return header, layers, header_start + header_len + nlayers*LAYER_DTYPE.itemsize
+
+def layer_arrays_from_record(header, layers):
+    """
+    Columnar layer arrays, see layers_as_arrays. The numeric columns are
+    views of the record layers, only the type names are a new array.
+    """
+    arrays = {key: layers[key] for key in LAYER_COLUMNS}
+    arrays["type"] = numpy.array(header["layer_types"] or [""])[layers["type"]]
+    return arrays
+
+def model_from_record(header, layers):
+    model = EarthModel()
+    for key in HEADER_KEYS:
+        if key in header and key in COPY_ON_WRITE:
+            model.__set_owned__(key, header[key])
+        elif key in header:
+            setattr(model, key, header[key])
+    for key in ["vp_factor", "vs_factor"]:
+        if key in header:
+            setattr(model, key, header[key])
+    model.__set_owned__("layers", layers_from_arrays(layer_arrays_from_record(header, layers)))
+    return model
+
+def write_binary_model(model, filename):
+    """
+    Write model as the only record of filename, replacing the file and
+    removing the index of any archive that was there before.
+    """
+    try:
+        os.remove(filename + INDEX_SUFFIX)
+    except FileNotFoundError:
+        pass
+    with open(filename, "wb") as f:
+        f.write(model_as_record(model))
+
+def load_binary_model(filename, index=0):
+    return ModelArchive(filename)[index]
+
+class ModelArchive:
+    """
+    Append only archive of many models in one file. Models are read via a
+    memory map of the file using the offsets in the sidecar index. If the
+    index is missing or out of date the records are scanned instead, and
+    the index file is only rewritten when models are appended, so reading
+    never writes to the archive directory. Indexing creates an EarthModel
+    with new layer objects on each access, use layer_arrays to read the
+    layers without a copy.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.index_filename = filename + INDEX_SUFFIX
+        self._offsets = None
+        self._index_current = False
+        self._mmap = None
+
+    def append(self, model):
+        self.extend([model])
+
+    def extend(self, models):
+        offsets = self.offsets()
+        offset = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        new_offsets = []
+        with open(self.filename, "ab") as f:
+            for model in models:
+                record = model_as_record(model)
+                f.write(record)
+                new_offsets.append(offset)
+                offset += len(record)
+        self._offsets = numpy.concatenate((offsets, numpy.array(new_offsets, dtype="<u8")))
+        if self._index_current:
+            with open(self.index_filename, "ab") as f:
+                f.write(numpy.array(new_offsets, dtype="<u8").tobytes())
+        else:
+            self.write_index()
+        self._mmap = None
+
+    def offsets(self):
+        if self._offsets is None:
+            self._offsets = self.read_index()
+        return self._offsets
+
+    def read_index(self):
+        """
+        Offsets from the index file, or from scanning the records if it is
+        missing or out of date, in which case the index file is left as is.
+        """
+        self._index_current = False
+        if not os.path.exists(self.filename):
+            return numpy.empty(0, dtype="<u8")
+        file_size = os.path.getsize(self.filename)
+        if os.path.exists(self.index_filename):
+            offsets = numpy.fromfile(self.index_filename, dtype="<u8")
+            if (len(offsets) == 0 and file_size == 0) or \
+                    (len(offsets) > 0 and self.record_end(offsets[-1]) == file_size):
+                self._index_current = True
+                return offsets
+        return self.scan_offsets()
+
+    def write_index(self):
+        """Write the offsets of all records to the index file."""
+        self.offsets().tofile(self.index_filename)
+        self._index_current = True
+
+    def record_end(self, offset):
+        with open(self.filename, "rb") as f:
+            f.seek(int(offset))
+            prefix = f.read(RECORD_PREFIX.size)
+        if len(prefix) < RECORD_PREFIX.size:
+            return -1
+        magic, header_len, nlayers = RECORD_PREFIX.unpack(prefix)
+        if magic != RECORD_MAGIC:
+            return -1
+        return int(offset) + RECORD_PREFIX.size + header_len + nlayers*LAYER_DTYPE.itemsize
+
+    def scan_offsets(self):
+        """Offsets of all records, from scanning the record prefixes."""
+        file_size = os.path.getsize(self.filename)
+        offsets = []
+        offset = 0
+        while offset < file_size:
+            offsets.append(offset)
+            offset = self.record_end(offset)
+            if offset < 0:
+                raise ValueError(f"truncated or corrupt record in {self.filename} at offset {offsets[-1]}")
+        return numpy.array(offsets, dtype="<u8")
+
+    def memory_map(self):
+        if self._mmap is None:
+            self._mmap = numpy.memmap(self.filename, dtype=numpy.uint8, mode="r")
+        return self._mmap
+
+    def record(self, idx):
+        offsets = self.offsets()
+        header, layers, next_offset = read_record(self.memory_map(), int(offsets[idx]))
+        return header, layers
+
+    def layer_arrays(self, idx):
+        """Columnar layer arrays of the model at idx, as views of the memory map."""
+        return layer_arrays_from_record(*self.record(idx))
+
+    def header(self, idx):
+        return self.record(idx)[0]
+
+    def __len__(self):
+        return len(self.offsets())
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f"model index {idx} out of range for archive of {len(self)}")
+        return model_from_record(*self.record(idx))
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
@@ -0,0 +1,170 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import numpy
+from .velocitymodel import crustone_cell, crustone_cell_center, check_crustone_import_ok, \
+        CRUSTONE_NUM_LAT, CRUSTONE_NUM_LON
+
+#
+# Binary cache of the parsed Crust1.0 model, so that parsing the text
+# model only happens once per installation instead of once per process.
+# The cache is a directory of .npy files that are memory mapped on load,
+# so many worker processes share the same pages via the os page cache.
+#
+
+CACHE_DIR_ENV = "PYREFLECT_CACHE_DIR"
+CACHE_PREFIX = "crustone-"
+PROFILE_ARRAYS = ["top", "bot", "vp", "vs", "rho", "thick"]
+CELL_ARRAYS = ["num_layers", "crust_thick", "elevation"]
+
+def cache_dir():
+    """
+    Directory for pyreflect caches, from the PYREFLECT_CACHE_DIR environment
+    variable or else ~/.cache/pyreflect
+    """
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "pyreflect")
+
+def crustone_data_key():
+    """
+    Hash of the installed crustone package version, file names, sizes and
+    modification times, so the cache is rebuilt when crustone changes.
+    """
+    check_crustone_import_ok()
+    import crustone
+    h = hashlib.sha1()
+    h.update(str(getattr(crustone, "__version__", "")).encode("utf-8"))
+    pkg_dir = os.path.dirname(os.path.abspath(crustone.__file__))
+    for root, dirs, files in os.walk(pkg_dir):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            h.update(f"{os.path.relpath(path, pkg_dir)} {stat.st_size} {stat.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+class CachedCrustOneLayer:
+    def __init__(self, topDepth, botDepth, vp, vs, rho, thick):
+        self.topDepth = topDepth
+        self.botDepth = botDepth
+        self.vp = vp
+        self.vs = vs
+        self.rho = rho
+        self._thick = thick
+    def thick(self):
+        return self._thick
+
+class CachedCrustOneProfile:
+    def __init__(self, layers, crust_thick, elevation):
+        self.layers = layers
+        self._crust_thick = crust_thick
+        self._elevation = elevation
+    def crust_thick(self):
+        return self._crust_thick
+    def elevation(self):
+        return self._elevation
+
+class CachedCrustOne:
+    """
+    Same find_profile lookup as the parsed crustone model, but backed by
+    memory mapped arrays indexed by Crust1.0 cell, see crustone_cell.
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+    def find_profile(self, lat, lon):
+        row, col = crustone_cell(lat, lon)
+        cell = int(row)*CRUSTONE_NUM_LON + int(col)
+        a = self.arrays
+        layers = []
+        for idx in range(int(a["num_layers"][cell])):
+            layers.append(CachedCrustOneLayer(float(a["top"][cell, idx]),
+                                              float(a["bot"][cell, idx]),
+                                              float(a["vp"][cell, idx]),
+                                              float(a["vs"][cell, idx]),
+                                              float(a["rho"][cell, idx]),
+                                              float(a["thick"][cell, idx])))
+        return CachedCrustOneProfile(layers, float(a["crust_thick"][cell]), float(a["elevation"][cell]))
+
+def profiles_as_arrays(c1):
+    """
+    Evaluate every cell of a parsed crustone model at its center into
+    arrays of shape (ncells, max layers), padded with nan.
+    """
+    ncells = CRUSTONE_NUM_LAT*CRUSTONE_NUM_LON
+    profiles = []
+    for cell in range(ncells):
+        lat, lon = crustone_cell_center(cell // CRUSTONE_NUM_LON, cell % CRUSTONE_NUM_LON)
+        profiles.append(c1.find_profile(lat, lon))
+    max_layers = max(len(p.layers) for p in profiles)
+    arrays = {}
+    for key in PROFILE_ARRAYS:
+        arrays[key] = numpy.full((ncells, max_layers), numpy.nan)
+    arrays["num_layers"] = numpy.zeros(ncells, dtype=numpy.int32)
+    arrays["crust_thick"] = numpy.zeros(ncells)
+    arrays["elevation"] = numpy.zeros(ncells)
+    for cell, p in enumerate(profiles):
+        arrays["num_layers"][cell] = len(p.layers)
+        arrays["crust_thick"][cell] = p.crust_thick()
+        arrays["elevation"][cell] = p.elevation()
+        for idx, l in enumerate(p.layers):
+            arrays["top"][cell, idx] = l.topDepth
+            arrays["bot"][cell, idx] = l.botDepth
+            arrays["vp"][cell, idx] = l.vp
+            arrays["vs"][cell, idx] = l.vs
+            arrays["rho"][cell, idx] = l.rho
+            arrays["thick"][cell, idx] = l.thick()
+    return arrays
+
+def write_cache(arrays, directory):
+    """
+    Write the arrays as .npy files into directory. Files are written to a
+    temporary directory first and then renamed, so concurrent processes
+    never see a partial cache.
+    """
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+    try:
+        for key in PROFILE_ARRAYS+CELL_ARRAYS:
+            numpy.save(os.path.join(tmp_dir, f"{key}.npy"), arrays[key])
+        os.rename(tmp_dir, directory)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+def read_cache(directory):
+    arrays = {}
+    for key in PROFILE_ARRAYS+CELL_ARRAYS:
+        arrays[key] = numpy.load(os.path.join(directory, f"{key}.npy"), mmap_mode="r")
+    return arrays
+
+def remove_stale_caches(keep_directory):
+    parent = os.path.dirname(keep_directory)
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if name.startswith(CACHE_PREFIX) and path != keep_directory:
+            shutil.rmtree(path, ignore_errors=True)
+
+def load_cached_crustone(directory=None):
+    """
+    Load Crust1.0 from the binary cache, parsing crustone and creating the
+    cache first if needed. Falls back to the parsed model if the cache
+    directory is not writable.
+    """
+    check_crustone_import_ok()
+    import crustone
+    if directory is None:
+        directory = cache_dir()
+    cache_path = os.path.join(directory, CACHE_PREFIX+crustone_data_key())
+    if not os.path.isdir(cache_path):
+        c1 = crustone.parse()
+        try:
+            write_cache(profiles_as_arrays(c1), cache_path)
+            remove_stale_caches(cache_path)
+        except OSError:
+            return c1
+    return CachedCrustOne(read_cache(cache_path))
@@ -1,6 +1,7 @@
 import sys
 import getopt
 import math
+import numpy
 
 class DistAz:
     """c
@@ -160,6 +161,66 @@ class DistAz:
     def kilometersToDegrees(kilometers):
         return kilometers / 111.19
 
+EARTH_FLATTENING = 1.0/298.257 # same as DistAz, from Bott (pg. 3)
+
+def distaz_terms(lat, lon):
+    """
+    The per point terms a - k of the Bullen formulas used by DistAz, for
+    arrays of points, so one event can be reused against many stations,
+    see distaz_from_terms.
+    """
+    lat = numpy.asarray(lat, dtype=float)
+    lon = numpy.asarray(lon, dtype=float)
+    rad = 2.*math.pi/360.0
+    colat = math.pi/2.0 - numpy.arctan((1.-EARTH_FLATTENING)*(1.-EARTH_FLATTENING)*numpy.tan(lat*rad))
+    lonrad = lon*rad
+    terms = {"lat": lat, "lon": lon}
+    terms["a"] = numpy.sin(colat)*numpy.cos(lonrad)
+    terms["b"] = numpy.sin(colat)*numpy.sin(lonrad)
+    terms["c"] = numpy.cos(colat)
+    terms["d"] = numpy.sin(lonrad)
+    terms["e"] = -numpy.cos(lonrad)
+    terms["g"] = -terms["c"]*terms["e"]
+    terms["h"] = terms["c"]*terms["d"]
+    terms["k"] = -numpy.sin(colat)
+    return terms
+
+def __bullen_az__(p1, p2):
+    # Bullen, Sec 10.2, eqn 7 / eqn 8, p1 is unprimed
+    rhs1 = (p2["a"]-p1["d"])*(p2["a"]-p1["d"])+(p2["b"]-p1["e"])*(p2["b"]-p1["e"])+p2["c"]*p2["c"] - 2.
+    rhs2 = (p2["a"]-p1["g"])*(p2["a"]-p1["g"])+(p2["b"]-p1["h"])*(p2["b"]-p1["h"])+(p2["c"]-p1["k"])*(p2["c"]-p1["k"]) - 2.
+    angle = numpy.arctan2(rhs1, rhs2)
+    angle = numpy.where(angle < 0.0, angle+2*math.pi, angle)
+    angle = angle/(2.*math.pi/360.0)
+    # Make sure 0.0 is always 0.0, not 360.
+    return numpy.where(numpy.abs(angle-360.) < .00001, 0.0, angle)
+
+def distaz_from_terms(terms1, terms2):
+    """
+    Distance, azimuth and back azimuth in degrees, as DistAz, from the terms
+    of distaz_terms for point 1 and point 2, broadcast against each other.
+    """
+    rad = 2.*math.pi/360.0
+    cos_delta = terms1["a"]*terms2["a"] + terms1["b"]*terms2["b"] + terms1["c"]*terms2["c"]
+    # rounding can put coincident or antipodal points just outside acos domain
+    delta = numpy.arccos(numpy.clip(cos_delta, -1.0, 1.0))/rad
+    baz = __bullen_az__(terms1, terms2)
+    az = __bullen_az__(terms2, terms1)
+    same = (terms1["lat"] == terms2["lat"]) & (terms1["lon"] == terms2["lon"])
+    delta = numpy.where(same, 0.0, delta)
+    az = numpy.where(same, 0.0, az)
+    baz = numpy.where(same, 0.0, baz)
+    return delta, az, baz
+
+def distaz_many(lat1, lon1, lat2, lon2):
+    """
+    Vectorized DistAz, lat/lon of point 1 and point 2 are arrays that are
+    broadcast against each other, for example lat1[:, None] and lat2[None, :]
+    for every pair of events and stations. Returns arrays of delta, az
+    and baz in degrees, same as getDelta, getAz and getBaz.
+    """
+    return distaz_from_terms(distaz_terms(lat1, lon1), distaz_terms(lat2, lon2))
+
 #distaz = DistAz(0, 0, 1,1)
 #print "%f  %f  %f" % (distaz.getDelta(), distaz.getAz(), distaz.getBaz())
 
@@ -1,5 +1,6 @@
 import math
 import copy
+import numpy
 
 # Reference radius
 R = 6371.0
@@ -91,3 +92,66 @@ def radius_for_deltav(top_v, top_depth, bot_v, bot_depth, delta_v, R=R):
     r = (( top_radius * top_v - c * top_radius * top_radius) /
     (top_radius*delta_v/ R + top_v - c * top_radius ))
     return r
+
+def eft_arrays(thick, top_depth, vp, vp_gradient, vs, vs_gradient, rho,
+               vp_factor=0.1, vs_factor=0.1, R=R, l_factor=l_factor):
+    """
+    Vectorized version of eft_layer over arrays of layers, which may come
+    from many models as each layer carries its own top_depth.
+
+    Returns (source, thick, vp, vs, rho) for the flattened sub layers, where
+    source is the index of the input layer each sub layer came from, so other
+    columns like qp and qs can be taken with column[source]. Sub layers are
+    in input layer order and gradients in the output are all zero.
+    """
+    thick = numpy.asarray(thick, dtype=float)
+    top_depth = numpy.asarray(top_depth, dtype=float)
+    vp = numpy.asarray(vp, dtype=float)
+    vs = numpy.asarray(vs, dtype=float)
+    rho = numpy.asarray(rho, dtype=float)
+    bot_depth = top_depth + thick
+    top_vp_s = vp
+    bot_vp_s = top_vp_s + numpy.asarray(vp_gradient, dtype=float)*thick
+    top_vp_f = R * top_vp_s / (R-top_depth)
+    bot_vp_f = R * bot_vp_s / (R-bot_depth)
+    top_vs_s = vs
+    bot_vs_s = top_vs_s + numpy.asarray(vs_gradient, dtype=float)*thick
+    top_vs_f = R * top_vs_s / (R-top_depth)
+    bot_vs_f = R * bot_vs_s / (R-bot_depth)
+    nnlyrs = numpy.maximum(numpy.ceil(numpy.abs(bot_vp_f-top_vp_f)/vp_factor),
+                           numpy.ceil(numpy.abs(bot_vs_f-top_vs_f)/vs_factor))
+    zero_thick = thick == 0
+    nnlyrs[zero_thick | (nnlyrs == 0)] = 1
+    nnlyrs = nnlyrs.astype(int)
+
+    source = numpy.repeat(numpy.arange(len(thick)), nnlyrs)
+    starts = numpy.cumsum(nnlyrs) - nnlyrs
+    idx = numpy.arange(len(source)) - numpy.repeat(starts, nnlyrs)
+    nn = nnlyrs[source]
+    delta_vp_f = (bot_vp_f[source] - top_vp_f[source]) / nn
+    delta_vs_f = (bot_vs_f[source] - top_vs_f[source]) / nn
+    top_interp_vp_f = top_vp_f[source] + idx*delta_vp_f
+    bot_interp_vp_f = top_interp_vp_f + delta_vp_f
+    out_vp = (top_interp_vp_f + bot_interp_vp_f)/2.0
+    out_vs = top_vs_f[source] + delta_vs_f/2 + idx*delta_vs_f
+
+    # radius_for_deltav, guarding zero thickness layers that are handled below
+    top_radius = R - top_depth[source]
+    bot_radius = R - bot_depth[source]
+    layer_zero = zero_thick[source]
+    dr = numpy.where(layer_zero, 1.0, bot_radius - top_radius)
+    c = (bot_vp_s[source] - top_vp_s[source]) / dr
+    delta_v = bot_interp_vp_f - top_vp_f[source]
+    r = ((top_radius * top_vp_s[source] - c * top_radius * top_radius) /
+         (top_radius*delta_v / R + top_vp_s[source] - c * top_radius))
+    depth_s = numpy.where(layer_zero, top_depth[source], R - r)
+    depth_f = R * numpy.log(R / (R - depth_s))
+    prev_depth = numpy.empty_like(depth_f)
+    prev_depth[1:] = depth_f[:-1]
+    first = idx == 0
+    prev_depth[first] = R * numpy.log(R / (R - top_depth[source[first]]))
+    out_thick = numpy.where(layer_zero, 0.0, depth_f - prev_depth)
+    out_rho = rho[source] * numpy.power((R-depth_s)/R, l_factor+2)
+    out_vp = numpy.where(layer_zero, top_vp_f[source], out_vp)
+    out_vs = numpy.where(layer_zero, top_vs_f[source], out_vs)
+    return source, out_thick, out_vp, out_vs, out_rho
@@ -1,22 +1,107 @@
 import copy
-import pprint
 import json
 import os
+import io
+import concurrent.futures
+import re
+import hashlib
+import functools
+import numpy
 from .gradient import apply_gradient
 from .earthflatten import eft_layer
 from .momenttensor import rtp_to_ned
 from .velocitymodel import layersFromAk135f, layersFromPrem, VelocityModelLayer, modify_crustone, \
         AK135F, depth_points_from_layers, load_nd_as_depth_points, extend_whole_earth, save_nd, \
-        load_crustone
+        load_crustone, layers_as_arrays, layers_from_arrays, LAYER_COLUMNS, crustone_cell, crustone_cell_center, \
+        CRUSTONE_NUM_LON
 
 
 DIST_SINGLE=1
 DIST_REGULAR=0
 DIST_IRREGULAR=-1
 DEFAULT_MODEL_NAME = "default"
+GER_LAYER_COLUMNS = ["thick", "vp", "vs", "rho", "qp", "qs", "tp1", "tp2", "ts1", "ts2"]
+GER_WRITE_CHUNK = 4096
+
+def __copy_layers__(layers):
+    return [copy.copy(l) for l in layers]
+
+def moment_tensor_as_ned(mt):
+    tensor = mt
+    if 'tensor' in mt:
+        tensor = mt['tensor']
+    if 'm_rr' in tensor:
+        return rtp_to_ned(tensor)
+    elif 'm_nd' in tensor:
+        return tensor
+    else:
+        raise ValueError(f"not sure how to interpret tensor: {tensor}")
+
+@functools.lru_cache(maxsize=None)
+def __shared_without__(shared, name):
+    # few distinct combinations, so models share the frozensets
+    return shared - {name}
+
+@functools.lru_cache(maxsize=None)
+def __shared_with__(shared, name):
+    return shared | {name}
+
+@functools.lru_cache(maxsize=None)
+def __shared_on_clone__(exposed, replaced):
+    return COPY_ON_WRITE - exposed - {replaced}
+
+class CopyOnWrite:
+    """
+    Attribute of EarthModel that a clone shares with the model it was cloned
+    from. The value is stored as _name and is copied the first time it is
+    accessed through the attribute on a model that still shares it, so
+    changes like model.distance["azimuth"] = 30 or model.layers[0].vp = 6.0
+    only affect that model. A value that has been handed out, by access or
+    assignment through the attribute, can still be changed through that
+    reference, so it is not shared, a clone gets its own copy. Methods that
+    only read use _name directly.
+    """
+    def __init__(self, copier, convert=None):
+        self.copier = copier
+        self.convert = convert
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.private = "_"+name
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.private)
+        if self.name in obj._shared:
+            value = self.copier(value)
+            setattr(obj, self.private, value)
+            obj._shared = __shared_without__(obj._shared, self.name)
+        if self.name not in obj._exposed:
+            obj._exposed = __shared_with__(obj._exposed, self.name)
+        return value
+    def __set__(self, obj, value):
+        if self.convert is not None:
+            value = self.convert(value)
+        setattr(obj, self.private, value)
+        if self.name in obj._shared:
+            obj._shared = __shared_without__(obj._shared, self.name)
+        if self.name not in obj._exposed:
+            obj._exposed = __shared_with__(obj._exposed, self.name)
+
+COPY_ON_WRITE = frozenset(["layers", "slowness", "frequency", "distance", "sourceDepths",
+                           "momentTensor", "extra"])
+NOT_SHARED = frozenset()
 
 class EarthModel:
+    layers = CopyOnWrite(__copy_layers__)
+    slowness = CopyOnWrite(dict)
+    frequency = CopyOnWrite(dict)
+    distance = CopyOnWrite(dict)
+    sourceDepths = CopyOnWrite(list)
+    momentTensor = CopyOnWrite(dict, convert=moment_tensor_as_ned)
+    extra = CopyOnWrite(dict)
     def __init__(self):
+        self._shared = NOT_SHARED
+        self._exposed = NOT_SHARED
         self.name = "default"
         self.gradientthick = 10
         self.eftthick = 5
@@ -24,22 +109,22 @@ class EarthModel:
         # layers are:
         # thick vp vs rho qp qs  x x x x
         # I think the last 4 are freq parameters for anisotropy but are not used by the code
-        self.layers = [ VelocityModelLayer(35, 6.5, 3.5, 2.7),
-                        VelocityModelLayer(0, 8.1, 4.67, 3.32)]
-        self.slowness = {
+        self._layers = [ VelocityModelLayer(35, 6.5, 3.5, 2.7),
+                         VelocityModelLayer(0, 8.1, 4.67, 3.32)]
+        self._slowness = {
             "lowcut": 0.005,
             "lowpass": 0.01,
             "highpass": 0.5,
             "highcut": 0.6,
             "controlfac": 1.0
             }
-        self.frequency = {
+        self._frequency = {
             "min": 0.0,
             "max": 1.0,
             "nyquist":1.0,
             "numtimepoints": 1024
         }
-        self.distance = {
+        self._distance = {
             "type": DIST_REGULAR,
             "min": 100,
             "delta": 100,
@@ -47,18 +132,18 @@ class EarthModel:
             "azimuth": 45
         }
         #or
-        self.distance = {
+        self._distance = {
             "type": DIST_IRREGULAR,
             "distanceList": [100, 150, 330],
             "azimuth": 45
         }
         # or
-        self.distance = {
+        self._distance = {
             "type": DIST_SINGLE,
             "distance": 100,
             "azimuth": 45
         }
-        self.sourceDepths = [ 0.001 ]
+        self._sourceDepths = [ 0.001 ]
         self.receiverDepth = 0
         self._momentTensor = {
             "m_nn": 0.0,
@@ -68,23 +153,25 @@ class EarthModel:
             "m_ed": 0.0,
             "m_dd": 0.0
         }
-        self.extra = {
+        self._extra = {
             "elevation": 0.0,
             "reduce_velocity": 8.0,
             "offset": -10.0,
         }
+        # (layers, index) from depth_index
+        self._depth_index = None
     @staticmethod
     def loadPrem(maxdepth ):
         model = EarthModel()
         premLayers = layersFromPrem(maxdepth)
-        model.layers = premLayers
+        model.__set_owned__("layers", premLayers)
         model.name = f"prem to {maxdepth}"
         return model
 
     @staticmethod
     def loadAk135f(maxdepth ):
         model = EarthModel()
-        model.layers = layersFromAk135f(maxdepth)
+        model.__set_owned__("layers", layersFromAk135f(maxdepth))
         model.name = f"ak135f to {maxdepth}"
         return model
 
@@ -100,15 +187,22 @@ class EarthModel:
         with open(filename, "w") as f:
             f.write(self.asJSON())
     @staticmethod
+    def loadFromBinaryFile(filename, index=0):
+        from .binarymodel import load_binary_model
+        return load_binary_model(filename, index=index)
+    def writeToBinaryFile(self, filename):
+        from .binarymodel import write_binary_model
+        write_binary_model(self, filename)
+    @staticmethod
     def loadFromFile(filename):
         with open(filename, "r") as f:
             lines = f.readlines()
             model = EarthModel.parseGER(lines)
             model.name = os.path.basename(filename)
             return model
-    def writeToFile(self, filename):
+    def writeToFile(self, filename, precision='.4f'):
         with open(filename, "w") as f:
-            f.write(self.asGER())
+            self.writeGER(f, precision=precision)
     @staticmethod
     def parseGER(modelLines):
         if isinstance(modelLines, str):
@@ -116,27 +210,9 @@ class EarthModel:
         if type(modelLines) != list:
             raise ValueError(f"input should be list of lines, but found {type(modelLines)}")
         out = EarthModel()
-        out.layers = []
-        i=0
         numLayers = int(modelLines[0].strip())
-        for i in range(1, numLayers+1):
-            line = modelLines[i].split()
-            if len(line) < 6:
-                raise ValueError(f"layer must have at least 5 numbers: {modelLines[i]}")
-            layer = VelocityModelLayer(
-                        float(line[0]),
-                        float(line[1]),
-                        float(line[2]),
-                        float(line[3]),
-                        qp= float(line[4]),
-                        qs= float(line[5]) )
-            if len(line) >= 9:
-                layer.tp1: float(line[6])
-                layer.tp2: float(line[7])
-                layer.ts1: float(line[8])
-                layer.ts2: float(line[9])
-            out.layers.append(layer)
-        i += 1
+        out.__set_owned__("layers", layers_from_arrays(parse_GER_layers(modelLines[1:numLayers+1])))
+        i = numLayers+1
         line = modelLines[i].split()
         out.slowness = {
             "lowcut": float(line[0]),
@@ -175,23 +251,21 @@ class EarthModel:
             }
         else: # disttype < 0
             i += 1
-            line = modelLines[i].split()
+            numDistances = int(modelLines[i].split()[0])
+            distanceList, i = EarthModel.__read_values__(modelLines, i+1, numDistances)
             out.distance = {
                 "type": DIST_IRREGULAR,
-                "distanceList": [float(x) for x in line],
+                "distanceList": distanceList,
                 "azimuth": azimuth
             }
         i += 1
-        line = modelLines[i].split()
-        numSources = int(line[0])
-        i += 1
-        line = modelLines[i].split()
-        out.sourceDepths = [ float(x) for x in line ]
+        numSources = int(modelLines[i].split()[0])
+        out.sourceDepths, i = EarthModel.__read_values__(modelLines, i+1, numSources)
         i += 1
         line = modelLines[i].split()
         out.receiverDepth = float(line[0])
         i += 1
-        if i < len(modelLines):
+        if i < len(modelLines) and len(modelLines[i].split()) >= 6:
             line = modelLines[i].split()
             out.momentTensor = {
                 "m_nn": float(line[0]),
@@ -202,24 +276,59 @@ class EarthModel:
                 "m_dd": float(line[5])
             }
         return out
-    @property
-    def momentTensor(self):
-        return self._momentTensor
-    @momentTensor.setter
-    def momentTensor(self, mt):
-        tensor = mt
-        if 'tensor' in mt:
-            tensor = mt.tensor
-        if 'm_rr' in tensor:
-            self._momentTensor = rtp_to_ned(tensor)
-        elif 'm_nd' in tensor:
-            self._momentTensor = tensor
-        else:
-            raise ValueError(f"not sure how to interpret tensor: {tensor}")
+    @staticmethod
+    def __read_values__(modelLines, i, num):
+        """
+        Read num floats starting at line i, which may wrap onto following lines.
+        Returns the values and the index of the last line read.
+        """
+        values = [float(x) for x in modelLines[i].split()]
+        while len(values) < num:
+            i += 1
+            values += [float(x) for x in modelLines[i].split()]
+        return values, i
+    def peek(self, name):
+        """
+        Value of a copy on write attribute without the copy, or marking it
+        handed out, that accessing it through the attribute does, see
+        CopyOnWrite, for read only use, must not be modified.
+        """
+        return getattr(self, "_"+name)
+    def peek_layers(self):
+        """
+        The layers without the copy that accessing model.layers makes when
+        they are shared with a clone, for read only use, must not be modified.
+        """
+        return self._layers
+    def __set_shared__(self, name, value):
+        """
+        Set the storage of a copy on write attribute to a value that may
+        share objects with another model, so it is copied on first access.
+        """
+        setattr(self, "_"+name, value)
+        self._shared = __shared_with__(self._shared, name)
+        self._exposed = __shared_without__(self._exposed, name)
+    def __set_owned__(self, name, value):
+        """
+        Set the storage of a copy on write attribute to a new value that
+        nothing else refers to, so unlike assignment through the attribute
+        a clone can share it.
+        """
+        convert = getattr(EarthModel, name).convert
+        if convert is not None:
+            value = convert(value)
+        setattr(self, "_"+name, value)
+        self._shared = __shared_without__(self._shared, name)
+        self._exposed = __shared_without__(self._exposed, name)
 
-    def asDict(self):
+    def asDict(self, peek=False):
+        """
+        The model as a dict. With peek, the parameter dicts are from peek,
+        not handed out, for read only use like asJSON.
+        """
+        get = self.peek if peek else functools.partial(getattr, self)
         layers_dict = []
-        for l in self.layers:
+        for l in self._layers:
             layers_dict.append(l.as_dict())
         return {
             "name": self.name,
@@ -227,13 +336,13 @@ class EarthModel:
             "eftthick": self.eftthick,
             "isEFT": self.isEFT,
             "layers": layers_dict,
-            "slowness": self.slowness,
-            "frequency": self.frequency,
-            "distance": self.distance,
-            "sourceDepths": self.sourceDepths,
+            "slowness": get("slowness"),
+            "frequency": get("frequency"),
+            "distance": get("distance"),
+            "sourceDepths": get("sourceDepths"),
             "receiverDepth": self.receiverDepth,
-            "momentTensor": self.momentTensor,
-            "extra": self.extra,
+            "momentTensor": get("momentTensor"),
+            "extra": get("extra"),
         }
     @staticmethod
     def fromDict(data):
@@ -242,10 +351,7 @@ class EarthModel:
         if "gradientthick" in data: model.gradientthick = data["gradientthick"]
         if "eftthick" in data: model.eftthick = data["eftthick"]
         if "layers" in data:
-            model.layers = []
-            for dl in data["layers"]:
-                v = VelocityModelLayer.from_dict(dl)
-                model.layers.append(v)
+            model.__set_owned__("layers", [VelocityModelLayer.from_dict(dl) for dl in data["layers"]])
         if "slowness" in data: model.slowness = data["slowness"]
         if "frequency" in data: model.frequency = data["frequency"]
         if "distance" in data: model.distance = data["distance"]
@@ -255,35 +361,49 @@ class EarthModel:
         if "extra" in data: model.extra = data["extra"]
         return model
     def asJSON(self):
-        return json.dumps(self.asDict(), indent=4)
-    @staticmethod
-    def __format_line_as_GER__(items, precision='.4f'):
-        stringItems = [format(x, precision) for x in items]
-        return " ".join(stringItems)+"\n"
+        return json.dumps(self.asDict(peek=True), indent=4)
     def export_layers_as_nd(self, filename, base_model=AK135F):
-        points = depth_points_from_layers(self.layers)
+        points = depth_points_from_layers(self._layers)
         ak135points = load_nd_as_depth_points(base_model)
-        points = extend_whole_earth(points, ak135points, elevation=self.extra['elevation'])
+        points = extend_whole_earth(points, ak135points, elevation=self._extra['elevation'])
         save_nd(points, filename)
     def asGER(self, precision='.4f'):
-        self.evalGradients()
-        out = f"{len(self.layers)}\n"
-        for l in self.layers:
-            items = [ l.thick, l.vp, l.vs, l.rho, l.qp, l.qs, l.tp1, l.tp2, l.ts1, l.ts2]
-            out += self.__format_line_as_GER__(items, precision=precision)
-        out += f"{self.slowness['lowcut']} {self.slowness['lowpass']} {self.slowness['highpass']} {self.slowness['highcut']} {self.slowness['controlfac']} \n"
-        out += f"{self.frequency['min']} {self.frequency['max']} {self.frequency['nyquist']} {self.frequency['numtimepoints']}\n"
-        if self.distance['type'] > 0:
-            out += f"{self.distance['distance']} {self.distance['azimuth']}\n"
-        elif self.distance['type'] == DIST_REGULAR:
-            out += f"{self.distance['type']} {self.distance['azimuth']}\n"
-            out += f"{self.distance['min']} {self.distance['delta']} {self.distance['num']}\n"
+        out = io.StringIO()
+        self.writeGER(out, precision=precision)
+        return out.getvalue()
+    def writeGER(self, outfile, precision='.4f'):
+        """
+        Write the model in GER format to a file like object, formatting the
+        layers in blocks of GER_WRITE_CHUNK lines.
+        """
+        layers = self._layers
+        outfile.write(f"{len(layers)}\n")
+        for start in range(0, len(layers), GER_WRITE_CHUNK):
+            chunk = layers[start:start+GER_WRITE_CHUNK]
+            columns = [[getattr(l, key) for l in chunk] for key in GER_LAYER_COLUMNS]
+            outfile.write(format_layers_as_GER(columns, precision=precision))
+        outfile.write(self.ger_parameter_lines())
+    def ger_parameter_lines(self):
+        """
+        The part of the GER model after the layers, slowness, frequency,
+        distance, source and receiver depths and moment tensor.
+        """
+        slowness = self._slowness
+        frequency = self._frequency
+        distance = self._distance
+        out = f"{slowness['lowcut']} {slowness['lowpass']} {slowness['highpass']} {slowness['highcut']} {slowness['controlfac']} \n"
+        out += f"{frequency['min']} {frequency['max']} {frequency['nyquist']} {frequency['numtimepoints']}\n"
+        if distance['type'] > 0:
+            out += f"{distance['distance']} {distance['azimuth']}\n"
+        elif distance['type'] == DIST_REGULAR:
+            out += f"{distance['type']} {distance['azimuth']}\n"
+            out += f"{distance['min']} {distance['delta']} {distance['num']}\n"
         else:
-            out += f"{self.distance['type']} {self.distance['azimuth']}\n"
-            out += f"{len(self.distance['distanceList'])}\n"
-            out += f"{' '.join(map(str, self.distance['distanceList']))}\n"
-        out += f"{len(self.sourceDepths)}\n"
-        out += f"{' '.join(map(str, self.sourceDepths))}\n"
+            out += f"{distance['type']} {distance['azimuth']}\n"
+            out += f"{len(distance['distanceList'])}\n"
+            out += f"{' '.join(map(str, distance['distanceList']))}\n"
+        out += f"{len(self._sourceDepths)}\n"
+        out += f"{' '.join(map(str, self._sourceDepths))}\n"
         out += f"{self.receiverDepth}\n"
         if self._momentTensor:
             out += f"{self._momentTensor['m_nn']} {self._momentTensor['m_ne']} {self._momentTensor['m_nd']} {self._momentTensor['m_ee']} {self._momentTensor['m_ed']} {self._momentTensor['m_dd']}\n"
@@ -291,35 +411,73 @@ class EarthModel:
     def clone(self):
         return self.__copy__()
     def __copy__(self):
-        out = EarthModel()
+        """
+        Copy on write clone, the layers and parameter dicts are shared with
+        this model until either model accesses them, see CopyOnWrite. Values
+        this model has already handed out are copied now.
+        """
+        return self.__clone__()
+    def __clone__(self, replaced=None):
+        """
+        Clone that shares or copies each copy on write attribute, except
+        replaced, which is left for the caller to set.
+        """
+        out = EarthModel.__new__(EarthModel)
+        # same attribute order as __init__, so instances share dict keys
+        out._shared = __shared_on_clone__(self._exposed, replaced)
+        out._exposed = NOT_SHARED
         out.name = self.name+" Clone"
         out.gradientthick = self.gradientthick
         out.eftthick = self.eftthick
         out.isEFT = self.isEFT
-        out.layers = [ copy.deepcopy(x) for x in self.layers ]
-        out.slowness = dict(self.slowness)
-        out.frequency = dict(self.frequency)
-        out.distance = dict(self.distance)
-        out.sourceDepths = self.sourceDepths[:]
+        out._layers = self._layers
+        out._slowness = self._slowness
+        out._frequency = self._frequency
+        out._distance = self._distance
+        out._sourceDepths = self._sourceDepths
         out.receiverDepth = self.receiverDepth
-        out.momentTensor = dict(self.momentTensor)
-        out.extra = dict(self.extra)
+        out._momentTensor = self._momentTensor
+        out._extra = self._extra
+        out._depth_index = self._depth_index
+        for name in self._exposed:
+            if name != replaced:
+                setattr(out, "_"+name, getattr(EarthModel, name).copier(getattr(self, "_"+name)))
+        self._shared = self._shared | out._shared
+        return out
+    def __derive__(self, name, value, owned=False):
+        """
+        Clone with the copy on write attribute name set to value, made from
+        this model's value, so may share objects with it unless owned. If this
+        model has handed out its value, a shared value is copied, as changes
+        through that reference would otherwise reach the clone.
+        """
+        out = self.__clone__(replaced=name)
+        if owned:
+            out.__set_owned__(name, value)
+        elif name in self._exposed:
+            out.__set_owned__(name, getattr(EarthModel, name).copier(value))
+        else:
+            out.__set_shared__(name, value)
+            self._shared = __shared_with__(self._shared, name)
         return out
     def evalGradients(self):
-        outLayers = self.layers
+        outLayers = self._layers
         changeMade = True
         while changeMade:
             changeMade = False
             for n in range(len(outLayers)):
                 layer = outLayers[n]
-                if layer.vp_gradient != 0.0 or layer.vs_gradient != 0.0:
+                # interior zero thickness layers, like where crust replaces the
+                # top of the mantle exactly, have no gradient to apply, but a
+                # gradient in the halfspace is still an error from apply_gradient
+                is_halfspace = n == len(outLayers)-1
+                if (layer.thick > 0 or is_halfspace) and (layer.vp_gradient != 0.0 or layer.vs_gradient != 0.0):
                     gradLayers = apply_gradient(outLayers, n, layer.vp_gradient, layer.vs_gradient, self.gradientthick)
                     changeMade = True
                     outLayers = gradLayers
                     break
-        out = self.clone()
-        out.layers = outLayers
-        return out
+        # unchanged layers are shared with this model, not copied
+        return self.__derive__("layers", outLayers)
 
     def crustone(self, lat, lon):
         """
@@ -329,61 +487,152 @@ class EarthModel:
         example in tibet the 410 would be at about 414 km depth.
 
         """
-        model = copy.deepcopy(self)
         c1 = load_crustone()
         c1profile = c1.find_profile(lat, lon)
         elevation = c1profile.elevation()
-        c1layers = modify_crustone(model.layers, lat, lon)
-        model.layers = c1layers
-        model.name = model.name+f" modified for Crust 1.0 at {lat}/{lon}"
-        model.extra["elevation"] = elevation
+        c1layers = modify_crustone(self._layers, lat, lon)
+        model = self.__derive__("layers", c1layers)
+        model.name = self.name+f" modified for Crust 1.0 at {lat}/{lon}"
+        model.__set_owned__("extra", dict(self._extra, elevation=elevation))
         return model
 
+    def crustone_many(self, lats, lons):
+        """
+        Crust1.0 modified models for many points, see crustone. Points are
+        grouped by Crust1.0 cell and each distinct model is built once, from
+        the cell center, and shared by all points that use it, so cells with
+        the same crust also share a model.
+
+        Returns a dict of layer fingerprint to model, and a list of the
+        fingerprint for each point.
+        """
+        lats = numpy.atleast_1d(numpy.asarray(lats, dtype=float))
+        lons = numpy.atleast_1d(numpy.asarray(lons, dtype=float))
+        if lats.shape != lons.shape:
+            raise ValueError(f"lats and lons must be same shape: {lats.shape} {lons.shape}")
+        rows, cols = crustone_cell(lats, lons)
+        cells, point_cell = numpy.unique(rows*CRUSTONE_NUM_LON+cols, return_inverse=True)
+        models = {}
+        cell_fingerprints = []
+        for cell in cells.tolist():
+            lat, lon = crustone_cell_center(cell // CRUSTONE_NUM_LON, cell % CRUSTONE_NUM_LON)
+            model = self.crustone(lat, lon)
+            fingerprint = model.layer_fingerprint()
+            if fingerprint not in models:
+                models[fingerprint] = model
+            cell_fingerprints.append(fingerprint)
+        point_fingerprints = [cell_fingerprints[idx] for idx in point_cell.ravel().tolist()]
+        return models, point_fingerprints
+
+    def layer_fingerprint(self):
+        """
+        Hash of the layers and elevation, the parts of the model that define
+        the earth structure, so models that only differ in other parameters,
+        like distance or source depth, have the same fingerprint.
+        """
+        arrays = layers_as_arrays(self._layers)
+        h = hashlib.sha1()
+        for key in LAYER_COLUMNS:
+            h.update(numpy.ascontiguousarray(arrays[key], dtype="<f8").tobytes())
+        h.update("\n".join(arrays["type"].tolist()).encode("utf-8"))
+        h.update(repr(float(self._extra.get("elevation", 0.0))).encode("utf-8"))
+        return h.hexdigest()
+
     def gradient(self, gradLayerNum, pgrad, sgrad, nlfactor):
-        gradLayers = apply_gradient(self.layers, gradLayerNum, pgrad, sgrad, nlfactor)
-        out = self.clone()
-        out.layers = gradLayers
-        return out
+        gradLayers = apply_gradient(self._layers, gradLayerNum, pgrad, sgrad, nlfactor)
+        return self.__derive__("layers", gradLayers)
     def eft(self, vp_factor=0.05, vs_factor=0.05):
         if (self.isEFT):
             raise ValueError("Model has already been flattened")
         eft_layers = []
         top_depth = 0
-        for l in self.layers:
+        for l in self._layers:
             eft_layers = eft_layers + eft_layer(l, top_depth, vp_factor=vp_factor, vs_factor = vs_factor)
             top_depth += l.thick
-        eft_model = self.clone()
+        eft_model = self.__derive__("layers", eft_layers, owned=True)
         eft_model.name = self.name+" EFT (vp factor)"
         eft_model.isEFT = True
-        eft_model.layers = eft_layers
         eft_model.vp_factor = vp_factor
         eft_model.vs_factor = vs_factor
         return eft_model
     def vp_vs_depth(self):
-        depth = 0
-        vp_list = []
-        vs_list = []
-        depth_list = []
-        prev_layer = None
-        for l in self.layers:
-            if prev_layer is None or prev_layer.vp != layer.vp or prev_layer.vs != layer.vs:
-                depth_list.append(depth)
-                vp_list.append(l.vp)
-                vs_list.append(l.vs)
-            depth += l.thick
-            depth_list.append(depth)
-            vp_list.append(l.vp+l.thick*l.vp_gradient)
-            vs_list.append(l.vs+l.thick*l.vs_gradient)
+        points = depth_points_from_layers(self._layers)
+        vp_list = [p.vp for p in points]
+        vs_list = [p.vs for p in points]
+        depth_list = [p.depth for p in points]
         return vp_list, vs_list, depth_list
+    def depth_index(self):
+        """
+        Columnar layer values plus the cumulative depth to the top of each
+        layer, for vectorized depth queries, see sample. The index is kept
+        and reused until the layers are replaced, unless the layers have
+        been handed out, see CopyOnWrite, as they can then be changed in
+        place. It is shared, so must not be modified.
+        """
+        cached = self._depth_index
+        if cached is not None and cached[0] is self._layers and "layers" not in self._exposed:
+            return cached[1]
+        index = layers_as_arrays(self._layers)
+        index["top"] = numpy.concatenate(([0.0], numpy.cumsum(index["thick"])[:-1]))
+        if "layers" not in self._exposed:
+            self._depth_index = (self._layers, index)
+        return index
+    def layer_number_at(self, depths, index=None):
+        """
+        Index of the layer containing each depth. A depth on a boundary is
+        in the layer below, and the halfspace extends below the last layer top.
+        """
+        if index is None:
+            index = self.depth_index()
+        depths = numpy.asarray(depths, dtype=float)
+        if numpy.any(depths < 0):
+            raise ValueError(f"depths must not be negative, min: {depths.min()}")
+        return numpy.searchsorted(index["top"], depths, side="right")-1
+    def sample(self, depths, index=None):
+        """
+        Values at each depth, with gradients applied, as a dict of arrays
+        depth, vp, vs, rho, qp, qs and layer, the layer number for each depth.
+        index, from depth_index, defaults to the index kept by the model.
+        """
+        if index is None:
+            index = self.depth_index()
+        depths = numpy.asarray(depths, dtype=float)
+        layer_num = self.layer_number_at(depths, index=index)
+        below_top = depths - index["top"][layer_num]
+        return {
+            "depth": depths,
+            "vp": index["vp"][layer_num] + index["vp_gradient"][layer_num]*below_top,
+            "vs": index["vs"][layer_num] + index["vs_gradient"][layer_num]*below_top,
+            "rho": index["rho"][layer_num] + index["rho_gradient"][layer_num]*below_top,
+            "qp": index["qp"][layer_num],
+            "qs": index["qs"][layer_num],
+            "layer": layer_num,
+        }
+    def on_layer_boundary(self, depths, tolerance=1e-6, index=None):
+        """
+        True for each depth within tolerance of a layer boundary, for example
+        to check that source depths are not on a boundary.
+        """
+        if index is None:
+            index = self.depth_index()
+        depths = numpy.asarray(depths, dtype=float)
+        boundaries = numpy.unique(index["top"][1:])
+        if len(boundaries) == 0:
+            return numpy.zeros(depths.shape, dtype=bool)
+        above = numpy.clip(numpy.searchsorted(boundaries, depths)-1, 0, len(boundaries)-1)
+        below = numpy.clip(above+1, 0, len(boundaries)-1)
+        nearest = numpy.minimum(numpy.abs(depths-boundaries[above]), numpy.abs(depths-boundaries[below]))
+        return nearest <= tolerance
     def list_distances(self):
-        return list_distances(self.distance)
+        return list_distances(self._distance)
     def halfspace_depth(self):
         t = 0
-        for l in self.layers:
+        for l in self._layers:
             t += l.thick
         return t
     def __str__(self):
-        return pprint.pformat(self.asDict())
+        import pprint
+        return pprint.pformat(self.asDict(peek=True))
 
 def list_distances(dist_params):
     out = []
@@ -396,3 +645,89 @@ def list_distances(dist_params):
     else:
         out = list(dist_params['distanceList'])
     return out
+
+def parse_GER_layers(layerLines):
+    """
+    Parse the layer lines of a GER model into columnar arrays, see
+    layers_as_arrays. Lines have thick vp vs rho qp qs and optionally
+    tp1 tp2 ts1 ts2, the whole block is parsed in one numpy operation.
+    """
+    if len(layerLines) == 0:
+        return {key: numpy.empty(0) for key in GER_LAYER_COLUMNS}
+    try:
+        values = numpy.loadtxt(layerLines, ndmin=2)
+    except ValueError:
+        # lines with different numbers of columns, pad with defaults line by line
+        default_layer = VelocityModelLayer(0, 0, 0, 0)
+        defaults = [getattr(default_layer, key) for key in GER_LAYER_COLUMNS]
+        rows = []
+        for line in layerLines:
+            items = [float(x) for x in line.split()]
+            if len(items) < 6:
+                raise ValueError(f"layer must have at least 6 numbers: {line}")
+            rows.append(items[:len(defaults)] + defaults[len(items):])
+        values = numpy.array(rows, dtype=float)
+    if values.shape[1] < 6:
+        raise ValueError(f"layer must have at least 6 numbers: {layerLines[0]}")
+    arrays = {}
+    for col, key in enumerate(GER_LAYER_COLUMNS[:values.shape[1]]):
+        arrays[key] = values[:, col]
+    return arrays
+
+def load_many_from_files(filenames, max_workers=None, use_processes=False):
+    """
+    Load many GER model files in parallel with a thread pool, or a process
+    pool if use_processes is true. Returns the models in the same order.
+    """
+    if use_processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    with executor:
+        return list(executor.map(EarthModel.loadFromFile, filenames, chunksize=16))
+
+def write_models_as_GER(models, directories, filename="model.ger", precision='.4f'):
+    """
+    Write each model in GER format into the matching directory, creating
+    directories as needed. Returns the list of file paths.
+    """
+    if len(models) != len(directories):
+        raise ValueError(f"need one directory per model, {len(models)} models but {len(directories)} directories")
+    paths = []
+    for model, directory in zip(models, directories):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        model.writeToFile(path, precision=precision)
+        paths.append(path)
+    return paths
+
+def ger_printf_format(precision):
+    """
+    The printf style format equivalent to the format spec precision, as
+    used by asGER, or None if precision has no exact printf equivalent.
+    """
+    if re.fullmatch(r"[+ ]?#?0?\d*(?:\.\d+)?[eEfFgG]", precision):
+        return "%"+precision
+    return None
+
+def format_layers_as_GER(columns, precision='.4f'):
+    """
+    Format rows of layer values as GER layer lines in one operation, each
+    value as format(x, precision), space separated. Columns are equal length
+    sequences, usually thick vp vs rho qp qs tp1 tp2 ts1 ts2.
+    """
+    num = len(columns[0]) if len(columns) > 0 else 0
+    if num == 0:
+        return ""
+    printf_fmt = ger_printf_format(precision)
+    if printf_fmt is None:
+        # format the values as given, an int and a float differ for specs like ''
+        columns = [c.tolist() if isinstance(c, numpy.ndarray) else c for c in columns]
+        return "".join(" ".join(format(x, precision) for x in row)+"\n" for row in zip(*columns))
+    # f, e and g give the same output for ints and floats
+    columns = [numpy.asarray(c, dtype=float).tolist() for c in columns]
+    line_fmt = " ".join([printf_fmt]*len(columns))+"\n"
+    items = [None]*(num*len(columns))
+    for col_idx, c in enumerate(columns):
+        items[col_idx::len(columns)] = c
+    return (line_fmt*num) % tuple(items)
@@ -0,0 +1,191 @@
+import os
+import math
+import numpy
+from .earthmodel import ger_printf_format, format_layers_as_GER
+from .earthflatten import eft_arrays
+from .velocitymodel import layers_as_arrays, layers_from_arrays, LAYER_COLUMNS
+
+#
+# Monte Carlo ensembles of perturbed models, generated as one block of
+# arrays of shape (num models, num layers), and written out as GER files
+# with the earth flattening and formatting done for all members at once.
+#
+
+PERTURB_PARAMS = ["thick", "vp", "vs", "rho"]
+DIST_NORMAL = "normal"
+DIST_UNIFORM = "uniform"
+VPVS_FIXED = "fixed"
+MIN_THICK = 0.01 # km, perturbed non-zero thickness layers stay at least this thick
+MIN_VELOCITY = 0.01 # km/s, and rho in g/cm3
+
+# Abramowitz and Stegun 7.1.26 rational approximation of erf
+ERF_P = 0.3275911
+ERF_COEFFS = [1.061405429, -1.453152027, 1.421413741, -0.284496736, 0.254829592]
+
+def __erf__(x):
+    """Error function of an array, Abramowitz and Stegun 7.1.26, absolute error below 1.5e-7."""
+    x = numpy.asarray(x, dtype=float)
+    ax = numpy.abs(x)
+    t = 1.0/(1.0 + ERF_P*ax)
+    poly = numpy.zeros_like(t)
+    for coeff in ERF_COEFFS:
+        poly = (poly + coeff)*t
+    return numpy.sign(x)*(1.0 - poly*numpy.exp(-ax*ax))
+
+def layer_correlation(base_model, correlation_length):
+    """
+    Correlation matrix between layers, exp(-dz/correlation_length) where dz
+    is the distance between layer center depths.
+    """
+    thick = numpy.array([l.thick for l in base_model.peek_layers()], dtype=float)
+    center = numpy.cumsum(thick) - thick/2
+    return numpy.exp(-numpy.abs(center[:, None]-center[None, :])/correlation_length)
+
+def generate_ensemble(base_model, num, perturbations, correlation_length=None, vpvs=None, seed=None):
+    """
+    Perturb the layers of base_model num times.
+
+    perturbations maps each of thick, vp, vs, rho to be perturbed to a dict
+    with "dist", either normal, where "scale" is the standard deviation, or
+    uniform, where "scale" is the half width, and optionally "relative", if
+    true the scale is a fraction of the base value.
+
+    correlation_length, in km, correlates the perturbation of each parameter
+    between layers, see layer_correlation, None perturbs layers independently.
+
+    vpvs is None for no constraint, "fixed" to keep the vp/vs ratio of the
+    base model, ignoring any vs perturbation, or a (min, max) tuple to clip
+    the ratio by adjusting vs. Layers with zero vs, like water, stay at zero
+    as does the thickness of zero thickness layers, like the halfspace.
+
+    Returns a dict of arrays of shape (num, num layers) for each of
+    LAYER_COLUMNS plus type, shape (num layers).
+    """
+    rng = numpy.random.default_rng(seed)
+    base = layers_as_arrays(base_model.peek_layers())
+    nlayers = len(base["thick"])
+    chol = None
+    if correlation_length is not None and correlation_length > 0:
+        corr = layer_correlation(base_model, correlation_length)
+        chol = numpy.linalg.cholesky(corr + 1e-10*numpy.eye(nlayers))
+    ensemble = {}
+    for key in LAYER_COLUMNS:
+        ensemble[key] = numpy.repeat(base[key][None, :], num, axis=0)
+    ensemble["type"] = base["type"]
+    for key, spec in perturbations.items():
+        if key not in PERTURB_PARAMS:
+            raise ValueError(f"can only perturb {PERTURB_PARAMS}, not {key}")
+        dist = spec.get("dist", DIST_NORMAL)
+        if dist == DIST_UNIFORM and chol is None:
+            noise = rng.uniform(-1.0, 1.0, (num, nlayers))
+        else:
+            noise = rng.standard_normal((num, nlayers))
+            if chol is not None:
+                noise = noise @ chol.T
+            if dist == DIST_UNIFORM:
+                # gaussian copula, correlated normal to correlated uniform in -1 to 1
+                noise = __erf__(noise/math.sqrt(2.0))
+            elif dist != DIST_NORMAL:
+                raise ValueError(f"unknown distribution {dist} for {key}, use {DIST_NORMAL} or {DIST_UNIFORM}")
+        scale = spec["scale"]
+        if spec.get("relative", False):
+            scale = scale*base[key][None, :]
+        ensemble[key] = ensemble[key] + noise*scale
+    thick = ensemble["thick"]
+    thick[:, base["thick"] == 0] = 0.0
+    thick[:, base["thick"] > 0] = numpy.maximum(thick[:, base["thick"] > 0], MIN_THICK)
+    ensemble["vp"] = numpy.maximum(ensemble["vp"], MIN_VELOCITY)
+    ensemble["rho"] = numpy.maximum(ensemble["rho"], MIN_VELOCITY)
+    has_vs = base["vs"] > 0
+    if vpvs == VPVS_FIXED:
+        ensemble["vs"][:, has_vs] = ensemble["vp"][:, has_vs] * (base["vs"][has_vs] / base["vp"][has_vs])
+    elif vpvs is not None:
+        min_ratio, max_ratio = vpvs
+        ensemble["vs"] = numpy.clip(ensemble["vs"], ensemble["vp"]/max_ratio, ensemble["vp"]/min_ratio)
+    ensemble["vs"][:, has_vs] = numpy.maximum(ensemble["vs"][:, has_vs], MIN_VELOCITY)
+    ensemble["vs"][:, ~has_vs] = 0.0
+    return ensemble
+
+def ensemble_size(ensemble):
+    return ensemble["thick"].shape[0]
+
+def ensemble_models(base_model, ensemble):
+    """The ensemble as a list of EarthModel, each a clone of base_model with perturbed layers."""
+    models = []
+    for idx in range(ensemble_size(ensemble)):
+        row = {key: ensemble[key][idx] for key in LAYER_COLUMNS}
+        row["type"] = ensemble["type"]
+        model = base_model.__derive__("layers", layers_from_arrays(row), owned=True)
+        model.name = f"{base_model.name} ensemble {idx}"
+        models.append(model)
+    return models
+
+def ensemble_as_GER(base_model, ensemble, eft=True, vp_factor=0.05, vs_factor=0.05, precision='.4f'):
+    """
+    GER text for every member of the ensemble, earth flattened if eft is
+    true, same as model.eft(vp_factor, vs_factor).asGER() for each of the
+    ensemble_models, but flattened and formatted for all members at once.
+    """
+    num = ensemble_size(ensemble)
+    nlayers = ensemble["thick"].shape[1]
+    if eft:
+        if base_model.isEFT:
+            raise ValueError("Model has already been flattened")
+        thick = ensemble["thick"]
+        top_depth = numpy.cumsum(thick, axis=1) - thick
+        source, out_thick, out_vp, out_vs, out_rho = eft_arrays(
+            thick.ravel(), top_depth.ravel(),
+            ensemble["vp"].ravel(), ensemble["vp_gradient"].ravel(),
+            ensemble["vs"].ravel(), ensemble["vs_gradient"].ravel(),
+            ensemble["rho"].ravel(), vp_factor=vp_factor, vs_factor=vs_factor)
+    else:
+        source = numpy.arange(num*nlayers)
+        out_thick, out_vp, out_vs, out_rho = [ensemble[key].ravel() for key in ["thick", "vp", "vs", "rho"]]
+    member = source // nlayers
+    layer_num = source % nlayers
+    counts = numpy.bincount(member, minlength=num)
+    ends = numpy.cumsum(counts)
+
+    # qp, qs and the tp/ts columns are not perturbed, so format once per base layer
+    base = layers_as_arrays(base_model.peek_layers())
+    suffixes = numpy.array(format_layers_as_GER([base[key] for key in LAYER_COLUMNS[7:]],
+                                                precision=precision).splitlines(), dtype=object)
+    printf_fmt = ger_printf_format(precision)
+    if printf_fmt is None:
+        values = format_layers_as_GER([out_thick, out_vp, out_vs, out_rho], precision=precision).splitlines()
+        row_fmt = "%s %s\n"
+        items = numpy.empty((len(source), 2), dtype=object)
+        items[:, 0] = values
+        items[:, 1] = suffixes[layer_num]
+    else:
+        row_fmt = " ".join([printf_fmt]*4)+" %s\n"
+        items = numpy.empty((len(source), 5), dtype=object)
+        for col_idx, values in enumerate([out_thick, out_vp, out_vs, out_rho]):
+            items[:, col_idx] = values.tolist()
+        items[:, 4] = suffixes[layer_num]
+    parameter_lines = base_model.ger_parameter_lines()
+    out = []
+    start = 0
+    for count, end in zip(counts.tolist(), ends.tolist()):
+        layer_text = (row_fmt*count) % tuple(items[start:end].ravel().tolist())
+        out.append(f"{count}\n{layer_text}{parameter_lines}")
+        start = end
+    return out
+
+def write_ensemble(base_model, ensemble, directory, filename="model_{idx:06d}.ger", eft=True,
+                   vp_factor=0.05, vs_factor=0.05, precision='.4f'):
+    """
+    Write each member of the ensemble as a GER file in directory, filename
+    is formatted with the member index and may contain subdirectories,
+    for example "run_{idx}/model_eft.ger". Returns the list of file paths.
+    """
+    paths = []
+    for idx, text in enumerate(ensemble_as_GER(base_model, ensemble, eft=eft, vp_factor=vp_factor,
+                                               vs_factor=vs_factor, precision=precision)):
+        path = os.path.join(directory, filename.format(idx=idx))
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
@@ -0,0 +1,162 @@
+import math
+import numpy
+from .momenttensor import moment_scale_factor, mechanism_weights, rotate_ned_horizontal, as_component_array
+from .specfile import MECH_NAMES, AMP_STYLE_VEL, SOURCE_STYLE_STEP, DEF_REDUCE_VEL, DEF_OFFSET, \
+        source_spectrum_factors, time_domain_scale
+
+#
+# Finite fault synthetics as a sum of point sources. Each subfault has a
+# depth, distance and azimuth to the station, a moment tensor and a rupture
+# delay. Its spectrum is the six mechanism Green's functions from an mspec
+# file, at the nearest or interpolated distance and depth, weighted by the
+# moment tensor rotated to the azimuth the Green's functions were computed
+# for, and shifted by the delay. Subfaults are summed in the frequency
+# domain, in chunks of array operations, and each component needs only
+# one inverse FFT.
+#
+
+INTERP_NEAREST = "nearest"
+INTERP_LINEAR = "linear"
+SUBFAULT_CHUNK = 64
+GREEN_COMPONENTS = ["z", "r", "t"]
+
+def green_spectra(results):
+    """
+    Raw spectra of results from load_specfile as one array of shape
+    (num ranges, num depths, 6, 3, nfpts), mechanisms in MECH_NAMES order
+    and z, r, t components, along with the ranges, depths and azimuth.
+    """
+    inputs = results['inputs']
+    if inputs['numsources'] != len(MECH_NAMES):
+        raise ValueError(f"need the {len(MECH_NAMES)} mechanism Green's functions, but numsources is {inputs['numsources']}")
+    spectra = numpy.array([[ts['raw']['u0'], ts['raw']['w0'], ts['raw']['tn']] for ts in results['timeseries']])
+    return {
+        "frequency": inputs['frequency'],
+        "ranges": numpy.array(inputs['ranges'], dtype=float),
+        "depths": numpy.array(inputs['depths'], dtype=float),
+        "station_azimuth": inputs['station_azimuth'],
+        "spectra": spectra.reshape((inputs['numranges'], inputs['numdepths'], len(MECH_NAMES),
+                                    len(GREEN_COMPONENTS), -1)),
+    }
+
+def __grid_weights__(grid, values, interpolation):
+    """
+    Grid indices and weights, shape (N, 2) for linear, (N, 1) for nearest,
+    for values clipped to the grid, which need not be sorted.
+    """
+    order = numpy.argsort(grid)
+    sorted_grid = grid[order]
+    values = numpy.clip(values, sorted_grid[0], sorted_grid[-1])
+    if interpolation == INTERP_NEAREST:
+        upper = numpy.minimum(numpy.searchsorted(sorted_grid, values), len(grid)-1)
+        lower = numpy.maximum(upper-1, 0)
+        idx = numpy.where(sorted_grid[upper]-values < values-sorted_grid[lower], upper, lower)
+        return order[idx].reshape((-1, 1)), numpy.ones((len(values), 1))
+    elif interpolation == INTERP_LINEAR:
+        lower = numpy.clip(numpy.searchsorted(sorted_grid, values, side="right")-1, 0, len(grid)-1)
+        upper = numpy.minimum(lower+1, len(grid)-1)
+        span = sorted_grid[upper]-sorted_grid[lower]
+        weight = numpy.zeros(len(values))
+        numpy.divide(values-sorted_grid[lower], span, out=weight, where=span > 0)
+        return order[numpy.column_stack((lower, upper))], numpy.column_stack((1-weight, weight))
+    raise ValueError(f"unknown interpolation: {interpolation}")
+
+def mean_azimuth(azimuths):
+    """Circular mean of azimuths in degrees."""
+    az_rad = numpy.radians(numpy.asarray(azimuths, dtype=float))
+    return math.degrees(math.atan2(numpy.sum(numpy.sin(az_rad)), numpy.sum(numpy.cos(az_rad))))
+
+def subfault_table(depth, distance, azimuth, tensor, delay=0.0):
+    """
+    Subfault table as a dict of arrays, one entry per subfault, depth (km),
+    distance (km) and azimuth (degrees) from subfault to station, NED moment
+    tensor (newton meters) in any form as_component_array accepts and
+    rupture delay (seconds).
+    """
+    tensor = as_component_array(tensor)
+    num = len(tensor)
+    return {
+        "depth": numpy.broadcast_to(numpy.asarray(depth, dtype=float), (num,)),
+        "distance": numpy.broadcast_to(numpy.asarray(distance, dtype=float), (num,)),
+        "azimuth": numpy.broadcast_to(numpy.asarray(azimuth, dtype=float), (num,)),
+        "tensor": tensor,
+        "delay": numpy.broadcast_to(numpy.asarray(delay, dtype=float), (num,)),
+    }
+
+def superpose_spectra(greens, subfaults, interpolation=INTERP_LINEAR, reference_azimuth=None,
+                      chunk_size=SUBFAULT_CHUNK):
+    """
+    Sum of the spectra of all subfaults, shape (3, nfpts) for z, r and t,
+    r and t relative to reference_azimuth, default the mean subfault
+    azimuth. greens is from green_spectra and subfaults from
+    subfault_table. Spectra are raw, as in load_specfile, and scaled by
+    moment_scale_factor, so they can be converted to the time domain like
+    a single point source.
+    """
+    spectra = greens["spectra"]
+    freq = greens["frequency"]
+    ifmin = round(freq['min'] / freq['delta'])
+    ifmax = ifmin+freq['nffpts']-1
+    omega = numpy.arange(ifmin, ifmax+1)*freq['delta']*2*math.pi
+    azimuth = numpy.asarray(subfaults["azimuth"], dtype=float)
+    if reference_azimuth is None:
+        reference_azimuth = mean_azimuth(azimuth)
+    range_idx, range_w = __grid_weights__(greens["ranges"], numpy.asarray(subfaults["distance"], dtype=float), interpolation)
+    depth_idx, depth_w = __grid_weights__(greens["depths"], numpy.asarray(subfaults["depth"], dtype=float), interpolation)
+    # every combination of range and depth neighbor
+    node_range = numpy.repeat(range_idx, depth_idx.shape[1], axis=1)
+    node_depth = numpy.tile(depth_idx, (1, range_idx.shape[1]))
+    node_w = numpy.repeat(range_w, depth_w.shape[1], axis=1) * numpy.tile(depth_w, (1, range_w.shape[1]))
+    # tensor in the frame of the Green's functions, scaled to their units
+    tensors = rotate_ned_horizontal(subfaults["tensor"], azimuth-greens["station_azimuth"])
+    mech_w = mechanism_weights(moment_scale_factor(tensors))
+    horiz_angle = numpy.radians(azimuth-reference_azimuth)
+    delay = numpy.asarray(subfaults["delay"], dtype=float)
+    out = numpy.zeros((len(GREEN_COMPONENTS), spectra.shape[-1]), dtype=complex)
+    for start in range(0, len(azimuth), chunk_size):
+        sl = slice(start, start+chunk_size)
+        g = spectra[node_range[sl], node_depth[sl], :, :, ifmin:ifmax+1]
+        h = numpy.einsum("sk,sm,skmcf->scf", node_w[sl], mech_w[sl], g, optimize=True)
+        # r, t of each subfault to r, t of the reference azimuth
+        cos_b = numpy.cos(horiz_angle[sl]).reshape((-1, 1))
+        sin_b = numpy.sin(horiz_angle[sl]).reshape((-1, 1))
+        r = cos_b*h[:, 1] - sin_b*h[:, 2]
+        h[:, 2] = sin_b*h[:, 1] + cos_b*h[:, 2]
+        h[:, 1] = r
+        shift = numpy.exp(-1j*numpy.outer(delay[sl], omega))
+        out[:, ifmin:ifmax+1] += numpy.einsum("scf,sf->cf", h, shift)
+    return out
+
+def superpose(results, subfaults, interpolation=INTERP_LINEAR, reference_azimuth=None,
+              reduceVel=DEF_REDUCE_VEL, offset=DEF_OFFSET, ampStyle=AMP_STYLE_VEL,
+              sourceStyle=SOURCE_STYLE_STEP, reduce_distance=None, chunk_size=SUBFAULT_CHUNK):
+    """
+    Finite fault synthetic at one station, like a timeseries from
+    to_time_domain with z, r and t, for results from load_specfile or
+    green_spectra and subfaults from subfault_table. Time is reduced by
+    reduce_distance, default the nearest subfault distance, and delays are
+    relative to that time.
+    """
+    greens = results if "spectra" in results else green_spectra(results)
+    if reference_azimuth is None:
+        reference_azimuth = mean_azimuth(subfaults["azimuth"])
+    spectra = superpose_spectra(greens, subfaults, interpolation=interpolation,
+                                reference_azimuth=reference_azimuth, chunk_size=chunk_size)
+    freq = greens["frequency"]
+    dt = 1. / ( 2 * freq['nyquist'] )
+    nft = 2 * ( freq['nfpts'] - 1 )
+    if reduce_distance is None:
+        reduce_distance = float(numpy.min(subfaults["distance"]))
+    timeReduce = reduce_distance / reduceVel + offset
+    reduce_phase = numpy.exp(1j*numpy.arange(freq['nfpts'])*timeReduce*2*math.pi*freq['delta'])
+    ws = source_spectrum_factors(freq, ampStyle, sourceStyle) * time_domain_scale(dt) * reduce_phase
+    out = {
+        "timeReduce": timeReduce,
+        "distance": reduce_distance,
+        "azimuth": reference_azimuth,
+        "mech": "finite",
+    }
+    time_series = numpy.fft.irfft(spectra*ws, nft)
+    for idx, comp in enumerate(GREEN_COMPONENTS):
+        out[comp] = time_series[idx]
+    return out
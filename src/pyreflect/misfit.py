@@ -0,0 +1,193 @@
+import numpy
+
+#
+# Waveform misfit between many candidate synthetics, for example one per
+# earth model or mechanism, and observed data, all on the reduced time axis
+# of to_time_domain, starting at timeReduce after the origin with sample
+# spacing 1/(2*nyquist). Synthetics are a block of shape
+# (ncandidates, nstations, 3, npts), components z, r, t, and the observed
+# data a block of shape (nstations, 3, npts) on the same axis, so each
+# measure is a few array operations over a chunk of candidates, with the
+# chunk size set by a memory budget.
+#
+
+DEFAULT_MEMORY_BUDGET = 256*1024*1024 # bytes
+SYNTHETIC_COMPONENTS = ["z", "r", "t"]
+MEASURE_L2 = "l2"
+MEASURE_CC = "cc"
+
+def reduced_time_axis(results):
+    """
+    Sample spacing and, per timeseries, the time after the origin of the
+    first sample, for results from to_time_domain.
+    """
+    dt = 1. / ( 2 * results['inputs']['frequency']['nyquist'] )
+    return dt, numpy.array([ts['timeReduce'] for ts in results['timeseries']])
+
+def synthetic_block(candidates, components=SYNTHETIC_COMPONENTS):
+    """
+    Stack results from to_time_domain, one per candidate and each with one
+    timeseries per station in the same order, into an array of shape
+    (ncandidates, nstations, 3, npts). Returns the block, dt and the
+    timeReduce of each station, from the first candidate.
+    """
+    candidates = list(candidates)
+    dt, time_reduce = reduced_time_axis(candidates[0])
+    nstations = len(candidates[0]['timeseries'])
+    npts = len(candidates[0]['timeseries'][0][components[0]])
+    block = numpy.zeros((len(candidates), nstations, len(components), npts))
+    for c_idx, results in enumerate(candidates):
+        for s_idx, ts in enumerate(results['timeseries']):
+            for comp_idx, comp in enumerate(components):
+                block[c_idx, s_idx, comp_idx] = ts[comp]
+    return block, dt, time_reduce
+
+def align_to_reduced_time(data, start, delta, time_reduce, dt, npts):
+    """
+    Resample one trace, first sample at start seconds after the origin and
+    sample spacing delta, onto the reduced time axis of a station, linear
+    interpolation and zero outside the trace.
+    """
+    data = numpy.asarray(data, dtype=float)
+    trace_times = start + numpy.arange(len(data))*delta
+    return numpy.interp(time_reduce + numpy.arange(npts)*dt, trace_times, data, left=0.0, right=0.0)
+
+def observed_block(stream, origin_time, station_codes, time_reduce, dt, npts, components="ZRT"):
+    """
+    Observed data from an obspy Stream as an array of shape
+    (nstations, 3, npts) aligned to the synthetic reduced time axis, and a
+    boolean array of shape (nstations, 3), false where the stream has no
+    trace for the station and component. origin_time is a UTCDateTime,
+    station_codes are matched against the station of each trace.
+    """
+    block = numpy.zeros((len(station_codes), len(components), npts))
+    present = numpy.zeros((len(station_codes), len(components)), dtype=bool)
+    for s_idx, code in enumerate(station_codes):
+        for comp_idx, comp in enumerate(components):
+            traces = stream.select(station=code, component=comp)
+            if len(traces) == 0:
+                continue
+            tr = traces[0]
+            block[s_idx, comp_idx] = align_to_reduced_time(tr.data, tr.stats.starttime - origin_time,
+                                                           tr.stats.delta, time_reduce[s_idx], dt, npts)
+            present[s_idx, comp_idx] = True
+    return block, present
+
+def window_weights(time_reduce, dt, npts, windows):
+    """
+    Weight of each sample, shape (nstations, npts), 1 inside and 0 outside
+    the window of each station, windows of shape (nstations, 2) with start
+    and end in seconds after the origin.
+    """
+    windows = numpy.asarray(windows, dtype=float).reshape((-1, 2))
+    times = numpy.asarray(time_reduce, dtype=float).reshape((-1, 1)) + numpy.arange(npts)*dt
+    return ((times >= windows[:, :1]) & (times <= windows[:, 1:])).astype(float)
+
+def __lag_indices__(nfft, max_lag):
+    """Circular correlation indices for lags -max_lag to max_lag samples."""
+    lags = numpy.arange(-max_lag, max_lag+1)
+    return lags, lags % nfft
+
+def candidate_chunk_size(nstations, npts, memory_budget=DEFAULT_MEMORY_BUDGET, components=3):
+    """Number of candidates per chunk so the correlation arrays fit in memory_budget bytes."""
+    nfft = 2*npts
+    # windowed copy, spectra, correlation and a few temporaries per trace
+    per_candidate = nstations*components*(8*npts + 16*(nfft//2+1) + 8*nfft)*2
+    return max(1, int(memory_budget // per_candidate))
+
+def misfit_block(synthetics, observed, dt, present=None, weights=None, max_lag=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Misfit of every candidate, station and component. synthetics is
+    (ncandidates, nstations, 3, npts), or (nstations, 3, npts) for one
+    candidate, and may be a memory map, observed is (nstations, 3, npts),
+    present marks the observed traces to use and weights, from
+    window_weights, of shape (nstations, npts), selects the samples.
+
+    Returns a dict of arrays of shape (ncandidates, nstations, 3):
+    "l2", the integral of the squared difference, "cc", the largest
+    normalized cross correlation within max_lag seconds, default any lag,
+    "lag", the time shift of that correlation, positive when the synthetic
+    is late, and "amplitude_ratio", synthetic over observed rms amplitude,
+    all nan where the observed trace is missing.
+    """
+    if not isinstance(synthetics, numpy.ndarray):
+        synthetics = numpy.asarray(synthetics)
+    if synthetics.ndim == 3:
+        synthetics = synthetics.reshape((1,) + synthetics.shape)
+    ncand, nstations, ncomp, npts = synthetics.shape
+    observed = numpy.asarray(observed, dtype=float)
+    if weights is None:
+        weights = numpy.ones((nstations, npts))
+    weights = numpy.asarray(weights, dtype=float).reshape((nstations, 1, npts))
+    if present is None:
+        present = numpy.ones((nstations, ncomp), dtype=bool)
+    obs = observed*weights
+    obs_energy = numpy.sum(obs*obs, axis=-1)
+    nfft = 2*npts
+    max_lag_samples = npts-1 if max_lag is None else min(npts-1, int(round(max_lag/dt)))
+    lags, lag_idx = __lag_indices__(nfft, max_lag_samples)
+    obs_spec = numpy.conj(numpy.fft.rfft(obs, nfft))
+    out = {key: numpy.full((ncand, nstations, ncomp), numpy.nan) for key in ["l2", "cc", "lag", "amplitude_ratio"]}
+    missing = ~present
+    chunk = candidate_chunk_size(nstations, npts, memory_budget, ncomp)
+    for start in range(0, ncand, chunk):
+        sl = slice(start, start+chunk)
+        syn = numpy.asarray(synthetics[sl], dtype=float)*weights
+        diff = syn-obs
+        out["l2"][sl] = numpy.sum(diff*diff, axis=-1)*dt
+        syn_energy = numpy.sum(syn*syn, axis=-1)
+        del diff
+        corr = numpy.fft.irfft(numpy.fft.rfft(syn, nfft)*obs_spec, nfft)[..., lag_idx]
+        norm = numpy.sqrt(syn_energy*obs_energy)
+        best = numpy.argmax(corr, axis=-1)
+        best_corr = numpy.take_along_axis(corr, best[..., numpy.newaxis], axis=-1)[..., 0]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            out["cc"][sl] = numpy.where(norm > 0, best_corr/norm, 0.0)
+            out["amplitude_ratio"][sl] = numpy.sqrt(syn_energy/obs_energy)
+        out["lag"][sl] = lags[best]*dt
+        for key in out:
+            out[key][sl][:, missing] = numpy.nan
+    return out
+
+def candidate_scores(misfits, measure=MEASURE_L2, station_weights=None):
+    """
+    One score per candidate from misfit_block, the total l2 or the mean cc
+    over stations and components, ignoring missing traces.
+    """
+    values = misfits[measure]
+    if station_weights is not None:
+        values = values*numpy.asarray(station_weights, dtype=float).reshape((1, -1, 1))
+    if measure == MEASURE_L2:
+        return numpy.nansum(values, axis=(1, 2))
+    elif measure == MEASURE_CC:
+        return numpy.nanmean(values, axis=(1, 2))
+    raise ValueError(f"unknown measure: {measure}")
+
+def top_k(scores, k, largest=False):
+    """Indices of the k best scores, best first, smallest unless largest is true."""
+    scores = numpy.asarray(scores, dtype=float)
+    k = min(k, len(scores))
+    if k <= 0:
+        return numpy.empty(0, dtype=int)
+    keyed = -scores if largest else scores
+    keyed = numpy.where(numpy.isnan(keyed), numpy.inf, keyed)
+    best = numpy.argpartition(keyed, k-1)[:k]
+    return best[numpy.argsort(keyed[best], kind="stable")]
+
+def rank_candidates(synthetics, observed, dt, k=10, measure=MEASURE_L2, present=None, weights=None,
+                    max_lag=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Misfits of all candidates, see misfit_block, and the best k by the
+    total l2 or mean cc. Returns a dict with "index" and "score" of the best
+    candidates, best first, "scores" for all and "misfits".
+    """
+    misfits = misfit_block(synthetics, observed, dt, present=present, weights=weights,
+                           max_lag=max_lag, memory_budget=memory_budget)
+    scores = candidate_scores(misfits, measure)
+    best = top_k(scores, k, largest=(measure == MEASURE_CC))
+    return {
+        "index": best,
+        "score": scores[best],
+        "scores": scores,
+        "misfits": misfits,
+    }
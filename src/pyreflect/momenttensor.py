@@ -1,9 +1,26 @@
-import math
+import numpy
 
 dyne_cm_per_newton_meter = 1e7 # in dyne cm
 randall_unit_scale = 1e20 # in cm per dyne cm
 cm_per_m = 100
 
+#
+# Component order for moment tensors as arrays of shape (N, 6), one row per
+# tensor. NED is the order of the moment tensor line in the GER model file
+# and of EarthModel.momentTensor, RTP is the order of obspy.imaging.beachball,
+# USGS and Global CMT.
+#
+NED_COMPONENTS = ["m_nn", "m_ne", "m_nd", "m_ee", "m_ed", "m_dd"]
+RTP_COMPONENTS = ["m_rr", "m_tt", "m_pp", "m_rt", "m_rp", "m_tp"]
+NED_DTYPE = numpy.dtype([(c, "<f8") for c in NED_COMPONENTS])
+RTP_DTYPE = numpy.dtype([(c, "<f8") for c in RTP_COMPONENTS])
+
+# column of the other order for each component, and sign, r is up, t south
+RTP_TO_NED_INDEX = [1, 5, 3, 2, 4, 0]
+RTP_TO_NED_SIGN = numpy.array([1.0, -1.0, 1.0, 1.0, -1.0, 1.0])
+NED_TO_RTP_INDEX = [5, 0, 3, 2, 4, 1]
+NED_TO_RTP_SIGN = numpy.array([1.0, 1.0, 1.0, 1.0, -1.0, -1.0])
+
 
 def moment_scale_factor(scalar_moment_N_m):
     """
@@ -27,6 +44,8 @@ c     of 10**-15
 
 Goal is to return scale factor to take moment and seismogram to m/s amp units
     """
+    if isinstance(scalar_moment_N_m, (list, tuple)):
+        scalar_moment_N_m = numpy.asarray(scalar_moment_N_m, dtype=float)
     scale_fac = scalar_moment_N_m * dyne_cm_per_newton_meter / randall_unit_scale / cm_per_m
     return scale_fac
 
@@ -35,8 +54,12 @@ def mw_to_N_m(Mw):
     Mw to Mo conversion from Lay and Wallace p. 384, I assumed that Mo is in
     newton meters hence multiply by 10^7 to change to dyne cm
     (1 Newton = 10^5 dynes and 1 m = 10^2 cm)
+
+    Mw may be a number or an array of magnitudes.
     """
-    scalar_moment_N_m = math.pow(10,(Mw+10.73)*1.5-7.0)
+    if isinstance(Mw, (list, tuple)):
+        Mw = numpy.asarray(Mw, dtype=float)
+    scalar_moment_N_m = 10.0**((Mw+10.73)*1.5-7.0)
     return scalar_moment_N_m
 
 def mw_scale_factor(Mw):
@@ -77,7 +100,7 @@ def ned_to_rtp(ned_momenttensor):
     USGS, Obspy, Glocal CMT all use rtp
     Kennett and Randall's reflectivity use NED
     """
-    mt = rtp_momenttensor
+    mt = ned_momenttensor
     return {
         "m_rr": mt["m_dd"],
         "m_tt": mt["m_nn"],
@@ -116,7 +139,240 @@ def to_beachballarray(momenttensor):
     """
     mt = momenttensor
     if "tensor" in mt:
-        mt = mt.tensor
+        mt = mt["tensor"]
     if "m_nn" in mt:
         mt = ned_to_rtp(mt)
-    return [mt.m_rr, mt.m_tt, mt.m_pp, mt.m_rt, mt.m_rp, mt.m_tp]
+    return [mt[c] for c in RTP_COMPONENTS]
+
+def as_component_array(tensors, components=NED_COMPONENTS):
+    """
+    Moment tensors as a float array of shape (N, 6) in the order of
+    components. tensors may be a plain array already in that order, a
+    structured array with a field per component, or a list of dicts, like
+    EarthModel.momentTensor, in NED or RTP, converted as needed.
+    """
+    if isinstance(tensors, numpy.ndarray) and tensors.dtype.names is not None:
+        if set(components) <= set(tensors.dtype.names):
+            return numpy.column_stack([tensors[c] for c in components]).astype(float)
+        other = RTP_COMPONENTS if components == NED_COMPONENTS else NED_COMPONENTS
+        return convert_components(as_component_array(tensors, other), other, components)
+    if isinstance(tensors, (list, tuple)) and len(tensors) > 0 and isinstance(tensors[0], dict):
+        rows = []
+        for mt in tensors:
+            if "tensor" in mt:
+                mt = mt["tensor"]
+            if components[0] not in mt:
+                mt = rtp_to_ned(mt) if components == NED_COMPONENTS else ned_to_rtp(mt)
+            rows.append([mt[c] for c in components])
+        return numpy.array(rows, dtype=float)
+    out = numpy.asarray(tensors, dtype=float)
+    if out.ndim == 1:
+        out = out.reshape((1, -1))
+    if out.shape[-1] != 6:
+        raise ValueError(f"moment tensor array must have 6 columns, shape: {out.shape}")
+    return out
+
+def convert_components(tensors, from_components, to_components):
+    """Reorder, with sign change, (N, 6) tensors between NED and RTP."""
+    if from_components == to_components:
+        return tensors
+    if from_components == RTP_COMPONENTS and to_components == NED_COMPONENTS:
+        return tensors[:, RTP_TO_NED_INDEX] * RTP_TO_NED_SIGN
+    if from_components == NED_COMPONENTS and to_components == RTP_COMPONENTS:
+        return tensors[:, NED_TO_RTP_INDEX] * NED_TO_RTP_SIGN
+    raise ValueError(f"unknown component order: {from_components} to {to_components}")
+
+def rtp_to_ned_many(rtp_tensors):
+    """Array form of rtp_to_ned, (N, 6) in RTP_COMPONENTS order to NED_COMPONENTS order."""
+    return convert_components(as_component_array(rtp_tensors, RTP_COMPONENTS), RTP_COMPONENTS, NED_COMPONENTS)
+
+def ned_to_rtp_many(ned_tensors):
+    """Array form of ned_to_rtp, (N, 6) in NED_COMPONENTS order to RTP_COMPONENTS order."""
+    return convert_components(as_component_array(ned_tensors, NED_COMPONENTS), NED_COMPONENTS, RTP_COMPONENTS)
+
+def ned_Nm_to_dynecm_many(ned_tensors):
+    return as_component_array(ned_tensors) * dyne_cm_per_newton_meter
+
+def ned_dynecm_to_gerscale_many(ned_tensors):
+    return as_component_array(ned_tensors) / randall_unit_scale
+
+def ned_Nm_to_gerscale_many(ned_tensors):
+    """
+    Tensors in newton meters to the units of the GER moment tensor line,
+    same as ned_dynecm_to_gerscale(ned_Nm_to_dynecm(mt)) for each tensor.
+    """
+    return as_component_array(ned_tensors) * (dyne_cm_per_newton_meter / randall_unit_scale)
+
+def to_beachballarray_many(tensors):
+    """Array form of to_beachballarray, each row suitable for obspy.imaging.beachball."""
+    return ned_to_rtp_many(tensors)
+
+def as_structured(tensors, components=NED_COMPONENTS):
+    """(N, 6) array as a structured array with a field per component."""
+    tensors = as_component_array(tensors, components)
+    dtype = NED_DTYPE if components == NED_COMPONENTS else RTP_DTYPE
+    out = numpy.empty(len(tensors), dtype=dtype)
+    for idx, c in enumerate(components):
+        out[c] = tensors[:, idx]
+    return out
+
+def ned_dict(row):
+    """One row of an (N, 6) NED array as a dict, as for EarthModel.momentTensor."""
+    return {c: float(v) for c, v in zip(NED_COMPONENTS, row)}
+
+#
+# Double couple tensors from strike, dip and rake, Aki and Richards box 4.4,
+# x north, y east and z down, for mechanism grid searches. Grids are
+# generated in chunks so a grid of millions of mechanisms never needs to be
+# in memory at once.
+#
+DEFAULT_CHUNK_SIZE = 65536
+
+# moment tensor component weighting each of the six mechanism Green's
+# functions, in the order of specfile.MECH_NAMES
+MECH_COMPONENTS = {
+    "zz": "m_dd",
+    "xy": "m_ne",
+    "xz": "m_nd",
+    "xx": "m_nn",
+    "yz": "m_ed",
+    "yy": "m_ee",
+}
+
+def sdr_to_ned(strike, dip, rake, scalar_moment=1.0):
+    """
+    Double couple tensors, (N, 6) in NED_COMPONENTS order, for arrays of
+    strike, dip and rake in degrees.
+    """
+    phi = numpy.radians(numpy.atleast_1d(numpy.asarray(strike, dtype=float)))
+    delta = numpy.radians(numpy.atleast_1d(numpy.asarray(dip, dtype=float)))
+    lam = numpy.radians(numpy.atleast_1d(numpy.asarray(rake, dtype=float)))
+    sin_d = numpy.sin(delta)
+    cos_d = numpy.cos(delta)
+    sin_2d = numpy.sin(2*delta)
+    cos_2d = numpy.cos(2*delta)
+    sin_l = numpy.sin(lam)
+    cos_l = numpy.cos(lam)
+    sin_p = numpy.sin(phi)
+    cos_p = numpy.cos(phi)
+    sin_2p = numpy.sin(2*phi)
+    cos_2p = numpy.cos(2*phi)
+    out = numpy.empty((len(phi), 6))
+    out[:, 0] = -(sin_d*cos_l*sin_2p + sin_2d*sin_l*sin_p*sin_p)
+    out[:, 1] = sin_d*cos_l*cos_2p + 0.5*sin_2d*sin_l*sin_2p
+    out[:, 2] = -(cos_d*cos_l*cos_p + cos_2d*sin_l*sin_p)
+    out[:, 3] = sin_d*cos_l*sin_2p - sin_2d*sin_l*cos_p*cos_p
+    out[:, 4] = -(cos_d*cos_l*sin_p - cos_2d*sin_l*cos_p)
+    out[:, 5] = sin_2d*sin_l
+    out *= numpy.asarray(scalar_moment, dtype=float).reshape((-1, 1))
+    return out
+
+def sdr_null_axis(strike, dip, rake):
+    """Null, or B, axis of double couples as (N, 3) unit vectors, north, east, down."""
+    phi = numpy.radians(numpy.atleast_1d(numpy.asarray(strike, dtype=float)))
+    delta = numpy.radians(numpy.atleast_1d(numpy.asarray(dip, dtype=float)))
+    lam = numpy.radians(numpy.atleast_1d(numpy.asarray(rake, dtype=float)))
+    normal = numpy.column_stack((-numpy.sin(delta)*numpy.sin(phi),
+                                 numpy.sin(delta)*numpy.cos(phi),
+                                 -numpy.cos(delta)))
+    slip = numpy.column_stack((numpy.cos(lam)*numpy.cos(phi) + numpy.cos(delta)*numpy.sin(lam)*numpy.sin(phi),
+                               numpy.cos(lam)*numpy.sin(phi) - numpy.cos(delta)*numpy.sin(lam)*numpy.cos(phi),
+                               -numpy.sin(lam)*numpy.sin(delta)))
+    return numpy.cross(normal, slip)
+
+def mechanism_tensors(strike, dip, rake, scalar_moment=1.0, isotropic=0.0, clvd=0.0):
+    """
+    Tensors, (N, 6) in NED_COMPONENTS order, of a double couple plus
+    optional isotropic and CLVD parts, each a fraction of scalar_moment.
+    The isotropic part adds isotropic*M0 to the diagonal, the CLVD part has
+    eigenvalues clvd*M0*(1, -1/2, -1/2) with the major axis along the null
+    axis of the double couple.
+    """
+    out = sdr_to_ned(strike, dip, rake)
+    if clvd != 0.0:
+        b = sdr_null_axis(strike, dip, rake)
+        # (3 b b^T - I)/2, in component order
+        for idx, (j, k) in enumerate([(0, 0), (0, 1), (0, 2), (1, 1), (1, 2), (2, 2)]):
+            out[:, idx] += clvd*(1.5*b[:, j]*b[:, k] - (0.5 if j == k else 0.0))
+    if isotropic != 0.0:
+        out[:, [0, 3, 5]] += isotropic
+    out *= numpy.asarray(scalar_moment, dtype=float).reshape((-1, 1))
+    return out
+
+def sdr_grid_size(strikes, dips, rakes):
+    return len(strikes)*len(dips)*len(rakes)
+
+def iter_sdr_grid(strikes, dips, rakes, chunk_size=DEFAULT_CHUNK_SIZE, scalar_moment_N_m=None,
+                  isotropic=0.0, clvd=0.0):
+    """
+    Generate the tensors of every combination of the strikes, dips and
+    rakes, degrees, in chunks of at most chunk_size mechanisms. Yields
+    (sdr, tensors), sdr of shape (n, 3) with strike, dip, rake columns and
+    tensors of shape (n, 6) in NED_COMPONENTS order, strike varying slowest.
+    Tensors are for unit scalar moment, or if scalar_moment_N_m is given
+    are scaled by moment_scale_factor so, after mechanism_weights, they
+    take raw Green's functions to m/s amplitude units.
+    """
+    strikes = numpy.atleast_1d(numpy.asarray(strikes, dtype=float))
+    dips = numpy.atleast_1d(numpy.asarray(dips, dtype=float))
+    rakes = numpy.atleast_1d(numpy.asarray(rakes, dtype=float))
+    shape = (len(strikes), len(dips), len(rakes))
+    total = sdr_grid_size(strikes, dips, rakes)
+    scale = 1.0 if scalar_moment_N_m is None else moment_scale_factor(scalar_moment_N_m)
+    for start in range(0, total, chunk_size):
+        s_idx, d_idx, r_idx = numpy.unravel_index(numpy.arange(start, min(start+chunk_size, total)), shape)
+        sdr = numpy.column_stack((strikes[s_idx], dips[d_idx], rakes[r_idx]))
+        yield sdr, mechanism_tensors(sdr[:, 0], sdr[:, 1], sdr[:, 2], scalar_moment=scale,
+                                     isotropic=isotropic, clvd=clvd)
+
+def iter_focal_sphere(num, chunk_size=DEFAULT_CHUNK_SIZE, seed=None, scalar_moment_N_m=None,
+                      isotropic=0.0, clvd=0.0):
+    """
+    Like iter_sdr_grid, but num mechanisms uniformly distributed over
+    orientations, strike and rake uniform and the cosine of the dip
+    uniform, instead of a regular grid that is denser at low dip. seed
+    makes the sampling repeatable.
+    """
+    rng = numpy.random.default_rng(seed)
+    scale = 1.0 if scalar_moment_N_m is None else moment_scale_factor(scalar_moment_N_m)
+    for start in range(0, num, chunk_size):
+        n = min(chunk_size, num-start)
+        sdr = numpy.column_stack((rng.uniform(0.0, 360.0, n),
+                                  numpy.degrees(numpy.arccos(rng.uniform(0.0, 1.0, n))),
+                                  rng.uniform(-180.0, 180.0, n)))
+        yield sdr, mechanism_tensors(sdr[:, 0], sdr[:, 1], sdr[:, 2], scalar_moment=scale,
+                                     isotropic=isotropic, clvd=clvd)
+
+def mechanism_weights(tensors, mech_names=None):
+    """
+    Weights, (N, 6), of the six mechanism Green's functions, columns in
+    the order of specfile.MECH_NAMES, for NED tensors, so the synthetics
+    for all tensors are mechanism_weights(tensors) @ greens, with greens of
+    shape (6, ...) stacked in the same order.
+    """
+    if mech_names is None:
+        from .specfile import MECH_NAMES
+        mech_names = MECH_NAMES
+    columns = [NED_COMPONENTS.index(MECH_COMPONENTS[mech_names[i]]) for i in range(len(mech_names))]
+    return as_component_array(tensors)[:, columns]
+
+def rotate_ned_horizontal(tensors, angle):
+    """
+    Rotate NED tensors, (N, 6), about the down axis so a direction at
+    azimuth a becomes a-angle, for example so the response at a station at
+    azimuth a can use Green's functions computed at azimuth a-angle.
+    angle, degrees, may be one value or one per tensor.
+    """
+    tensors = as_component_array(tensors)
+    angle = numpy.radians(numpy.asarray(angle, dtype=float))
+    c = numpy.cos(angle)
+    s = numpy.sin(angle)
+    m_nn, m_ne, m_nd, m_ee, m_ed, m_dd = tensors.T
+    out = numpy.empty(tensors.shape)
+    out[:, 0] = c*c*m_nn + 2*c*s*m_ne + s*s*m_ee
+    out[:, 1] = (c*c-s*s)*m_ne + c*s*(m_ee-m_nn)
+    out[:, 2] = c*m_nd + s*m_ed
+    out[:, 3] = s*s*m_nn - 2*c*s*m_ne + c*c*m_ee
+    out[:, 4] = c*m_ed - s*m_nd
+    out[:, 5] = m_dd
+    return out
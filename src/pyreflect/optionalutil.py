@@ -1,66 +1,164 @@
 import sys
 import os
-import pprint
 import json
+import copy
 import math
+import hashlib
+import functools
+import importlib.util
 import tempfile
-from io import StringIO
+import concurrent.futures
+import numpy
+from collections import OrderedDict
 from .earthmodel import EarthModel, list_distances
 from .specfile import load_specfile, to_time_domain, AMP_STYLE_VEL, AMP_STYLE_DISP
-from .velocitymodel import AK135F, depth_points_from_layers, load_nd_as_depth_points, extend_whole_earth, save_nd
-from .stationmetadata import create_fake_metadata, create_stacode_for_dist
+from .velocitymodel import AK135F, depth_points_from_layers, load_nd_as_depth_points, extend_whole_earth, \
+        depth_points_as_arrays, __round_nd_value__, load_nd_as_arrays
+from .stationmetadata import create_fake_inventory, create_stacode_for_dist, combine_inventory
 from .distaz import DistAz
+from .crustonecache import cache_dir
+from .traveltimetable import travel_times_for_points
+from .sacwriter import write_results_sac
 
-try:
+#
+# obspy is only imported by the functions that use it, so importing
+# optionalutil, for example in worker processes, does not pay for loading
+# obspy. The module attributes obspy, obspy_ok, Stats and UTCDateTime are
+# still available, resolved on first access.
+#
+
+@functools.lru_cache(maxsize=None)
+def obspy_available():
+    return importlib.util.find_spec("obspy") is not None
+
+def check_obspy_import_ok():
+    """Import obspy and the parts used here, returns the obspy module."""
+    if not obspy_available():
+        raise Exception("function requires obspy, but appears not to be installed, http://obspy.org")
     import obspy
     import obspy.taup
     import obspy.taup.taup_create
+    import obspy.taup.velocity_model
     import obspy.io.sac
-    from obspy.core.trace import Stats
-    from obspy.core.utcdatetime import UTCDateTime
-    obspy_ok = True
-except ImportError:
-    # obspy not installed
-    obspy_ok = False
+    import obspy.core.trace
+    return obspy
 
-def check_obspy_import_ok():
-    if not obspy_ok:
-        raise Error("function requires obspy, but appears not to be installed, http://obspy.org")
+def __getattr__(name):
+    if name == "obspy_ok":
+        return obspy_available()
+    if name == "obspy":
+        return check_obspy_import_ok()
+    if name == "Stats":
+        return check_obspy_import_ok().core.trace.Stats
+    if name == "UTCDateTime":
+        return check_obspy_import_ok().UTCDateTime
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 ROUND_SLOWNESS_DIGITS = 7
+TAUP_CACHE_SUBDIR = "taup"
+TAUP_MEMORY_CACHE_SIZE = 8 # built tau models kept in memory, most recently used
+__taup_memory_cache__ = OrderedDict()
 
 DEPTH_INDEX=3 # index of depth in pierce points output
 WAY_BIG=sys.float_info.max
-def estimate_for_phases(dist_params, source_depths, phase_list, base_model="ak135", max_depth_offset=200.0):
-    """calc travel times to estimate model depth and slowness values"""
-    check_obspy_import_ok()
-    nd_model_name = base_model
-    if nd_model_name == AK135F:
-        nd_model_name = 'ak135' # name in obspy
-    taumodel = obspy.taup.TauPyModel(model=nd_model_name )
+PHASE_CHUNKS_PER_WORKER = 4
+__phase_worker_taumodel__ = None
+
+def taup_model_name(base_model):
+    if base_model == AK135F:
+        return 'ak135' # name in obspy
+    return base_model
+
+def estimate_partial(taumodel, depth_distances, phase_list):
+    """
+    Partial phase estimate for a list of (depth km, distance deg) pairs,
+    the values reduced by estimate_for_phases: max pierce depth, min and
+    max ray parameter, max reduction velocity and the earliest arrival,
+    as a dict from arrival_to_dict.
+    """
+    partial = {
+        "max_depth": 0,
+        "min_ray_param": WAY_BIG,
+        "max_ray_param": -1,
+        "max_red_vel": 0,
+        "earliest_arrival": None,
+    }
+    for depth_km, dist_deg in depth_distances:
+        arrivals = taumodel.get_pierce_points(source_depth_in_km=depth_km,
+                                            distance_in_degree=dist_deg,
+                                            phase_list=phase_list)
+        for a in arrivals:
+            if partial["earliest_arrival"] is None or partial["earliest_arrival"]["time"] > a.time:
+                partial["earliest_arrival"] = arrival_to_dict(a)
+            partial["min_ray_param"] = min(partial["min_ray_param"], a.ray_param)
+            partial["max_ray_param"] = max(partial["max_ray_param"], a.ray_param)
+            for p in a.pierce:
+                partial["max_depth"] = max(partial["max_depth"], p[DEPTH_INDEX])
+            a_redvel = DistAz.degreesToKilometers(a.distance) / a.time
+            if a_redvel > partial["max_red_vel"]:
+                partial["max_red_vel"] = a_redvel
+    return partial
+
+def reduce_partials(partials):
+    """Combine partial estimates, in order, same result as one estimate over all the pairs."""
+    out = None
+    for partial in partials:
+        if out is None:
+            out = dict(partial)
+            continue
+        out["max_depth"] = max(out["max_depth"], partial["max_depth"])
+        out["min_ray_param"] = min(out["min_ray_param"], partial["min_ray_param"])
+        out["max_ray_param"] = max(out["max_ray_param"], partial["max_ray_param"])
+        out["max_red_vel"] = max(out["max_red_vel"], partial["max_red_vel"])
+        earliest = partial["earliest_arrival"]
+        if earliest is not None and (out["earliest_arrival"] is None or out["earliest_arrival"]["time"] > earliest["time"]):
+            out["earliest_arrival"] = earliest
+    return out
+
+def __init_phase_worker__(nd_model_name):
+    global __phase_worker_taumodel__
+    obspy = check_obspy_import_ok()
+    __phase_worker_taumodel__ = obspy.taup.TauPyModel(model=nd_model_name)
+
+def __estimate_partial_in_worker__(depth_distances, phase_list):
+    return estimate_partial(__phase_worker_taumodel__, depth_distances, phase_list)
+
+def estimate_for_phases(dist_params, source_depths, phase_list, base_model="ak135", max_depth_offset=200.0,
+                        max_workers=1, distance_decimals=None):
+    """
+    calc travel times to estimate model depth and slowness values
+
+    With max_workers other than 1 the depth, distance pairs are split into
+    chunks and run in a process pool, each worker loading the TauP model
+    once, None uses the number of cpus. If distance_decimals is given,
+    distances in degrees are rounded to that many decimals and duplicates
+    are only calculated once.
+    """
+    obspy = check_obspy_import_ok()
+    nd_model_name = taup_model_name(base_model)
     radiusOfEarth = 6371 # for flat to spherical ray param conversion, should get from model
-    maxDepth = 0
-    minRayParam = WAY_BIG
-    max_red_vel = 0
-    maxRayParam = -1
-    earliestArrival = None
-
-    for depth_km in source_depths:
-        for dist_km in list_distances(dist_params):
-            dist_deg = DistAz.kilometersToDegrees(dist_km)
-            arrivals = taumodel.get_pierce_points(source_depth_in_km=depth_km,
-                                                distance_in_degree=dist_deg,
-                                                phase_list=phase_list)
-            for a in arrivals:
-                if earliestArrival is None or earliestArrival.time > a.time:
-                    earliestArrival = a
-                minRayParam = min(minRayParam, a.ray_param)
-                maxRayParam = max(maxRayParam, a.ray_param)
-                for p in a.pierce:
-                    maxDepth = max(maxDepth, p[DEPTH_INDEX])
-                a_redvel = DistAz.degreesToKilometers(a.distance) / a.time
-                if a_redvel > max_red_vel:
-                    max_red_vel = a_redvel
+    distances_deg = [DistAz.kilometersToDegrees(dist_km) for dist_km in list_distances(dist_params)]
+    if distance_decimals is not None:
+        distances_deg = list(dict.fromkeys(round(d, distance_decimals) for d in distances_deg))
+    depth_distances = [(depth_km, dist_deg) for depth_km in source_depths for dist_deg in distances_deg]
+    if max_workers == 1:
+        taumodel = obspy.taup.TauPyModel(model=nd_model_name )
+        estimate = estimate_partial(taumodel, depth_distances, phase_list)
+    else:
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                    initializer=__init_phase_worker__,
+                                                    initargs=(nd_model_name,)) as executor:
+            num_chunks = max_workers*PHASE_CHUNKS_PER_WORKER
+            chunk_size = max(1, math.ceil(len(depth_distances)/num_chunks))
+            chunks = [depth_distances[i:i+chunk_size] for i in range(0, len(depth_distances), chunk_size)]
+            estimate = reduce_partials(executor.map(__estimate_partial_in_worker__, chunks,
+                                                    [phase_list]*len(chunks)))
+    maxDepth = estimate["max_depth"]
+    minRayParam = estimate["min_ray_param"]
+    maxRayParam = estimate["max_ray_param"]
+    max_red_vel = estimate["max_red_vel"]
 
     maxDepth = round(math.ceil(maxDepth + max_depth_offset)) # little bit deeper
     minRayParam = minRayParam/radiusOfEarth # need to be flat earth ray params
@@ -80,7 +178,7 @@ def estimate_for_phases(dist_params, source_depths, phase_list, base_model="ak13
         "highcut": round(maxRayParam*1.5, ROUND_SLOWNESS_DIGITS),
         "controlfac": 1.0
         }
-    model.extra["earliest_arrival"] = arrival_to_dict(earliestArrival)
+    model.extra["earliest_arrival"] = estimate["earliest_arrival"]
     if max_red_vel > 0:
         model.extra["reduce_velocity"] = max_red_vel
     model.extra["phase_list"] = phase_list
@@ -108,31 +206,171 @@ def arrivals_for_stream(stream):
     check_obspy_import_ok()
     pass
 
-def create_taupymodel(model, extendmodel=AK135F):
+# named discontinuities in .nd models, to the VelocityModel argument set from
+# the depth of the point above, same as obspy's VelocityModel.read_nd_file
+TAUP_DISCONTINUITIES = {
+    "mantle": "moho_depth",
+    "moho": "moho_depth",
+    "outer-core": "cmb_depth",
+    "cmb": "cmb_depth",
+    "inner-core": "iocb_depth",
+    "iocb": "iocb_depth",
+}
+# obspy's defaults for .nd files, obspy.taup._DEFAULT_VALUES, for
+# discontinuities missing from the model and the q of every layer
+TAUP_DEFAULT_MOHO = 35.0
+TAUP_DEFAULT_CMB = 2889.0
+TAUP_DEFAULT_IOCB = 5153.9
+TAUP_DEFAULT_QP = 1000.0
+TAUP_DEFAULT_QS = 2000.0
+
+def taup_velocity_model_from_arrays(arrays, model_name="pyreflect"):
+    """
+    Build an obspy VelocityModel from depth point arrays, see
+    depth_points_as_arrays, in memory. Gives the same model as writing the
+    points with save_nd and reading them with obspy's read_nd_file, without
+    the temporary file, including the rounding to 6 decimal places.
+    """
+    obspy = check_obspy_import_ok()
+    data = numpy.array([__round_nd_value__(arrays[key]) for key in ["depth", "vp", "vs", "rho"]]).T
+    mask = data[:, 2] > data[:, 1]
+    if numpy.any(mask):
+        raise ValueError("S velocity is greater than the P velocity\n" + str(data[mask]))
+    discontinuities = {
+        "moho_depth": TAUP_DEFAULT_MOHO,
+        "cmb_depth": TAUP_DEFAULT_CMB,
+        "iocb_depth": TAUP_DEFAULT_IOCB,
+    }
+    types = arrays["type"].tolist()
+    for idx in range(1, len(types)):
+        if types[idx] != types[idx-1] and types[idx-1] != "unknown" and types[idx] != "unknown":
+            name = types[idx].lower()
+            if name not in TAUP_DISCONTINUITIES:
+                raise ValueError(f"Unrecognized discontinuity name: {types[idx]}")
+            discontinuities[TAUP_DISCONTINUITIES[name]] = data[idx-1, 0]
+    layers = numpy.empty(data.shape[0] - 1, dtype=obspy.taup.velocity_model.VelocityLayer)
+    for col, name in enumerate(["depth", "p_velocity", "s_velocity", "density"]):
+        top_name = "top_depth" if name == "depth" else "top_"+name
+        bot_name = "bot_depth" if name == "depth" else "bot_"+name
+        layers[top_name] = data[:-1, col]
+        layers[bot_name] = data[1:, col]
+    layers["top_qp"].fill(TAUP_DEFAULT_QP)
+    layers["bot_qp"].fill(TAUP_DEFAULT_QP)
+    layers["top_qs"].fill(TAUP_DEFAULT_QS)
+    layers["bot_qs"].fill(TAUP_DEFAULT_QS)
+    layers = layers[layers["top_depth"] != layers["bot_depth"]]
+    v_mod = obspy.taup.velocity_model.VelocityModel(
+        model_name=model_name,
+        radius_of_planet=data[-1, 0],
+        min_radius=0, max_radius=data[-1, 0],
+        is_spherical=True, layers=layers, **discontinuities)
+    v_mod.fix_discontinuity_depths()
+    return v_mod
+
+def taup_velocity_model(points, model_name="pyreflect"):
+    """Build an obspy VelocityModel from a list of VelocityModelPoint, see taup_velocity_model_from_arrays."""
+    return taup_velocity_model_from_arrays(depth_points_as_arrays(points), model_name=model_name)
+
+def create_tau_model(model, extendmodel=AK135F):
+    """obspy TauModel of an EarthModel, extended to the whole earth with extendmodel."""
+    obspy = check_obspy_import_ok()
     model_name = model.name.split()[0]
-    with tempfile.TemporaryDirectory() as output_folder:
-        nd_filename = os.path.join(output_folder, model_name + ".nd")
-        output_filename = os.path.join(output_folder, model_name + ".npz")
-        points = depth_points_from_layers(model.layers)
-        extend_points = load_nd_as_depth_points(extendmodel)
-        points = extend_whole_earth(points, extend_points)
-        save_nd(points, nd_filename)
-        save_nd(points, "/Users/crotwell/saved_model.nd")
-        mod_create = obspy.taup.taup_create.TauPCreate(input_filename=nd_filename,
-                                    output_filename=output_filename)
-        mod_create.load_velocity_model()
-        tau_model = mod_create.create_tau_model(mod_create.v_mod)
-        tau_model.depth_correct(0.0)
-        taup = obspy.taup.TauPyModel()
-        taup.model = tau_model
+    points = depth_points_from_layers(model.peek_layers())
+    extend_points = load_nd_as_depth_points(extendmodel)
+    points = extend_whole_earth(points, extend_points)
+    v_mod = taup_velocity_model(points, model_name=model_name)
+    mod_create = obspy.taup.taup_create.TauPCreate(input_filename=None, output_filename=None)
+    tau_model = mod_create.create_tau_model(v_mod)
+    tau_model.depth_correct(0.0)
+    return tau_model
+
+@functools.lru_cache(maxsize=1)
+def __default_taupymodel__():
+    # loaded once, only copied to hold other tau models
+    return check_obspy_import_ok().taup.TauPyModel()
+
+def taupymodel_from_tau_model(tau_model):
+    """
+    TauPyModel for a TauModel, in memory. The TauPyModel constructor only
+    loads models from files, so a copy of the default model is used with
+    its model attribute set to tau_model.
+    """
+    taup = copy.copy(__default_taupymodel__())
+    taup.model = tau_model
     return taup
 
+def create_taupymodel(model, extendmodel=AK135F):
+    return taupymodel_from_tau_model(create_tau_model(model, extendmodel=extendmodel))
+
+def taup_model_key(model, extendmodel=AK135F):
+    """
+    Key for the built tau model of an EarthModel, from the layer fingerprint,
+    the model used to extend it to the whole earth and the obspy version.
+    """
+    obspy = check_obspy_import_ok()
+    h = hashlib.sha1()
+    h.update(model.layer_fingerprint().encode("utf-8"))
+    h.update(f" {extendmodel} {obspy.__version__}".encode("utf-8"))
+    return h.hexdigest()
+
+def cached_taupymodel(model, extendmodel=AK135F, directory=None):
+    """
+    Same as create_taupymodel, but the built tau model is cached on disk
+    in obspy's npz format, in directory or else the taup subdirectory of
+    the pyreflect cache_dir, and the most recently used ones in memory, so
+    models with the same layers are only built once. The returned model is
+    shared with other callers.
+    """
+    obspy = check_obspy_import_ok()
+    key = taup_model_key(model, extendmodel=extendmodel)
+    if key in __taup_memory_cache__:
+        __taup_memory_cache__.move_to_end(key)
+        return __taup_memory_cache__[key]
+    if directory is None:
+        directory = os.path.join(cache_dir(), TAUP_CACHE_SUBDIR)
+    cache_path = os.path.join(directory, key+".npz")
+    taup = None
+    if os.path.exists(cache_path):
+        try:
+            taup = obspy.taup.TauPyModel(model=cache_path)
+        except Exception:
+            # partial or from incompatible version, rebuild
+            taup = None
+    if taup is None:
+        tau_model = create_tau_model(model, extendmodel=extendmodel)
+        taup = taupymodel_from_tau_model(tau_model)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".taup-", suffix=".npz", dir=directory)
+            os.close(fd)
+            tau_model.serialize(tmp_path)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # cache not writable, just use the built model
+            pass
+    __taup_memory_cache__[key] = taup
+    while len(__taup_memory_cache__) > TAUP_MEMORY_CACHE_SIZE:
+        __taup_memory_cache__.popitem(last=False)
+    return taup
+
+@functools.lru_cache(maxsize=None)
+def planet_radius(extendmodel=AK135F):
+    """
+    Radius of the planet of models extended to the whole earth with
+    extendmodel, same as radius_of_planet of the TauP model, without obspy.
+    """
+    return float(load_nd_as_arrays(extendmodel)["depth"][-1])
+
+def km_to_deg_factor(radius):
+    """Degrees of arc per km along the surface of a planet of radius km."""
+    return 180/(math.pi*radius)
+
 def mspec_to_stream(rundirectory, model, reduceVel=None, offset=None, phase_list=None, ampStyle=AMP_STYLE_VEL, mspec_filename='mspec'):
     results = load_specfile(os.path.join(rundirectory, mspec_filename))
     return results_to_stream(results, model, ampStyle=ampStyle, reduceVel = reduceVel, offset = offset)
 
 def results_to_stream(results, model, reduceVel=None, offset=None, phase_list=None, ampStyle=AMP_STYLE_VEL, mspec_filename='mspec'):
-    check_obspy_import_ok()
+    obspy = check_obspy_import_ok()
     results = to_time_domain(results, ampStyle=ampStyle, reduceVel = reduceVel, offset = offset)
     stream = None
     inv = None
@@ -140,20 +378,20 @@ def results_to_stream(results, model, reduceVel=None, offset=None, phase_list=No
     gaincode = 'H'
     loccode = "SY"
     netcode = "XX"
-    taupymodel = create_taupymodel(model, extendmodel=AK135F)
+    taupymodel = cached_taupymodel(model, extendmodel=AK135F)
 
-    if reduceVel is None and model.extra['reduce_velocity'] is not None:
-        reduceVel = model.extra['reduce_velocity']
+    if reduceVel is None and model.peek('extra')['reduce_velocity'] is not None:
+        reduceVel = model.peek('extra')['reduce_velocity']
     elif reduceVel is None:
         reduceVel = 0.0
-    if offset is None and model.extra['offset'] is not None:
-        offset = model.extra['offset']
+    if offset is None and model.peek('extra')['offset'] is not None:
+        offset = model.peek('extra')['offset']
     elif offset is None:
         offset = 0.0
-    if phase_list is None and 'phase_list' in model.extra and model.extra['phase_list'] is not None:
-        phase_list = model.extra['phase_list']
+    if phase_list is None and 'phase_list' in model.peek('extra') and model.peek('extra')['phase_list'] is not None:
+        phase_list = model.peek('extra')['phase_list']
 
-    km_to_deg = 180/taupymodel.model.radius_of_planet
+    km_to_deg = km_to_deg_factor(taupymodel.model.radius_of_planet)
     if ampStyle == AMP_STYLE_VEL:
         idep = obspy.io.sac.header.ENUM_VALS['ivel']
     elif ampStyle == AMP_STYLE_DISP:
@@ -162,6 +400,15 @@ def results_to_stream(results, model, reduceVel=None, offset=None, phase_list=No
         idep = obspy.io.sac.header.ENUM_VALS['iunkn']
     for tsObj in results['timeseries']:
         tsObj['depth'] = round(tsObj['depth'], 5)
+    inv_loccodes = set()
+    trace_arrivals = None
+    if phase_list is not None and len(phase_list) != 0:
+        # each depth and distance is repeated for every mechanism, and
+        # a table is used if there are many distances
+        trace_arrivals = travel_times_for_points(taupymodel, phase_list,
+                                                 [tsObj['depth'] for tsObj in results['timeseries']],
+                                                 [tsObj['distance']*km_to_deg for tsObj in results['timeseries']])
+    for ts_idx, tsObj in enumerate(results['timeseries']):
         stacode = create_stacode_for_dist(tsObj['distance'])
         commonHeader = {
             'sampling_rate': results['inputs']['frequency']['nyquist']*2.0,
@@ -169,7 +416,7 @@ def results_to_stream(results, model, reduceVel=None, offset=None, phase_list=No
             'location': loccode,
             'station': stacode,
             'network': netcode,
-            'starttime': UTCDateTime(0)+tsObj['timeReduce'],
+            'starttime': obspy.UTCDateTime(0)+tsObj['timeReduce'],
             'sac': {
                     'b': tsObj['timeReduce'],
                     'dist': tsObj['distance'],
@@ -184,23 +431,20 @@ def results_to_stream(results, model, reduceVel=None, offset=None, phase_list=No
             print(f"mech: {tsObj['mech']}")
             loccode = 'SY'
         commonHeader['location'] = loccode
-        if phase_list is not None and len(phase_list) != 0:
+        if trace_arrivals is not None:
             # add arrival times and phase name as flags in SAC header
-            arrivals = taupymodel.get_travel_times(source_depth_in_km=tsObj['depth'],
-                                                  distance_in_degree=tsObj['distance']*km_to_deg,
-                                                  phase_list=phase_list)
-            for idx, a in enumerate(arrivals):
-                commonHeader['sac'][f"t{idx}"] = a.time
-                commonHeader['sac'][f"kt{idx}"] = a.name
-        header = Stats(commonHeader)
+            for idx, (name, time) in enumerate(trace_arrivals[ts_idx]):
+                commonHeader['sac'][f"t{idx}"] = time
+                commonHeader['sac'][f"kt{idx}"] = name
+        header = obspy.core.trace.Stats(commonHeader)
         header.component = 'Z'
         header.npts = len(tsObj['z'])
         z = obspy.Trace(tsObj['z'], header)
-        header = Stats(commonHeader)
+        header = obspy.core.trace.Stats(commonHeader)
         header.component = 'R'
         header.npts = len(tsObj['r'])
         r = obspy.Trace(tsObj['r'], header)
-        header = Stats(commonHeader)
+        header = obspy.core.trace.Stats(commonHeader)
         header.component = 'T'
         header.npts = len(tsObj['t'])
         t = obspy.Trace(tsObj['t'], header)
@@ -210,38 +454,34 @@ def results_to_stream(results, model, reduceVel=None, offset=None, phase_list=No
             stream.append(z)
             stream.append(r)
             stream.append(t)
-        metadata = create_fake_metadata(model, loccode, bandcode, gaincode, ampStyle=AMP_STYLE_VEL)
-        chan_inv = obspy.read_inventory(StringIO(metadata))
-        inv = combine_inventory(inv, chan_inv)
+        if loccode not in inv_loccodes:
+            # same channels for every trace with this loccode, only create once
+            inv = combine_inventory(inv, create_fake_inventory(model, loccode, bandcode, gaincode,
+                                                               ampStyle=AMP_STYLE_VEL))
+            inv_loccodes.add(loccode)
 
     stream.attach_response(inv)
     return stream, inv
 
-def combine_inventory(inv, to_add):
-    if inv is None:
-        return to_add
-    for add_n in to_add:
-        found_n = False
-        for inv_n in inv:
-            if add_n.code == inv_n.code:
-                found_n = True
-                found_s = False
-                for add_s in add_n:
-                    for inv_s in inv_n:
-                        if add_s.code == inv_s.code:
-                            found_s = True
-                            for c in add_s:
-                                found_c = False
-                                for inv_c in inv_s:
-                                    if inv_c.code == c.code and inv_c.location_code == c.location_code:
-                                        found_c = True
-                                        break
-                                if not found_c:
-                                    inv_s.channels.append(c)
-                            break
-                    if not found_s:
-                        inv_n.stations.append(add_s)
-                break
-        if not found_n:
-            inv.append(add_n)
-    return inv
+def results_to_sac(results, model, directory, reduceVel=None, offset=None, phase_list=None, ampStyle=AMP_STYLE_VEL,
+                   max_workers=1):
+    """
+    Write results as SAC files into directory, same data and sac header
+    as the traces of results_to_stream, but written directly from the
+    arrays by sacwriter, without an obspy Trace per component. obspy and
+    the TauP model are only needed for arrivals, if there is a phase_list,
+    as an argument or in model.extra. Returns the filenames.
+    """
+    results = to_time_domain(results, ampStyle=ampStyle, reduceVel = reduceVel, offset = offset)
+    if phase_list is None and 'phase_list' in model.peek('extra') and model.peek('extra')['phase_list'] is not None:
+        phase_list = model.peek('extra')['phase_list']
+    km_to_deg = km_to_deg_factor(planet_radius(AK135F))
+    trace_arrivals = None
+    if phase_list is not None and len(phase_list) != 0:
+        check_obspy_import_ok()
+        taupymodel = cached_taupymodel(model, extendmodel=AK135F)
+        trace_arrivals = travel_times_for_points(taupymodel, phase_list,
+                                                 [round(tsObj['depth'], 5) for tsObj in results['timeseries']],
+                                                 [tsObj['distance']*km_to_deg for tsObj in results['timeseries']])
+    return write_results_sac(results, directory, ampStyle=ampStyle, km_to_deg=km_to_deg,
+                             arrivals=trace_arrivals, max_workers=max_workers)
@@ -0,0 +1,108 @@
+import numpy
+from .earthmodel import DIST_IRREGULAR
+
+#
+# Plan the reflectivity runs for many event-station pairs. Pairs are grouped
+# by earth structure, for example Crust1.0 cell or model layer fingerprint,
+# and within each group the distances and source depths are clustered within
+# tolerances, so that one run, with an irregular distance list and a list of
+# source depths, covers many pairs instead of one run per pair.
+#
+
+def cluster_values(values, tolerance):
+    """
+    Greedy clustering of values so every value is within tolerance of the
+    center of its cluster, optimal in number of clusters for 1D. Returns
+    the sorted cluster centers and the cluster index of each value. A zero
+    tolerance clusters only identical values.
+    """
+    values = numpy.asarray(values, dtype=float)
+    order = numpy.argsort(values, kind="stable")
+    sorted_values = values[order]
+    sorted_labels = numpy.empty(len(values), dtype=int)
+    centers = []
+    start = 0
+    while start < len(sorted_values):
+        end = numpy.searchsorted(sorted_values, sorted_values[start]+2*tolerance, side="right")
+        centers.append((sorted_values[start]+sorted_values[end-1])/2)
+        sorted_labels[start:end] = len(centers)-1
+        start = end
+    labels = numpy.empty(len(values), dtype=int)
+    labels[order] = sorted_labels
+    return numpy.array(centers), labels
+
+def plan_runs(depths, distances, keys, models, distance_tolerance=0.0, depth_tolerance=0.0,
+              max_distances=None, max_depths=None):
+    """
+    Plan the runs for event-station pairs given as arrays of source depth
+    (km), distance (km) and key, the earth structure for the pair, like a
+    Crust1.0 cell or a layer fingerprint from EarthModel.crustone_many.
+    models is a dict of key to the EarthModel for that key, or a single
+    EarthModel for all keys.
+
+    Each job is a clone of the model for its key with a DIST_IRREGULAR
+    distance list and source depths, split so no job has more than
+    max_distances distances or max_depths depths if given. The azimuth is
+    that of the model, only the distance and depth of a pair are planned.
+
+    Returns a dict with "jobs", the list of EarthModel, "job_keys",
+    "lookup", a dict of arrays "job", "distance_index" and "depth_index"
+    with the entry for every original pair, "num_pairs", "num_jobs",
+    "reduction_factor", pairs per job, and the largest distance and
+    depth difference between a pair and the job values used for it.
+    """
+    depths = numpy.atleast_1d(numpy.asarray(depths, dtype=float))
+    distances = numpy.atleast_1d(numpy.asarray(distances, dtype=float))
+    keys = list(keys)
+    if not (len(depths) == len(distances) == len(keys)):
+        raise ValueError(f"need same number of depths, distances and keys: {len(depths)} {len(distances)} {len(keys)}")
+    groups = {}
+    for idx, key in enumerate(keys):
+        groups.setdefault(key, []).append(idx)
+    jobs = []
+    job_keys = []
+    lookup = {
+        "job": numpy.zeros(len(keys), dtype=int),
+        "distance_index": numpy.zeros(len(keys), dtype=int),
+        "depth_index": numpy.zeros(len(keys), dtype=int),
+    }
+    max_distance_error = 0.0
+    max_depth_error = 0.0
+    for key, members in groups.items():
+        members = numpy.array(members)
+        base_model = models[key] if isinstance(models, dict) else models
+        dist_centers, dist_labels = cluster_values(distances[members], distance_tolerance)
+        depth_centers, depth_labels = cluster_values(depths[members], depth_tolerance)
+        max_distance_error = max(max_distance_error, float(numpy.max(numpy.abs(dist_centers[dist_labels]-distances[members]))))
+        max_depth_error = max(max_depth_error, float(numpy.max(numpy.abs(depth_centers[depth_labels]-depths[members]))))
+        dist_chunk = len(dist_centers) if max_distances is None else max_distances
+        depth_chunk = len(depth_centers) if max_depths is None else max_depths
+        num_depth_jobs = -(-len(depth_centers) // depth_chunk)
+        first_job = len(jobs)
+        for dist_start in range(0, len(dist_centers), dist_chunk):
+            for depth_start in range(0, len(depth_centers), depth_chunk):
+                job = base_model.clone()
+                job.name = f"{base_model.name} job {len(jobs)}"
+                # new values, set without marking them handed out so clones of
+                # the job can still share them
+                job.__set_owned__("distance", {
+                    "type": DIST_IRREGULAR,
+                    "distanceList": dist_centers[dist_start:dist_start+dist_chunk].tolist(),
+                    "azimuth": base_model.peek("distance")["azimuth"],
+                })
+                job.__set_owned__("sourceDepths", depth_centers[depth_start:depth_start+depth_chunk].tolist())
+                jobs.append(job)
+                job_keys.append(key)
+        lookup["job"][members] = first_job + (dist_labels // dist_chunk)*num_depth_jobs + depth_labels // depth_chunk
+        lookup["distance_index"][members] = dist_labels % dist_chunk
+        lookup["depth_index"][members] = depth_labels % depth_chunk
+    return {
+        "jobs": jobs,
+        "job_keys": job_keys,
+        "lookup": lookup,
+        "num_pairs": len(keys),
+        "num_jobs": len(jobs),
+        "reduction_factor": len(keys)/len(jobs) if len(jobs) > 0 else 0.0,
+        "max_distance_error": max_distance_error,
+        "max_depth_error": max_depth_error,
+    }
@@ -0,0 +1,189 @@
+import os
+import concurrent.futures
+import numpy
+from .specfile import AMP_STYLE_VEL, AMP_STYLE_DISP
+from .stationmetadata import create_stacode_for_dist
+
+#
+# SAC binary files written directly from the synthetic arrays, without
+# creating an obspy Trace for each component. The header is a numpy
+# structured array, one record per trace, filled with the same values
+# results_to_stream puts in the sac header, and each file is the header
+# record followed by the data as little endian float32, in one write.
+#
+# Header layout, 632 bytes: 70 float32, 40 int32, then the character
+# fields, kevnm 16 bytes and the rest 8 bytes.
+#
+
+SAC_FLOAT_FIELDS = ["delta", "depmin", "depmax", "scale", "odelta", "b", "e", "o", "a", "internal0",
+                    "t0", "t1", "t2", "t3", "t4", "t5", "t6", "t7", "t8", "t9", "f",
+                    "resp0", "resp1", "resp2", "resp3", "resp4", "resp5", "resp6", "resp7", "resp8", "resp9",
+                    "stla", "stlo", "stel", "stdp", "evla", "evlo", "evel", "evdp", "mag",
+                    "user0", "user1", "user2", "user3", "user4", "user5", "user6", "user7", "user8", "user9",
+                    "dist", "az", "baz", "gcarc", "internal1", "internal2", "depmen", "cmpaz", "cmpinc",
+                    "xminimum", "xmaximum", "yminimum", "ymaximum",
+                    "unused6", "unused7", "unused8", "unused9", "unused10", "unused11", "unused12"]
+SAC_INT_FIELDS = ["nzyear", "nzjday", "nzhour", "nzmin", "nzsec", "nzmsec", "nvhdr", "norid", "nevid", "npts",
+                  "internal3", "nwfid", "nxsize", "nysize", "unused13", "iftype", "idep", "iztype", "unused14",
+                  "iinst", "istreg", "ievreg", "ievtyp", "iqual", "isynth", "imagtyp", "imagsrc",
+                  "unused15", "unused16", "unused17", "unused18", "unused19", "unused20", "unused21", "unused22",
+                  "leven", "lpspol", "lovrok", "lcalda", "unused23"]
+SAC_STRING_FIELDS = ["kstnm", "kevnm", "khole", "ko", "ka", "kt0", "kt1", "kt2", "kt3", "kt4", "kt5", "kt6",
+                     "kt7", "kt8", "kt9", "kf", "kuser0", "kuser1", "kuser2", "kcmpnm", "knetwk", "kdatrd", "kinst"]
+SAC_HEADER_DTYPE = numpy.dtype([(f, "<f4") for f in SAC_FLOAT_FIELDS]
+                               + [(f, "<i4") for f in SAC_INT_FIELDS]
+                               + [(f, "S16" if f == "kevnm" else "S8") for f in SAC_STRING_FIELDS])
+SAC_FLOAT_NULL = -12345.0
+SAC_INT_NULL = -12345
+SAC_STRING_NULL = b"-12345"
+SAC_NUM_ARRIVALS = 10 # t0-t9 and kt0-kt9
+
+# enumerated header values, as in obspy.io.sac.header.ENUM_VALS
+SAC_ITIME = 1
+SAC_IUNKN = 5
+SAC_IDISP = 6
+SAC_IVEL = 7
+
+SAC_WRITE_CHUNK = 256 # files per task when writing with threads
+
+def sac_strings(values, field="kstnm"):
+    """Values as SAC character field bytes, space padded."""
+    size = SAC_HEADER_DTYPE[field].itemsize
+    return numpy.char.ljust(numpy.asarray(values, dtype=f"S{size}"), size)
+
+def empty_sac_headers(num):
+    """num SAC headers with every value null, and version and even spacing set."""
+    headers = numpy.empty(num, dtype=SAC_HEADER_DTYPE)
+    for f in SAC_FLOAT_FIELDS:
+        headers[f] = SAC_FLOAT_NULL
+    for f in SAC_INT_FIELDS:
+        headers[f] = SAC_INT_NULL
+    for f in SAC_STRING_FIELDS:
+        headers[f] = sac_strings(SAC_STRING_NULL, f)
+    # 16 character kevnm is null as two 8 character fields
+    headers["kevnm"] = sac_strings(SAC_STRING_NULL, "kstnm")[()]*2
+    headers["nvhdr"] = 6
+    headers["iftype"] = SAC_ITIME
+    headers["leven"] = 1
+    headers["lpspol"] = 0
+    headers["lovrok"] = 1
+    headers["lcalda"] = 1
+    # reference time is the origin, 1970-001 00:00:00 like results_to_stream
+    headers["nzyear"] = 1970
+    headers["nzjday"] = 1
+    for f in ["nzhour", "nzmin", "nzsec", "nzmsec"]:
+        headers[f] = 0
+    return headers
+
+def idep_for_amp_style(ampStyle):
+    if ampStyle == AMP_STYLE_VEL:
+        return SAC_IVEL
+    elif ampStyle == AMP_STYLE_DISP:
+        return SAC_IDISP
+    return SAC_IUNKN
+
+def loccode_for_mech(mech):
+    """Location code of a timeseries, as in results_to_stream."""
+    if mech != "mij":
+        return mech.upper()
+    return "SY"
+
+def sac_headers_for_results(results, ampStyle=AMP_STYLE_VEL, km_to_deg=1/111.19, netcode="XX",
+                            bandcode="B", gaincode="H", arrivals=None, components="ZRT"):
+    """
+    Headers for every timeseries and component of results from
+    to_time_domain, in the order of results_to_stream, z, r and t of each
+    timeseries in turn. km_to_deg is 180/(pi*radius) of the planet, arrivals
+    an optional list, one per timeseries, of (name, time) as from
+    travel_times_for_points. Data dependent values, npts, e and the
+    depmin, depmax and depmen are set when writing.
+    """
+    timeseries = results['timeseries']
+    num_ts = len(timeseries)
+    headers = empty_sac_headers(num_ts*len(components))
+    delta = 1.0/(results['inputs']['frequency']['nyquist']*2.0)
+    distance = numpy.repeat([ts['distance'] for ts in timeseries], len(components))
+    headers["delta"] = delta
+    headers["b"] = numpy.repeat([ts['timeReduce'] for ts in timeseries], len(components))
+    headers["dist"] = distance
+    headers["gcarc"] = distance*km_to_deg
+    headers["evdp"] = numpy.repeat([round(ts['depth'], 5) for ts in timeseries], len(components))
+    headers["idep"] = idep_for_amp_style(ampStyle)
+    headers["kstnm"] = sac_strings(numpy.repeat([create_stacode_for_dist(ts['distance']) for ts in timeseries], len(components)))
+    headers["khole"] = sac_strings(numpy.repeat([loccode_for_mech(ts['mech']) for ts in timeseries], len(components)))
+    headers["knetwk"] = sac_strings(netcode)
+    headers["kcmpnm"] = sac_strings(numpy.tile([bandcode+gaincode+c for c in components], num_ts))
+    if arrivals is not None:
+        for ts_idx, ts_arrivals in enumerate(arrivals):
+            rows = slice(ts_idx*len(components), (ts_idx+1)*len(components))
+            for idx, (name, time) in enumerate(ts_arrivals[:SAC_NUM_ARRIVALS]):
+                headers[f"t{idx}"][rows] = time
+                headers[f"kt{idx}"][rows] = sac_strings(name)
+    return headers
+
+def sac_bytes(header, data):
+    """Bytes of a SAC file, header values that depend on the data are filled in from data."""
+    data = numpy.asarray(data, dtype="<f4")
+    header = header.copy()
+    header["npts"] = len(data)
+    if len(data) > 0:
+        header["e"] = header["b"] + (len(data)-1)*header["delta"]
+        header["depmin"] = data.min()
+        header["depmax"] = data.max()
+        header["depmen"] = data.mean(dtype=float)
+    return header.tobytes() + data.tobytes()
+
+def write_sac(filename, header, data):
+    with open(filename, "wb") as f:
+        f.write(sac_bytes(header, data))
+
+def sac_filename(header, with_depth=False):
+    """
+    net.sta.loc.chan.sac, the name examples use via tr.id, with the source
+    depth added before .sac if with_depth, as the station code is only from
+    the distance.
+    """
+    codes = [header[f].decode("ascii").strip() for f in ["knetwk", "kstnm", "khole", "kcmpnm"]]
+    if with_depth:
+        codes.append("d" + str(round(float(header["evdp"]), 3)).replace('.','_'))
+    return ".".join(codes) + ".sac"
+
+def __write_sac_files__(directory, headers, data_list, with_depth):
+    filenames = []
+    for header, data in zip(headers, data_list):
+        filename = os.path.join(directory, sac_filename(header, with_depth))
+        write_sac(filename, header, data)
+        filenames.append(filename)
+    return filenames
+
+def write_sac_bundle(directory, headers, data_list, max_workers=1):
+    """
+    Write one SAC file per header and data array into directory. With
+    max_workers other than 1 the files are written by a thread pool, in
+    chunks of SAC_WRITE_CHUNK, None for the default number of threads.
+    Filenames are from sac_filename, with the depth if the headers have
+    more than one source depth. Returns the filenames in order.
+    """
+    data_list = list(data_list)
+    with_depth = len(numpy.unique(headers["evdp"])) > 1
+    if max_workers == 1 or len(data_list) <= SAC_WRITE_CHUNK:
+        return __write_sac_files__(directory, headers, data_list, with_depth)
+    chunks = range(0, len(data_list), SAC_WRITE_CHUNK)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(__write_sac_files__, directory,
+                                   headers[start:start+SAC_WRITE_CHUNK], data_list[start:start+SAC_WRITE_CHUNK],
+                                   with_depth)
+                   for start in chunks]
+        return [filename for future in futures for filename in future.result()]
+
+def write_results_sac(results, directory, ampStyle=AMP_STYLE_VEL, km_to_deg=1/111.19, netcode="XX",
+                      bandcode="B", gaincode="H", arrivals=None, max_workers=1):
+    """
+    Write every timeseries of results from to_time_domain as z, r and t
+    SAC files into directory, see sac_headers_for_results and
+    write_sac_bundle. Returns the filenames.
+    """
+    headers = sac_headers_for_results(results, ampStyle=ampStyle, km_to_deg=km_to_deg, netcode=netcode,
+                                      bandcode=bandcode, gaincode=gaincode, arrivals=arrivals)
+    data_list = [ts[c] for ts in results['timeseries'] for c in ["z", "r", "t"]]
+    return write_sac_bundle(directory, headers, data_list, max_workers=max_workers)
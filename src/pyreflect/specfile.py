@@ -1,6 +1,6 @@
 import struct
 import numpy
-import cmath, math
+import math
 
 # mspec file is, from fortran read statements:
 # fmin, fmax, delf, nfppts, fny, nfpts,nr,nsrc,ndep, azis
@@ -127,6 +127,36 @@ def load_specfile(filename):
                     results['timeseries'].append(timeseries)
     return results
 
+def source_spectrum_factors(freq, ampStyle=AMP_STYLE_VEL, sourceStyle=SOURCE_STYLE_STEP):
+    """
+    Factor for each frequency, 0 to nyquist, that takes raw spectra to
+    the amplitude style and source time function.
+
+    Displacement Spectrum has a factor of omeaga**2 from integration of k*dk
+      the Kennett integration is over slowenss p*dp and leaves
+      the remaining factor of omega**2 and and source time spectrum
+      to be included here,
+      Mij moment sources have omega**2 but Fk force sources only omega
+      because the point force source has 1/omega to include
+      Step Source Time Function  is 1/(-i*omega)
+      Impulse Source Time Function is 1
+    Velocity spectrum has a factor of (i*omega) * omega**2 [d/dt displ]
+    """
+    omega = numpy.arange(freq['nfpts'])*freq['delta']*2*math.pi
+    if ampStyle == AMP_STYLE_DISP and sourceStyle == SOURCE_STYLE_STEP:
+        return 1j*omega
+    elif ampStyle == AMP_STYLE_DISP and sourceStyle == SOURCE_STYLE_IMPULSE:
+        return -1.*omega*omega
+    elif ampStyle == AMP_STYLE_VEL and sourceStyle == SOURCE_STYLE_STEP:
+        return -1.*omega*omega
+    elif ampStyle == AMP_STYLE_VEL and sourceStyle == SOURCE_STYLE_IMPULSE:
+        return -1j*omega*omega*omega
+    raise ValueError(f"Dont understand amp/source style: {ampStyle} {sourceStyle}")
+
+def time_domain_scale(dt):
+    #scaleFac = 1 /(nft * dt * 4 * math.pi)
+    return -1 /( dt * 4 * math.pi) # nft taken care of in fft
+
 def to_time_domain(results, reduceVel = DEF_REDUCE_VEL, offset = DEF_OFFSET, ampStyle=AMP_STYLE_VEL, sourceStyle=SOURCE_STYLE_STEP):
     if reduceVel is None:
         reduceVel = DEF_REDUCE_VEL
@@ -145,6 +175,8 @@ def to_time_domain(results, reduceVel = DEF_REDUCE_VEL, offset = DEF_OFFSET, amp
     ifmin = round(freq['min'] / freq['delta'])
     ifmax = ifmin+inputs['frequency']['nffpts']-1
     nft =  2 * ( freq['nfpts'] - 1 )
+    fnums = numpy.arange(ifmin, ifmax+1)
+    ws = source_spectrum_factors(freq, ampStyle, sourceStyle) * time_domain_scale(dt)
     for ts in results['timeseries']:
         u0 = ts['raw']['u0'].copy()
         w0 = ts['raw']['w0'].copy()
@@ -156,51 +188,15 @@ def to_time_domain(results, reduceVel = DEF_REDUCE_VEL, offset = DEF_OFFSET, amp
 
         ts["timeReduce"] = timeReduce
 
-        for fnum in range(ifmin, ifmax+1):
-            # apply reducing vel
-            u0[fnum] *= cmath.exp( complex(0., (fnum)*reduceShift) )
-            w0[fnum] *= cmath.exp( complex(0., (fnum)*reduceShift) )
-            tn[fnum] *= cmath.exp( complex(0., (fnum)*reduceShift) )
-
-            # Displacement Spectrum has a factor of omeaga**2 from integration of k*dk
-            #   the Kennett integration is over slowenss p*dp and leaves
-            #   the remaining factor of omega**2 and and source time spectrum
-            #   to be included here,
-            #   Mij moment sources have omega**2 but Fk force sources only omega
-            #   because the point force source has 1/omega to include
-            #   Step Source Time Function  is 1/(-i*omega)
-            #   Impulse Source Time Function is 1
-            # Velocity spectrum has a factor of (i*omega) * omega**2 [d/dt displ]
-        twopi = 2* math.pi
-        for i in range(freq['nfpts']):
-            fr = (i)*freq['delta']
-            if ampStyle == AMP_STYLE_DISP and sourceStyle == SOURCE_STYLE_STEP:
-          	    ws = 1j * fr * 2 * math.pi
-          	    wsf = 1j
-            elif ampStyle == AMP_STYLE_DISP and sourceStyle == SOURCE_STYLE_IMPULSE:
-          	    ws = -1.*fr*twopi*fr*2 * math.pi
-          	    wsf = -1.*fr*twopi
-            elif ampStyle == AMP_STYLE_VEL and sourceStyle == SOURCE_STYLE_STEP:
-          	    ws = -1.*fr*2 * math.pi*fr*2 * math.pi
-          	    wsf = -1.*fr*2 * math.pi
-            elif ampStyle == AMP_STYLE_VEL and sourceStyle == SOURCE_STYLE_IMPULSE:
-          	    ws = -1j *fr*2 * math.pi*fr*2 * math.pi*fr*2 * math.pi
-          	    wsf = -1j *fr*2 * math.pi*fr*2 * math.pi
-            else:
-                raise Error(f"Dont understand amp/source style: {ampStyle} {sourceStyle}")
-            u0[i] *= ws
-            w0[i] *= ws
-            tn[i] *= ws
-
-            u0_td = numpy.fft.irfft(u0, nft)
-            w0_td = numpy.fft.irfft(w0, nft)
-            tn_td = numpy.fft.irfft(tn, nft)
-
-            #scaleFac = 1 /(nft * dt * 4 * math.pi)
-            scaleFac = -1 /( dt * 4 * math.pi) # nft taken care of in fft
-            ts['z'] = u0_td * scaleFac
-            ts['r'] = w0_td * scaleFac
-            ts['t'] = tn_td * scaleFac
+        # apply reducing vel
+        reduce_phase = numpy.exp(1j*fnums*reduceShift)
+        u0[ifmin:ifmax+1] *= reduce_phase
+        w0[ifmin:ifmax+1] *= reduce_phase
+        tn[ifmin:ifmax+1] *= reduce_phase
+
+        ts['z'] = numpy.fft.irfft(u0*ws, nft)
+        ts['r'] = numpy.fft.irfft(w0*ws, nft)
+        ts['t'] = numpy.fft.irfft(tn*ws, nft)
     return results
 
 def readSpecFile(filename, reduceVel = DEF_REDUCE_VEL, offset = -10.0, ampStyle=AMP_STYLE_VEL, sourceStyle=SOURCE_STYLE_STEP):
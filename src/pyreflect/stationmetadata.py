@@ -1,4 +1,5 @@
 from datetime import datetime, tzinfo, timezone
+from io import StringIO
 from .momenttensor import moment_scale_factor
 from .specfile import AMP_STYLE_DISP, AMP_STYLE_VEL
 
@@ -113,11 +114,11 @@ def create_metadata(network, station, loccode, bandcode, gaincode, model, scalar
       "lat": station.latitude,
       "lon": station.longitude,
       "sitename": station.site.name,
-      "radialaz": model.distance['azimuth'],
-      "transverseaz": (model.distance['azimuth']+90) % 360,
+      "radialaz": model.peek('distance')['azimuth'],
+      "transverseaz": (model.peek('distance')['azimuth']+90) % 360,
       "gain": 1/moment_scale_factor(scalar_moment_N_m),
       "inputunits": inputunits,
-      "sps": model.frequency['nyquist']
+      "sps": model.peek('frequency')['nyquist']
     }
     return emptyStationXML.format(**data).strip()
 
@@ -126,40 +127,141 @@ def create_stacode_for_dist(dist_km):
     return str(round(deg, 2)).replace('.','_')
 
 def create_fake_metadata(model, loccode, bandcode, gaincode, ampStyle=AMP_STYLE_VEL, inventory=None):
-    network_code="XX"
-    gain=1.0
+    distList = model.list_distances()
+    if len(distList) == 0:
+        return None
+    out = StringIO()
+    write_fake_stationxml(out, distList, [loccode], bandcode, gaincode, model.peek('frequency')['nyquist'],
+                          azimuths=[model.peek('distance')['azimuth']], ampStyle=ampStyle)
+    return out.getvalue()
+
+def __split_stationxml_template__():
+    """
+    Split emptyStationXML into header, station start, channels, station end
+    and footer, so a document with many stations is the header once, then
+    per station the start, the channels for each location code and the end,
+    then the footer.
+    """
+    text = emptyStationXML.strip()
+    station_start = text.index("        <Station ")
+    channel_start = text.index("            <Channel ")
+    station_end = text.index("        </Station>")
+    footer_start = text.index("    </Network>")
+    return (text[:station_start], text[station_start:channel_start], text[channel_start:station_end],
+            text[station_end:footer_start], text[footer_start:])
+
+STATIONXML_HEADER, STATIONXML_STATION_START, STATIONXML_CHANNELS, STATIONXML_STATION_END, \
+        STATIONXML_FOOTER = __split_stationxml_template__()
+STATION_FIELDS = ["stacode", "lat", "lon", "sitename"]
+
+def create_stacode_for_dist_az(dist_km, azimuth):
+    return f"{create_stacode_for_dist(dist_km)}_{str(azimuth).replace('.','_')}"
+
+def write_fake_stationxml(outfile, distances_km, loccodes, bandcode, gaincode, sps, azimuths=(0.0,),
+                          ampStyle=AMP_STYLE_VEL, network_code="XX", gain=1.0):
+    """
+    Stream fake StationXML to a file like object, one station for each
+    distance and azimuth, each with Z, R and T channels for every location
+    code, for example one per mechanism. The header and footer are written
+    once and each station is formatted from a template with everything but
+    the station values already filled in. With more than one azimuth, the
+    azimuth is appended to the station code, see create_stacode_for_dist_az.
+    """
     inputunits = "m/s"
     if ampStyle == AMP_STYLE_DISP:
         inputunits = "m"
-    distList = model.list_distances()
-    fakeXml = None
-    for dist_km in distList:
+    data = {
+      "netcode": network_code,
+      "bandcode": bandcode,
+      "gaincode": gaincode,
+      "now": datetime.utcnow(),
+      "start": "1900-01-01T00:00:00",
+      "gain": gain,
+      "inputunits": inputunits,
+      "sps": sps,
+    }
+    # leave per station values as format fields
+    keep = {key: "{"+key+"}" for key in STATION_FIELDS}
+    outfile.write(STATIONXML_HEADER.format(**data))
+    for azimuth in azimuths:
+        channels = "".join(STATIONXML_CHANNELS.format(**data, **keep, loccode=loccode, radialaz=azimuth,
+                                                      transverseaz=(azimuth+90) % 360)
+                           for loccode in loccodes)
+        station_template = STATIONXML_STATION_START.format(**data, **keep)+channels+STATIONXML_STATION_END
+        for dist_km in distances_km:
+            deg = dist_km/111.19
+            if len(azimuths) > 1:
+                stacode = create_stacode_for_dist_az(dist_km, azimuth)
+            else:
+                stacode = create_stacode_for_dist(dist_km)
+            outfile.write(station_template.format(stacode=stacode, lat=0.0, lon=deg, sitename=f"fake {deg} deg"))
+    outfile.write(STATIONXML_FOOTER)
+
+CHANNEL_ORIENTATIONS = ["Z", "R", "T"]
+
+def create_fake_inventory(model, loccode, bandcode, gaincode, ampStyle=AMP_STYLE_VEL, network_code="XX"):
+    """
+    Same inventory as reading create_fake_metadata with obspy, but the
+    obspy Inventory, Network, Station and Channel objects are created
+    directly instead of generating and parsing StationXML.
+    """
+    from obspy import UTCDateTime
+    from obspy.core.inventory import Inventory, Network, Station, Channel, Site, Response, \
+            InstrumentSensitivity
+    gain = 1.0
+    inputunits = "m/s"
+    if ampStyle == AMP_STYLE_DISP:
+        inputunits = "m"
+    start = UTCDateTime("1900-01-01T00:00:00")
+    azimuths = {
+        "Z": (0.0, -90.0),
+        "R": (model.peek('distance')['azimuth'], 0.0),
+        "T": ((model.peek('distance')['azimuth']+90) % 360, 0.0),
+    }
+    sps = model.peek('frequency')['nyquist']
+    stations = []
+    for dist_km in model.list_distances():
         deg = dist_km/111.19
-        station_code = create_stacode_for_dist(dist_km)
-        data = {
-          "netcode": network_code,
-          "stacode": station_code,
-          "loccode": loccode,
-          "bandcode": bandcode,
-          "gaincode": gaincode,
-          "now": datetime.utcnow(),
-          "start": "1900-01-01T00:00:00",
-          "lat": 0.0,
-          "lon": deg,
-          "sitename": f"fake {deg} deg",
-          "radialaz": model.distance['azimuth'],
-          "transverseaz": (model.distance['azimuth']+90) % 360,
-          "gain": gain,
-          "inputunits": inputunits,
-          "sps": model.frequency['nyquist']
-        }
-        if fakeXml is None:
-            fakeXml = emptyStationXML.format(**data).strip()
-        else:
-            lines = fakeXml.split('\n')
-            lines = lines[:-2]
-            currlines = emptyStationXML.format(**data).strip().split('\n')
-            currlines = currlines[6:]
-            lines.extend(currlines)
-            fakeXml = "\n".join(lines)
-    return fakeXml
+        channels = []
+        for orient in CHANNEL_ORIENTATIONS:
+            azimuth, dip = azimuths[orient]
+            sensitivity = InstrumentSensitivity(gain, 0.0, inputunits, "counts",
+                                                output_units_description="Digital Counts")
+            channels.append(Channel(f"{bandcode}{gaincode}{orient}", loccode, 0.0, deg, 0.0, 0.0,
+                                    azimuth=azimuth, dip=dip, types=["CONTINUOUS", "GEOPHYSICAL"],
+                                    sample_rate=sps, start_date=start,
+                                    response=Response(instrument_sensitivity=sensitivity)))
+        stations.append(Station(create_stacode_for_dist(dist_km), 0.0, deg, 0.0, channels=channels,
+                                site=Site(name=f"fake {deg} deg"), start_date=start))
+    network = Network(network_code, stations=stations, start_date=start)
+    return Inventory(networks=[network], source="mgenkennett", sender="pyreflect",
+                     created=UTCDateTime(datetime.utcnow()))
+
+def combine_inventory(inv, to_add):
+    """
+    Add the networks, stations and channels of to_add that are not already
+    in inv, matching by network, station, location and channel code.
+    Modifies and returns inv, or returns to_add if inv is None.
+    """
+    if inv is None:
+        return to_add
+    networks = {n.code: n for n in inv}
+    for add_n in to_add:
+        inv_n = networks.get(add_n.code)
+        if inv_n is None:
+            inv.networks.append(add_n)
+            networks[add_n.code] = add_n
+            continue
+        stations = {s.code: s for s in inv_n}
+        for add_s in add_n:
+            inv_s = stations.get(add_s.code)
+            if inv_s is None:
+                inv_n.stations.append(add_s)
+                stations[add_s.code] = add_s
+                continue
+            channels = {(c.location_code, c.code) for c in inv_s}
+            for c in add_s:
+                if (c.location_code, c.code) not in channels:
+                    inv_s.channels.append(c)
+                    channels.add((c.location_code, c.code))
+    return inv
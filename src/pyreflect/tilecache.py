@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+import numpy
+from .earthmodel import EarthModel
+from .velocitymodel import AK135F, layers_from_model, layers_as_arrays, layers_from_arrays, \
+        LAYER_COLUMNS, crustone_cell, crustone_cell_center, CRUSTONE_NUM_LON, \
+        CRUSTONE_NUM_LAT
+from .crustonecache import cache_dir
+
+#
+# On disk store of finished regional models, ie Crust1.0 modified,
+# gradients evaluated and earth flattened, keyed by the base model,
+# Crust1.0 cell and the parameters used to build them. Each tile is a
+# small .npz of the layer arrays, the index.json lists the tiles and
+# least recently used tiles are evicted, using file modification time
+# as the access time so several processes can share a store. The index is
+# advisory, a listing of the tiles for tools, lookups and eviction only use
+# the tile files, so a tile written by another process is found even if
+# this index does not have it.
+#
+
+DEFAULT_MAX_TILES = 20000
+INDEX_FILENAME = "index.json"
+TILE_SUFFIX = ".npz"
+
+def tile_key(base_model, row, col, maxdepth, gradientthick, eftthick, vp_factor, vs_factor):
+    return {
+        "base_model": base_model,
+        "row": int(row),
+        "col": int(col),
+        "maxdepth": float(maxdepth),
+        "gradientthick": float(gradientthick),
+        "eftthick": float(eftthick),
+        "vp_factor": float(vp_factor),
+        "vs_factor": float(vs_factor),
+    }
+
+def tile_name(key):
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+def build_tile_model(key):
+    """
+    Build the finished model for a tile: base model to maxdepth, Crust1.0
+    at the cell center, gradients evaluated then earth flattened.
+    """
+    model = EarthModel()
+    model.__set_owned__("layers", layers_from_model(key["base_model"], key["maxdepth"]))
+    model.name = f"{key['base_model']} to {key['maxdepth']}"
+    model.gradientthick = key["gradientthick"]
+    model.eftthick = key["eftthick"]
+    lat, lon = crustone_cell_center(key["row"], key["col"])
+    model = model.crustone(lat, lon).evalGradients()
+    return model.eft(vp_factor=key["vp_factor"], vs_factor=key["vs_factor"])
+
+def region_columns(lon_min, lon_max):
+    """
+    Crust1.0 columns of the cells overlapping the longitudes from lon_min
+    east to lon_max, crossing the dateline if lon_min > lon_max.
+    """
+    if lon_max < lon_min:
+        lon_max += 360.0
+    # a max edge on a cell boundary does not pull in the next cell
+    col_min = int(numpy.floor(lon_min + 180.0))
+    col_max = max(col_min, int(numpy.ceil(lon_max + 180.0)) - 1)
+    num = min(col_max-col_min+1, CRUSTONE_NUM_LON)
+    return [(col_min+idx) % CRUSTONE_NUM_LON for idx in range(num)]
+
+class TileStore:
+    def __init__(self, directory=None, max_tiles=DEFAULT_MAX_TILES):
+        if directory is None:
+            directory = os.path.join(cache_dir(), "tiles")
+        self.directory = directory
+        self.max_tiles = max_tiles
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = self.load_index()
+
+    def tile_path(self, name):
+        return os.path.join(self.directory, name+TILE_SUFFIX)
+
+    def load_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILENAME)
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def write_index(self):
+        fd, tmp_path = tempfile.mkstemp(prefix=".index-", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.directory, INDEX_FILENAME))
+
+    def rebuild_index(self):
+        """Recreate the index from the tile files, for example after concurrent writers."""
+        self.index = {}
+        for filename in os.listdir(self.directory):
+            # skip temporary files of writers, .tile-*.npz
+            if filename.endswith(TILE_SUFFIX) and not filename.startswith("."):
+                with numpy.load(os.path.join(self.directory, filename)) as data:
+                    self.index[filename[:-len(TILE_SUFFIX)]] = json.loads(str(data["header"]))
+        self.write_index()
+
+    def get(self, key):
+        """
+        Model for key, or None if not in the store. Looks for the tile file,
+        not in the index, see the comment at the top.
+        """
+        path = self.tile_path(tile_name(key))
+        try:
+            with numpy.load(path) as data:
+                header = json.loads(str(data["header"]))
+                arrays = {k: data[k] for k in LAYER_COLUMNS+["type"]}
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        model = EarthModel()
+        model.__set_owned__("layers", layers_from_arrays(arrays))
+        model.name = header["name"]
+        model.gradientthick = header["key"]["gradientthick"]
+        model.eftthick = header["key"]["eftthick"]
+        model.isEFT = True
+        model.vp_factor = header["key"]["vp_factor"]
+        model.vs_factor = header["key"]["vs_factor"]
+        model.__set_owned__("extra", dict(model.peek("extra"), elevation=header["elevation"]))
+        return model
+
+    def put(self, key, model, update_index=True):
+        """
+        Store the tile for key. Unless update_index is false, evicts tiles
+        beyond max_tiles and writes the index, callers storing many tiles
+        should do that once at the end with update_index().
+        """
+        name = tile_name(key)
+        header = {
+            "key": key,
+            "name": model.name,
+            "elevation": model.peek("extra")["elevation"],
+            "numlayers": len(model.peek_layers()),
+        }
+        arrays = layers_as_arrays(model.peek_layers())
+        fd, tmp_path = tempfile.mkstemp(prefix=".tile-", suffix=TILE_SUFFIX, dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            numpy.savez(f, header=json.dumps(header), **arrays)
+        os.replace(tmp_path, self.tile_path(name))
+        self.index[name] = header
+        if update_index:
+            self.update_index()
+
+    def update_index(self):
+        self.evict()
+        self.write_index()
+
+    def evict(self):
+        """Remove least recently used tiles beyond max_tiles."""
+        tiles = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(TILE_SUFFIX) and not filename.startswith("."):
+                path = os.path.join(self.directory, filename)
+                tiles.append((os.stat(path).st_mtime_ns, filename))
+        if len(tiles) <= self.max_tiles:
+            return
+        tiles.sort()
+        for mtime, filename in tiles[:len(tiles)-self.max_tiles]:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+            self.index.pop(filename[:-len(TILE_SUFFIX)], None)
+
+    def get_model(self, lat, lon, base_model=AK135F, maxdepth=800, gradientthick=10, eftthick=5,
+                  vp_factor=0.05, vs_factor=0.05):
+        """
+        Finished model for the Crust1.0 cell containing lat/lon, built and
+        stored if not already in the store.
+        """
+        row, col = crustone_cell(lat, lon)
+        key = tile_key(base_model, row, col, maxdepth, gradientthick, eftthick, vp_factor, vs_factor)
+        model = self.get(key)
+        if model is None:
+            model = build_tile_model(key)
+            self.put(key, model)
+        return model
+
+    def warm_region(self, lat_min, lat_max, lon_min, lon_max, base_model=AK135F, maxdepth=800,
+                    gradientthick=10, eftthick=5, vp_factor=0.05, vs_factor=0.05):
+        """
+        Build all tiles for cells overlapping the region, which crosses the
+        dateline if lon_min > lon_max. Returns the number of tiles built,
+        cells already in the store are skipped. Eviction and the index
+        update are done once, after all tiles are stored.
+        """
+        # a min lat edge on a cell boundary does not pull in the next cell
+        row_min = crustone_cell(lat_max, 0.0)[0]
+        row_max = max(row_min, min(int(numpy.ceil(90.0 - lat_min)) - 1, CRUSTONE_NUM_LAT-1))
+        columns = region_columns(lon_min, lon_max)
+        built = 0
+        try:
+            for row in range(int(row_min), int(row_max)+1):
+                for col in columns:
+                    key = tile_key(base_model, row, col, maxdepth, gradientthick, eftthick, vp_factor, vs_factor)
+                    if not os.path.exists(self.tile_path(tile_name(key))):
+                        self.put(key, build_tile_model(key), update_index=False)
+                        built += 1
+        finally:
+            if built > 0:
+                self.update_index()
+        return built
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyreflect.tilecache",
+                                     description="Prebuild regional model tiles")
+    parser.add_argument("command", choices=["warm", "reindex"])
+    parser.add_argument("--lat", nargs=2, type=float, metavar=("MIN", "MAX"), default=[-90, 90])
+    parser.add_argument("--lon", nargs=2, type=float, metavar=("MIN", "MAX"), default=[-180, 180])
+    parser.add_argument("--base", default=AK135F, help="base model name")
+    parser.add_argument("--maxdepth", type=float, default=800)
+    parser.add_argument("--gradientthick", type=float, default=10)
+    parser.add_argument("--eftthick", type=float, default=5)
+    parser.add_argument("--vp-factor", type=float, default=0.05)
+    parser.add_argument("--vs-factor", type=float, default=0.05)
+    parser.add_argument("--dir", default=None, help="tile store directory")
+    parser.add_argument("--max-tiles", type=int, default=DEFAULT_MAX_TILES)
+    args = parser.parse_args(argv)
+    store = TileStore(args.dir, max_tiles=args.max_tiles)
+    if args.command == "reindex":
+        store.rebuild_index()
+        print(f"{len(store.index)} tiles in {store.directory}")
+        return 0
+    built = store.warm_region(args.lat[0], args.lat[1], args.lon[0], args.lon[1],
+                              base_model=args.base, maxdepth=args.maxdepth,
+                              gradientthick=args.gradientthick, eftthick=args.eftthick,
+                              vp_factor=args.vp_factor, vs_factor=args.vs_factor)
+    print(f"built {built} tiles in {store.directory}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
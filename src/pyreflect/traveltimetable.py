@@ -0,0 +1,305 @@
+import math
+import numpy
+
+#
+# Travel time tables, each phase is evaluated with TauP once per node of a
+# (source depth, distance) grid and travel times for many traces are then
+# interpolated from the grid in one vectorized operation, cubic Hermite in
+# distance using the ray parameter as the slope of the travel time curve,
+# and linear in depth. Arrivals of the
+# same phase are numbered in time order into branches, and where the grid
+# nodes around a point do not all have the same number of arrivals for a
+# phase, for example near a triplication or where a phase starts or ends,
+# interpolation of that phase is not valid and the exact TauP value of only
+# that phase is used instead.
+# Each distance cell is checked against exact TauP at its center, and cells
+# where the error of a phase is too large, for example from a triplication
+# that starts and ends between nodes, also use exact TauP for that phase.
+#
+# Most of the work of a TauP call is shooting rays to refine each arrival,
+# and creating the phases for the source depth is most of the rest, so the
+# phases are created once per depth, see depth_phases, and reused for every
+# distance at that depth.
+#
+
+DEFAULT_TABLE_DELTA = 1.0 # degrees, distance grid spacing
+DEFAULT_MAX_ERROR = 0.01 # seconds, allowed interpolation error
+
+def depth_phases(taupymodel, phase_list, depth):
+    """
+    TauP phases of phase_list for a source depth, in km, keyed by phase
+    name, for phase_arrivals at any number of distances.
+    """
+    from obspy.taup.taup_time import TauPTime
+    calc = TauPTime(taupymodel.model, phase_list, depth, None)
+    calc.depth_correct(depth)
+    calc.recalc_phases()
+    return {phase.name: phase for phase in calc.phases}
+
+def phase_arrivals(phases, distance, names=None):
+    """
+    TauP arrivals at distance, in degrees, of the phases from depth_phases,
+    or only those in names, in time order, same as get_travel_times.
+    """
+    arrivals = []
+    for name, phase in phases.items():
+        if names is None or name in names:
+            arrivals += phase.calc_time(distance)
+    return sorted(arrivals, key=lambda a: a.time)
+
+def exact_travel_times(taupymodel, phase_list, depth, distance, phase_cache=None, names=None):
+    """
+    Arrivals from TauP as a time ordered list of (name, time), of all of
+    phase_list or only the phases in names. phase_cache is an optional dict
+    to keep the phases of each depth between calls with the same phase_list.
+    """
+    if phase_cache is None:
+        phase_cache = {}
+    if depth not in phase_cache:
+        phase_cache[depth] = depth_phases(taupymodel, phase_list, depth)
+    return [(a.name, float(a.time)) for a in phase_arrivals(phase_cache[depth], distance, names)]
+
+def build_travel_time_table(taupymodel, phase_list, depths, distances, phase_cache=None):
+    """
+    Evaluate phase_list at every node of the depth (km) by distance
+    (degrees) grid. Returns a dict with the sorted grid "depths" and
+    "distances", "counts", the number of arrivals of each phase name at
+    each node, and "times" and "ray_params", in seconds per degree, keyed
+    by (name, branch), of shape (num depths, num distances) with nan where
+    the branch does not exist.
+    """
+    if phase_cache is None:
+        phase_cache = {}
+    depths = numpy.unique(numpy.asarray(depths, dtype=float))
+    distances = numpy.unique(numpy.asarray(distances, dtype=float))
+    shape = (len(depths), len(distances))
+    counts = {}
+    times = {}
+    ray_params = {}
+    for d_idx, depth in enumerate(depths.tolist()):
+        if depth not in phase_cache:
+            phase_cache[depth] = depth_phases(taupymodel, phase_list, depth)
+        phases = phase_cache[depth]
+        for name in phases:
+            if name not in counts:
+                counts[name] = numpy.zeros(shape, dtype=int)
+        for x_idx, distance in enumerate(distances.tolist()):
+            branch_num = {}
+            for a in phase_arrivals(phases, distance):
+                branch = branch_num.get(a.name, 0)
+                branch_num[a.name] = branch+1
+                if (a.name, branch) not in times:
+                    times[(a.name, branch)] = numpy.full(shape, numpy.nan)
+                    ray_params[(a.name, branch)] = numpy.full(shape, numpy.nan)
+                times[(a.name, branch)][d_idx, x_idx] = a.time
+                # ray_param is seconds per radian, sign is direction in distance
+                ray_params[(a.name, branch)][d_idx, x_idx] = a.ray_param*math.pi/180*__distance_sign__(a)
+            for name, num in branch_num.items():
+                counts[name][d_idx, x_idx] = num
+    return {
+        "phase_list": list(phase_list),
+        "depths": depths,
+        "distances": distances,
+        "counts": counts,
+        "times": times,
+        "ray_params": ray_params,
+    }
+
+def __distance_sign__(arrival):
+    """
+    Slope of travel time with distance has the sign of the ray parameter if
+    the purist distance, modulo 360, is the requested distance and is the
+    opposite for rays that arrive going the long way around, ie 360-distance.
+    """
+    purist = arrival.purist_distance % 360
+    if abs(purist - arrival.distance % 360) <= abs((360-purist) - arrival.distance % 360):
+        return 1.0
+    return -1.0
+
+def __grid_cell__(grid, values):
+    """
+    Lower and upper grid index and weight of the upper for each value. Values
+    on a node use only that node, and inside is false for values off the grid.
+    """
+    lower = numpy.clip(numpy.searchsorted(grid, values, side="right")-1, 0, len(grid)-1)
+    upper = numpy.minimum(lower+1, len(grid)-1)
+    span = grid[upper]-grid[lower]
+    weight = numpy.zeros(values.shape)
+    numpy.divide(values-grid[lower], span, out=weight, where=span > 0)
+    upper = numpy.where(weight > 0, upper, lower)
+    inside = (values >= grid[0]) & (values <= grid[-1])
+    return lower, upper, weight, inside
+
+def interpolate_travel_times(table, depths, distances):
+    """
+    Interpolation of every branch in the table at all points at once,
+    cubic Hermite in distance and linear in depth. Returns a dict of phase
+    name to boolean array, true where interpolation of the phase is valid,
+    ie the point is inside the grid, the phase has the same number of
+    arrivals at all surrounding nodes and the cell is not marked for the
+    phase by check_travel_time_table, and a dict of (name, branch) to
+    interpolated times, nan where the branch does not exist.
+    """
+    depths = numpy.atleast_1d(numpy.asarray(depths, dtype=float))
+    distances = numpy.atleast_1d(numpy.asarray(distances, dtype=float))
+    d0, d1, d_w, d_inside = __grid_cell__(table["depths"], depths)
+    x0, x1, x_w, x_inside = __grid_cell__(table["distances"], distances)
+    inside = d_inside & x_inside
+    on_node = x_w == 0
+    valid = {}
+    for name, counts in table["counts"].items():
+        c = counts[d0, x0]
+        valid[name] = inside & (counts[d0, x1] == c) & (counts[d1, x0] == c) & (counts[d1, x1] == c)
+        if "exact_cells" in table and table["exact_cells"][name].shape[1] > 0:
+            exact_cells = table["exact_cells"][name]
+            cell = numpy.minimum(x0, exact_cells.shape[1]-1)
+            valid[name] &= on_node | ~(exact_cells[d0, cell] | exact_cells[d1, cell])
+    # Hermite basis, using the ray parameters as slopes
+    h = table["distances"][x1]-table["distances"][x0]
+    w2 = x_w*x_w
+    w3 = w2*x_w
+    h00 = 2*w3-3*w2+1
+    h10 = (w3-2*w2+x_w)*h
+    h01 = -2*w3+3*w2
+    h11 = (w3-w2)*h
+    out = {}
+    for branch, times in table["times"].items():
+        slopes = table["ray_params"][branch]
+        top = h00*times[d0, x0] + h10*slopes[d0, x0] + h01*times[d0, x1] + h11*slopes[d0, x1]
+        bot = h00*times[d1, x0] + h10*slopes[d1, x0] + h01*times[d1, x1] + h11*slopes[d1, x1]
+        out[branch] = top + d_w*(bot-top)
+    return valid, out
+
+def __interpolated_arrivals__(table, depths, distances):
+    """
+    Per point, the time ordered (name, time) interpolated arrivals of the
+    phases where interpolation is valid, and the names of the other phases.
+    """
+    valid, interp = interpolate_travel_times(table, depths, distances)
+    names = list(valid.keys())
+    branches = list(interp.keys())
+    if len(names) > 0:
+        name_valid = numpy.vstack([valid[name] for name in names])
+    else:
+        name_valid = numpy.empty((0, len(depths)), dtype=bool)
+    if len(branches) > 0:
+        branch_times = numpy.vstack([interp[b] for b in branches])
+        branch_name = numpy.array([names.index(b[0]) for b in branches])
+    else:
+        branch_times = numpy.empty((0, len(depths)))
+        branch_name = numpy.empty(0, dtype=int)
+    out = []
+    for idx in range(len(depths)):
+        is_valid = name_valid[:, idx]
+        times = branch_times[:, idx]
+        found = numpy.flatnonzero(~numpy.isnan(times) & is_valid[branch_name])
+        arrivals = sorted(zip(times[found].tolist(), [branches[b][0] for b in found.tolist()]))
+        out.append(([(name, time) for time, name in arrivals],
+                    [names[n] for n in numpy.flatnonzero(~is_valid).tolist()]))
+    return out
+
+def lookup_travel_times(table, depths, distances, taupymodel=None, phase_cache=None):
+    """
+    Arrivals at each point as a time ordered list of (name, time), same
+    as exact_travel_times, interpolated from the table. Phases that can
+    not be interpolated at a point use exact TauP if taupymodel is given,
+    and the point is None otherwise.
+    """
+    depths = numpy.atleast_1d(numpy.asarray(depths, dtype=float))
+    distances = numpy.atleast_1d(numpy.asarray(distances, dtype=float))
+    out = []
+    for idx, (arrivals, not_valid) in enumerate(__interpolated_arrivals__(table, depths, distances)):
+        if len(not_valid) == 0:
+            out.append(arrivals)
+        elif taupymodel is not None:
+            arrivals += exact_travel_times(taupymodel, table["phase_list"], float(depths[idx]),
+                                           float(distances[idx]), phase_cache=phase_cache, names=not_valid)
+            out.append([(name, time) for time, name in sorted((time, name) for name, time in arrivals)])
+        else:
+            out.append(None)
+    return out
+
+def travel_time_error(expected, actual):
+    """
+    Largest time difference between two time ordered arrival lists, inf
+    if they do not have the same phases.
+    """
+    if actual is None or len(expected) != len(actual):
+        return numpy.inf
+    err = 0.0
+    for (e_name, e_time), (a_name, a_time) in zip(sorted(expected), sorted(actual)):
+        if e_name != a_name:
+            return numpy.inf
+        err = max(err, abs(e_time-a_time))
+    return err
+
+def check_travel_time_table(table, taupymodel, max_error=DEFAULT_MAX_ERROR, phase_cache=None):
+    """
+    Compare interpolated and exact TauP travel times of each phase at the
+    center of each distance cell at each grid depth, where interpolation
+    errors are largest. Cells where the error of a phase is more than
+    max_error, including where the exact and interpolated arrivals are not
+    the same in number, and their neighbors are marked in
+    table["exact_cells"][name] so lookups in them use exact TauP for that
+    phase. Returns a dict of phase name to errors, of shape
+    (num depths, num distances-1), nan where interpolation is not valid
+    anyway.
+    """
+    grid_x = table["distances"]
+    centers = (grid_x[:-1]+grid_x[1:])/2
+    depths = numpy.repeat(table["depths"], len(centers))
+    distances = numpy.tile(centers, len(table["depths"]))
+    table.pop("exact_cells", None)
+    errors = {name: numpy.full(len(depths), numpy.nan) for name in table["counts"]}
+    for idx, (arrivals, not_valid) in enumerate(__interpolated_arrivals__(table, depths, distances)):
+        names = [name for name in table["counts"] if name not in not_valid]
+        if len(names) == 0:
+            continue
+        exact = exact_travel_times(taupymodel, table["phase_list"], float(depths[idx]), float(distances[idx]),
+                                   phase_cache=phase_cache, names=names)
+        for name in names:
+            errors[name][idx] = travel_time_error([a for a in exact if a[0] == name],
+                                                  [a for a in arrivals if a[0] == name])
+    table["exact_cells"] = {}
+    for name in errors:
+        errors[name] = errors[name].reshape((len(table["depths"]), len(centers)))
+        # arrivals change between nodes near where they change at nodes, so
+        # cells next to a failed or not valid cell also use exact TauP
+        bad = ~(errors[name] <= max_error)
+        exact_cells = bad.copy()
+        exact_cells[:, 1:] |= bad[:, :-1]
+        exact_cells[:, :-1] |= bad[:, 1:]
+        table["exact_cells"][name] = exact_cells
+    return errors
+
+def travel_times_for_points(taupymodel, phase_list, depths, distances,
+                            table_delta=DEFAULT_TABLE_DELTA, max_error=DEFAULT_MAX_ERROR):
+    """
+    Arrivals, as from exact_travel_times, for many depth (km), distance
+    (degrees) points, for example all traces in a result. Duplicate points
+    are only evaluated once, and the TauP phases only once per depth. If
+    the distances need more TauP calls than a table with spacing
+    table_delta plus the check of each cell, the table is built, checked
+    with check_travel_time_table and used to interpolate the points,
+    otherwise, or if table_delta is None, exact TauP is used for each
+    distinct point.
+    """
+    depths = numpy.atleast_1d(numpy.asarray(depths, dtype=float))
+    distances = numpy.atleast_1d(numpy.asarray(distances, dtype=float))
+    points, point_idx = numpy.unique(numpy.column_stack((depths, distances)), axis=0, return_inverse=True)
+    point_idx = point_idx.ravel()
+    unique_depths = numpy.unique(depths)
+    phase_cache = {}
+    arrivals = None
+    if table_delta is not None and len(points) > 0:
+        num_grid = int(numpy.ceil((distances.max()-distances.min())/table_delta))+1
+        if len(unique_depths)*(2*num_grid-1) < len(points):
+            grid = numpy.linspace(distances.min(), distances.max(), num_grid)
+            table = build_travel_time_table(taupymodel, phase_list, unique_depths, grid, phase_cache=phase_cache)
+            check_travel_time_table(table, taupymodel, max_error=max_error, phase_cache=phase_cache)
+            arrivals = lookup_travel_times(table, points[:, 0], points[:, 1], taupymodel=taupymodel,
+                                           phase_cache=phase_cache)
+    if arrivals is None:
+        arrivals = [exact_travel_times(taupymodel, phase_list, depth, distance, phase_cache=phase_cache)
+                    for depth, distance in points.tolist()]
+    return [arrivals[idx] for idx in point_idx.tolist()]
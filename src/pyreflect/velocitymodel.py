@@ -2,15 +2,31 @@ import pkgutil
 import math
 import copy
 import os
-try:
-    import crustone
-    crustone_ok = True
-except ImportError:
-    # crustone not installed
-    crustone_ok = False
+import re
+import itertools
+import functools
+import importlib.util
+from io import StringIO
+import numpy
+
+# crustone is only imported when Crust1.0 is loaded, crustone_ok and
+# crustone are resolved on first access via __getattr__
+
+@functools.lru_cache(maxsize=None)
+def crustone_available():
+    return importlib.util.find_spec("crustone") is not None
+
+def __getattr__(name):
+    if name == "crustone_ok":
+        return crustone_available()
+    if name == "crustone":
+        check_crustone_import_ok()
+        import crustone
+        return crustone
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def check_crustone_import_ok():
-    if not crustone_ok:
+    if not crustone_available():
         raise Exception("function requires crustone, but appears not to be installed, https://github.com/crotwell/crust-one")
 
 DEFAULT_QP = 1500
@@ -112,46 +128,148 @@ class VelocityModelLayer:
     def __str__(self):
         return f"{self.thick} {self.vp} {self.vs} {self.rho}"
 
-def load_nd_as_depth_points(modelname=AK135F):
-    ndtext = None
+LAYER_COLUMNS = ["thick", "vp", "vp_gradient", "vs", "vs_gradient", "rho", "rho_gradient",
+                 "qp", "qs", "tp1", "tp2", "ts1", "ts2"]
+
+def layers_as_arrays(layers):
+    """
+    Columnar form of a list of layers, a dict of numpy arrays keyed by
+    the names in LAYER_COLUMNS plus type.
+    """
+    arrays = {}
+    for key in LAYER_COLUMNS:
+        arrays[key] = numpy.array([getattr(l, key) for l in layers], dtype=float)
+    arrays["type"] = numpy.array([l.type for l in layers])
+    return arrays
+
+def layers_from_arrays(arrays):
+    """
+    Create layers from the columnar form, see layers_as_arrays. Columns other
+    than thick, vp, vs and rho are optional.
+    """
+    num = len(arrays["thick"])
+    default_layer = VelocityModelLayer(0, 0, 0, 0)
+    def column(key):
+        if key in arrays:
+            return numpy.asarray(arrays[key]).tolist()
+        return itertools.repeat(getattr(default_layer, key), num)
+    layers = []
+    for thick, vp, vs, rho, qp, qs, tp1, tp2, ts1, ts2, layer_type in zip(
+            column("thick"), column("vp"), column("vs"), column("rho"), column("qp"), column("qs"),
+            column("tp1"), column("tp2"), column("ts1"), column("ts2"), column("type")):
+        layers.append(VelocityModelLayer(thick, vp, vs, rho, qp=qp, qs=qs, tp1=tp1, tp2=tp2, ts1=ts1, ts2=ts2,
+                                         type=layer_type))
+    for key in ["vp_gradient", "vs_gradient", "rho_gradient"]:
+        if key in arrays:
+            for layer, value in zip(layers, column(key)):
+                setattr(layer, key, value)
+    return layers
+
+ND_SECTIONS = ["mantle", "outer-core", "inner-core"]
+ND_COLUMNS = ["depth", "vp", "vs", "rho", "qp", "qs"]
+# defaults for optional rho, qp, qs columns in .nd files
+ND_DEFAULTS = [None, None, None, 2.6, 1500, 600]
+
+# marker lines are matched after a newline, so parse with a leading newline
+__nd_section_re__ = re.compile(r"\n(" + "|".join(ND_SECTIONS) + r")\r?(?=\n|$)")
+
+def read_nd_text(modelname=AK135F):
+    """
+    Find the text of a .nd model, either as a local file, with or without
+    the .nd suffix, or as one of the models included in the package.
+    Returns None if the model cannot be found.
+    """
     if os.path.exists(f"{modelname}.nd"):
         with open(f"{modelname}.nd", "r") as infile:
-            ndtext = infile.read()
+            return infile.read()
     elif os.path.exists(f"{modelname}"):
         with open(f"{modelname}", "r") as infile:
-            ndtext = infile.read()
-    else:
-        nd_data = pkgutil.get_data(__name__, f"data/{modelname}.nd")
-        if nd_data is None:
-            return None
-        ndtext = nd_data.decode('ascii')
-    points = []
-    layer_type = "crust"
-    for line in ndtext.splitlines():
-        if line == "mantle" or line == "outer-core" or line == "inner-core":
-            layer_type = line
+            return infile.read()
+    nd_data = pkgutil.get_data(__name__, f"data/{modelname}.nd")
+    if nd_data is None:
+        return None
+    return nd_data.decode('ascii')
+
+def parse_nd_section(text):
+    """
+    Parse the numeric lines between section markers of a .nd file into
+    an (n, 6) array of depth, vp, vs, rho, qp, qs, filling in defaults for
+    missing optional columns.
+    """
+    if len(text.strip()) == 0:
+        return numpy.empty((0, len(ND_COLUMNS)))
+    try:
+        values = numpy.loadtxt(StringIO(text), ndmin=2)
+    except ValueError:
+        # not all lines have the same number of columns, pad line by line
+        rows = [line.split() for line in text.splitlines() if len(line.strip()) > 0]
+        values = numpy.full((len(rows), len(ND_COLUMNS)), numpy.nan)
+        for idx, row in enumerate(rows):
+            values[idx, :len(row)] = [float(x) for x in row[:len(ND_COLUMNS)]]
+    ncols = min(values.shape[1], len(ND_COLUMNS))
+    if ncols < 3:
+        raise ValueError(f"nd lines must have at least depth, vp and vs, found {ncols} columns")
+    out = numpy.empty((values.shape[0], len(ND_COLUMNS)))
+    out[:, :ncols] = values[:, :ncols]
+    for col in range(3, len(ND_COLUMNS)):
+        if col >= ncols:
+            out[:, col] = ND_DEFAULTS[col]
         else:
-            line_items = line.split()
-            depth = float(line_items[0])
-            vp = float(line_items[1])
-            vs = float(line_items[2])
-            rho = 2.6
-            if len(line_items)>3:
-                rho = float(line_items[3])
-            qp = 1500
-            if len(line_items)>4:
-                qp = float(line_items[4])
-            qs = 600
-            if len(line_items)>5:
-                qs = float(line_items[5])
-            p = VelocityModelPoint(depth, vp, vs)
-            p.rho = rho
-            p.qp = qp
-            p.qs = qs
-            p.type = layer_type
-            points.append(p)
+            missing = numpy.isnan(out[:, col])
+            out[missing, col] = ND_DEFAULTS[col]
+    return out
+
+def parse_nd_as_arrays(ndtext):
+    """
+    Parse .nd text into a dict of numpy arrays, one entry per depth point,
+    with keys depth, vp, vs, rho, qp, qs and type. The text is split on
+    the mantle, outer-core and inner-core markers and each section is
+    parsed in bulk.
+    """
+    pieces = __nd_section_re__.split("\n"+ndtext)
+    section_types = ["crust"] + pieces[1::2]
+    sections = [parse_nd_section(text) for text in pieces[0::2]]
+    values = numpy.concatenate(sections)
+    arrays = {}
+    for col, key in enumerate(ND_COLUMNS):
+        arrays[key] = values[:, col]
+    arrays["type"] = numpy.repeat(section_types, [len(x) for x in sections])
+    return arrays
+
+def load_nd_as_arrays(modelname=AK135F):
+    """
+    Load a .nd model as a dict of numpy arrays, see parse_nd_as_arrays.
+    Returns None if the model cannot be found.
+    """
+    ndtext = read_nd_text(modelname)
+    if ndtext is None:
+        return None
+    return parse_nd_as_arrays(ndtext)
+
+def depth_points_from_arrays(arrays):
+    points = []
+    for depth, vp, vs, rho, qp, qs, layer_type in zip(*[arrays[key].tolist() for key in ND_COLUMNS+["type"]]):
+        p = VelocityModelPoint(depth, vp, vs)
+        p.rho = rho
+        p.qp = qp
+        p.qs = qs
+        p.type = layer_type
+        points.append(p)
     return points
 
+def depth_points_as_arrays(points):
+    arrays = {}
+    for key in ND_COLUMNS:
+        arrays[key] = numpy.array([getattr(p, key) for p in points], dtype=float)
+    arrays["type"] = numpy.array([p.type for p in points])
+    return arrays
+
+def load_nd_as_depth_points(modelname=AK135F):
+    arrays = load_nd_as_arrays(modelname)
+    if arrays is None:
+        return None
+    return depth_points_from_arrays(arrays)
+
 def layers_from_depth_points(points):
     prev = points[0]
     layers = []
@@ -179,6 +297,53 @@ def save_nd(points, filename):
                 out.write(f"{p.type}\n")
             out.write(f"{round(p.depth, 6):<8} {round(p.vp, 6):<8} {round(p.vs, 6):<8} {round(p.rho, 6):<8}\n")
             prev = p
+
+def __round_nd_value__(values):
+    """
+    Same as [round(x, 6) for x in values], but skips the python round for
+    values that already have at most 6 decimal places, which is most
+    values read from .nd files. Integer arrays are returned as ints.
+    """
+    values = numpy.asarray(values)
+    if values.dtype.kind in "iub":
+        return values.astype(int).tolist()
+    values = values.astype(float, copy=False)
+    out = values.tolist()
+    needs_round = (numpy.round(values, 6) != values) | (numpy.abs(values) >= 1e9)
+    for idx in numpy.flatnonzero(needs_round).tolist():
+        out[idx] = round(out[idx], 6)
+    return out
+
+def save_nd_arrays(arrays, filename):
+    """
+    Write depth point arrays, as from load_nd_as_arrays, in .nd format.
+    Output is byte identical to save_nd for points with the same values,
+    but each section between type changes is formatted in one operation
+    and the file is written in a single call. Like save_nd, float values
+    are written as floats, 35.0, and integer arrays as ints, 35, so points
+    with int values, which depth_points_as_arrays makes float, only match
+    if those columns are passed as integer arrays.
+    """
+    types = arrays["type"]
+    num = len(types)
+    if num == 0:
+        return
+    columns = [__round_nd_value__(arrays[key]) for key in ND_COLUMNS[:4]]
+    # section marker written before a point whose type differs from previous,
+    # unless either is unknown
+    change = numpy.flatnonzero((types[1:] != types[:-1])
+                               & (types[1:] != "unknown")
+                               & (types[:-1] != "unknown")) + 1
+    bounds = [0] + change.tolist() + [num]
+    line_fmt = "%-8s %-8s %-8s %-8s\n"
+    out = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start != 0:
+            out.append(f"{types[start]}\n")
+        items = tuple(itertools.chain.from_iterable(zip(*[c[start:end] for c in columns])))
+        out.append(line_fmt*(end-start) % items)
+    with open(filename, 'w') as outfile:
+        outfile.write("".join(out))
 def shift_by_elevation(p, elevation):
     """
     Shift a depth point to account for elevation. So for a model with 2 km elevation,
@@ -273,13 +438,33 @@ def load_crustone():
     check_crustone_import_ok()
     global __c1__
     if __c1__ is None:
-        __c1__ = crustone.parse()
+        from .crustonecache import load_cached_crustone
+        __c1__ = load_cached_crustone()
     return __c1__
 
+CRUSTONE_NUM_LAT = 180
+CRUSTONE_NUM_LON = 360
+
+def crustone_cell(lats, lons):
+    """
+    Row and column of the Crust1.0 1x1 degree cell for each lat/lon,
+    row 0 is the cell from 90 to 89 north and column 0 is from 180 to 179 west,
+    same as getCN1point from the Crust1.0 distribution.
+    """
+    lats = numpy.asarray(lats, dtype=float)
+    lons = numpy.asarray(lons, dtype=float)
+    rows = numpy.clip(numpy.floor(90.0 - lats), 0, CRUSTONE_NUM_LAT-1).astype(int)
+    cols = numpy.floor(numpy.mod(lons + 180.0, 360.0)).astype(int) % CRUSTONE_NUM_LON
+    return rows, cols
+
+def crustone_cell_center(row, col):
+    return 89.5 - row, -179.5 + col
+
 def modify_crustone(layers, lat, lon):
     """
     Modifies layers to past Crust1.0 model on top in place of existing crust.
-    Returns new layers
+    Returns new layers, the mantle layers below the crust are the same
+    objects as in layers except for the top one, which is a copy.
     """
     check_crustone_import_ok()
     num_crust_layers = 0
@@ -288,6 +473,7 @@ def modify_crustone(layers, lat, lon):
         orig_crust_thick += layers[num_crust_layers].thick
         num_crust_layers += 1
     decapitate = layers[num_crust_layers:]
+    decapitate[0] = copy.copy(decapitate[0])
 
     c1 = load_crustone()
     profile = c1.find_profile(lat, lon)
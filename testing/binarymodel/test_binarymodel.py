@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# Binary models must load as the model that was written, archives must keep
+# their index in step with appended records, and stale indexes or damaged
+# records must not load silently. Run with pytest or directly.
+#
+import os
+import sys
+import tempfile
+import numpy
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel
+from pyreflect.binarymodel import ModelArchive, INDEX_SUFFIX, write_binary_model, load_binary_model
+
+def make_model(vp):
+    model = EarthModel.loadAk135f(100)
+    model.name = f"vp {vp}"
+    model.layers[0].vp = vp
+    model.distance["azimuth"] = 30.0
+    model.extra["note"] = "test"
+    return model
+
+def assert_same_model(loaded, model):
+    assert loaded.asGER() == model.asGER()
+    assert loaded.asDict(peek=True) == model.asDict(peek=True)
+
+def test_round_trip():
+    model = make_model(5.5)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "model.pyrf")
+        write_binary_model(model, filename)
+        loaded = load_binary_model(filename)
+        arrays = ModelArchive(filename).layer_arrays(0)
+    assert_same_model(loaded, model)
+    assert arrays["vp"][0] == 5.5
+    assert len(arrays["thick"]) == len(model.layers)
+
+def test_append():
+    models = [make_model(5.0 + idx) for idx in range(4)]
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "models.pyrf")
+        archive = ModelArchive(filename)
+        archive.extend(models[:2])
+        archive.append(models[2])
+        archive.append(models[3])
+        index = numpy.fromfile(filename + INDEX_SUFFIX, dtype="<u8")
+        reopened = ModelArchive(filename)
+        loaded = list(reopened)
+        assert numpy.array_equal(reopened.scan_offsets(), index)
+        assert numpy.array_equal(reopened.offsets(), index)
+    assert len(index) == 4
+    for got, model in zip(loaded, models):
+        assert_same_model(got, model)
+
+def test_write_removes_stale_index():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "models.pyrf")
+        ModelArchive(filename).extend([make_model(5.0), make_model(6.0), make_model(7.0)])
+        write_binary_model(make_model(8.0), filename)
+        assert not os.path.exists(filename + INDEX_SUFFIX)
+        archive = ModelArchive(filename)
+        assert len(archive) == 1
+        assert archive[0].layers[0].vp == 8.0
+
+def test_out_of_date_index_rescanned():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "models.pyrf")
+        ModelArchive(filename).extend([make_model(5.0), make_model(6.0)])
+        index = open(filename + INDEX_SUFFIX, "rb").read()
+        # records appended by another writer, without the index
+        other = os.path.join(directory, "other.pyrf")
+        write_binary_model(make_model(7.0), other)
+        with open(filename, "ab") as f:
+            f.write(open(other, "rb").read())
+        archive = ModelArchive(filename)
+        assert [m.layers[0].vp for m in archive] == [5.0, 6.0, 7.0]
+        # reading leaves the index file alone
+        assert open(filename + INDEX_SUFFIX, "rb").read() == index
+        archive.append(make_model(8.0))
+        assert numpy.array_equal(numpy.fromfile(filename + INDEX_SUFFIX, dtype="<u8"),
+                                 archive.scan_offsets())
+
+def assert_raises_value_error(filename):
+    try:
+        list(ModelArchive(filename))
+    except ValueError:
+        return
+    raise AssertionError(f"no ValueError for {filename}")
+
+def test_corrupt_records():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "models.pyrf")
+        ModelArchive(filename).extend([make_model(5.0), make_model(6.0)])
+        data = open(filename, "rb").read()
+        offsets = numpy.fromfile(filename + INDEX_SUFFIX, dtype="<u8")
+        os.remove(filename + INDEX_SUFFIX)
+        truncated = os.path.join(directory, "truncated.pyrf")
+        with open(truncated, "wb") as f:
+            f.write(data[:-10])
+        assert_raises_value_error(truncated)
+        bad_magic = os.path.join(directory, "bad_magic.pyrf")
+        with open(bad_magic, "wb") as f:
+            f.write(data[:int(offsets[1])] + b"NOTMODEL" + data[int(offsets[1])+8:])
+        assert_raises_value_error(bad_magic)
+        garbage = os.path.join(directory, "garbage.pyrf")
+        with open(garbage, "wb") as f:
+            f.write(data + b"\0"*5)
+        assert_raises_value_error(garbage)
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_append()
+    test_write_removes_stale_index()
+    test_out_of_date_index_rescanned()
+    test_corrupt_records()
+    print("ok")
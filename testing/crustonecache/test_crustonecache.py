@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# Profiles read from the memory mapped cache must be the same as from the
+# parsed model for every cell, and writing the cache must never leave a
+# partial cache behind. The comparison with the installed crustone package
+# needs crustone, the rest uses a small stand in for a parsed model. Run
+# with pytest or directly.
+#
+import os
+import sys
+import tempfile
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.crustonecache import CACHE_DIR_ENV, CACHE_PREFIX, CachedCrustOne, cache_dir, \
+        profiles_as_arrays, write_cache, read_cache, remove_stale_caches, load_cached_crustone
+from pyreflect.velocitymodel import crustone_cell
+
+class Layer:
+    def __init__(self, topDepth, botDepth, vp, vs, rho):
+        self.topDepth = topDepth
+        self.botDepth = botDepth
+        self.vp = vp
+        self.vs = vs
+        self.rho = rho
+    def thick(self):
+        return self.botDepth-self.topDepth
+
+class Profile:
+    def __init__(self, row, col):
+        moho = 25.0 + row % 7 + 0.5*(col % 5)
+        self.layers = [Layer(-1.0, 0.0, 1.5, 0.0, 1.0), Layer(0.0, moho, 6.0+0.01*col, 3.5, 2.7),
+                       Layer(moho, 6371.0, 8.0, 4.5, 3.3)]
+        # some cells have no water layer
+        if (row+col) % 3 == 0:
+            self.layers = self.layers[1:]
+        self._elevation = -1.0 + 0.001*row
+    def crust_thick(self):
+        return self.layers[-1].topDepth - self.layers[0].topDepth
+    def elevation(self):
+        return self._elevation
+
+class ParsedModel:
+    """Stand in for a parsed crustone model, a profile that depends on the cell."""
+    def find_profile(self, lat, lon):
+        row, col = crustone_cell(lat, lon)
+        return Profile(int(row), int(col))
+
+def assert_same_profile(got, expected):
+    assert len(got.layers) == len(expected.layers)
+    for g, e in zip(got.layers, expected.layers):
+        assert [g.topDepth, g.botDepth, g.vp, g.vs, g.rho, g.thick()] == \
+                [e.topDepth, e.botDepth, e.vp, e.vs, e.rho, e.thick()]
+    assert got.crust_thick() == expected.crust_thick()
+    assert got.elevation() == expected.elevation()
+
+def sample_points():
+    rng = numpy.random.default_rng(0)
+    points = list(zip(rng.uniform(-90, 90, 200).tolist(), rng.uniform(-180, 180, 200).tolist()))
+    return points + [(90.0, 0.0), (-90.0, 0.0), (0.0, 180.0), (0.0, -180.0), (45.0, 359.5), (-0.5, -0.5)]
+
+def test_cache_same_as_parsed():
+    parsed = ParsedModel()
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = os.path.join(directory, CACHE_PREFIX+"test")
+        write_cache(profiles_as_arrays(parsed), cache_path)
+        assert os.listdir(directory) == [CACHE_PREFIX+"test"]
+        cached = CachedCrustOne(read_cache(cache_path))
+        assert isinstance(cached.arrays["vp"], numpy.memmap)
+        for lat, lon in sample_points():
+            assert_same_profile(cached.find_profile(lat, lon), parsed.find_profile(lat, lon))
+
+def test_write_existing_and_stale():
+    arrays = profiles_as_arrays(ParsedModel())
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = os.path.join(directory, CACHE_PREFIX+"new")
+        stale_path = os.path.join(directory, CACHE_PREFIX+"old")
+        other_path = os.path.join(directory, "other")
+        for path in [stale_path, other_path]:
+            os.makedirs(path)
+        write_cache(arrays, cache_path)
+        # another process already wrote the same cache
+        write_cache(arrays, cache_path)
+        remove_stale_caches(cache_path)
+        assert sorted(os.listdir(directory)) == sorted([CACHE_PREFIX+"new", "other"])
+
+def test_cache_dir_env():
+    saved = os.environ.get(CACHE_DIR_ENV)
+    try:
+        os.environ[CACHE_DIR_ENV] = "/some/cache"
+        assert cache_dir() == "/some/cache"
+        del os.environ[CACHE_DIR_ENV]
+        assert cache_dir().endswith("pyreflect")
+    finally:
+        if saved is not None:
+            os.environ[CACHE_DIR_ENV] = saved
+
+def test_same_as_crustone():
+    crustone = pytest.importorskip("crustone")
+    parsed = crustone.parse()
+    with tempfile.TemporaryDirectory() as directory:
+        cached = load_cached_crustone(directory)
+        assert isinstance(cached, CachedCrustOne)
+        # second load uses the existing cache
+        assert isinstance(load_cached_crustone(directory), CachedCrustOne)
+        assert len(os.listdir(directory)) == 1
+        for lat, lon in sample_points():
+            assert_same_profile(cached.find_profile(lat, lon), parsed.find_profile(lat, lon))
+
+if __name__ == "__main__":
+    test_cache_same_as_parsed()
+    test_write_existing_and_stale()
+    test_cache_dir_env()
+    test_same_as_crustone()
+    print("ok")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+#
+# distaz_many must give the same distance, azimuth and back azimuth as
+# DistAz for each pair of points, including coincident points and
+# broadcasting events against stations. Run with pytest or directly.
+#
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.distaz import DistAz, distaz_many
+
+TOLERANCE = 1e-12 # degrees
+
+def random_points(num, seed):
+    rng = numpy.random.default_rng(seed)
+    return rng.uniform(-89.0, 89.0, num), rng.uniform(-180.0, 180.0, num)
+
+def assert_same_as_distaz(lat1, lon1, lat2, lon2, delta, az, baz):
+    for idx in numpy.ndindex(delta.shape):
+        expected = DistAz(float(lat1[idx]), float(lon1[idx]), float(lat2[idx]), float(lon2[idx]))
+        assert abs(delta[idx]-expected.getDelta()) < TOLERANCE, idx
+        # azimuths may be either side of 0/360
+        assert abs((az[idx]-expected.getAz()+180.0) % 360.0 - 180.0) < TOLERANCE, idx
+        assert abs((baz[idx]-expected.getBaz()+180.0) % 360.0 - 180.0) < TOLERANCE, idx
+
+def test_pairs():
+    lat1, lon1 = random_points(500, 1)
+    lat2, lon2 = random_points(500, 2)
+    # coincident, same meridian and equator pairs
+    lat1[:3], lon1[:3], lat2[:3], lon2[:3] = [10.0, 0.0, 0.0], [20.0, 30.0, 0.0], [10.0, 45.0, 0.0], [20.0, 30.0, 90.0]
+    delta, az, baz = distaz_many(lat1, lon1, lat2, lon2)
+    assert (delta[0], az[0], baz[0]) == (0.0, 0.0, 0.0)
+    assert_same_as_distaz(lat1, lon1, lat2, lon2, delta, az, baz)
+
+def test_broadcast():
+    evlat, evlon = random_points(4, 3)
+    stlat, stlon = random_points(30, 4)
+    delta, az, baz = distaz_many(evlat[:, None], evlon[:, None], stlat[None, :], stlon[None, :])
+    assert delta.shape == (4, 30)
+    shape = delta.shape
+    assert_same_as_distaz(numpy.broadcast_to(evlat[:, None], shape), numpy.broadcast_to(evlon[:, None], shape),
+                          numpy.broadcast_to(stlat[None, :], shape), numpy.broadcast_to(stlon[None, :], shape),
+                          delta, az, baz)
+
+if __name__ == "__main__":
+    test_pairs()
+    test_broadcast()
+    print("ok")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Copy on write EarthModel clones must behave like independent copies,
+# including for references to layers and parameter dicts taken before the
+# clone. Run with pytest or directly.
+#
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel, COPY_ON_WRITE
+from pyreflect.velocitymodel import VelocityModelLayer
+from pyreflect.runplanner import plan_runs
+from pyreflect.binarymodel import model_as_record
+
+def test_reference_before_clone():
+    model = EarthModel()
+    layers = model.layers
+    distance = model.distance
+    extra = model.extra
+    clone = model.clone()
+    layers[0].vp = 99.0
+    distance["azimuth"] = 12.0
+    extra["offset"] = 3.0
+    assert model.layers[0].vp == 99.0
+    assert clone.layers[0].vp == 6.5
+    assert clone.distance["azimuth"] == 45
+    assert clone.extra["offset"] == -10.0
+
+def test_reference_after_clone():
+    model = EarthModel()
+    clone = model.clone()
+    clone.layers[0].vp = 99.0
+    model.layers[1].vs = 1.0
+    assert model.layers[0].vp == 6.5
+    assert clone.layers[1].vs == 4.67
+
+def test_assigned_value():
+    model = EarthModel()
+    sourceDepths = [1.0, 2.0]
+    model.sourceDepths = sourceDepths
+    clone = model.clone()
+    sourceDepths.append(3.0)
+    assert clone.sourceDepths == [1.0, 2.0]
+
+def test_derived_model():
+    model = EarthModel()
+    model.layers = [VelocityModelLayer(20, 6.0, 3.5, 2.7), VelocityModelLayer(35, 6.5, 3.5, 2.7),
+                    VelocityModelLayer(0, 8.1, 4.67, 3.32)]
+    layers = model.layers
+    layers[1].vp_gradient = 0.01
+    grad = model.evalGradients()
+    layers[0].vp = 99.0
+    assert grad.peek_layers()[0].vp == 6.0
+    assert grad.layers[0].vp == 6.0
+
+def test_unused_values_shared():
+    model = EarthModel.loadAk135f(100)
+    clone = model.clone()
+    assert clone.peek_layers() is model.peek_layers()
+    assert clone.layers is not model.peek_layers()
+
+def assert_clone_shares_all(model):
+    clone = model.clone()
+    for name in COPY_ON_WRITE:
+        assert clone.peek(name) is model.peek(name), name
+
+def test_plan_runs_keeps_sharing():
+    model = EarthModel.loadAk135f(100)
+    plan = plan_runs([1.0, 5.0, 10.0], [100.0, 200.0, 300.0], [0, 0, 0], model, max_distances=2)
+    assert_clone_shares_all(model)
+    for job in plan["jobs"]:
+        assert_clone_shares_all(job)
+
+def test_model_as_record_keeps_sharing():
+    model = EarthModel.loadAk135f(100)
+    model_as_record(model)
+    model.asJSON()
+    assert_clone_shares_all(model)
+
+if __name__ == "__main__":
+    test_reference_before_clone()
+    test_reference_after_clone()
+    test_assigned_value()
+    test_derived_model()
+    test_unused_values_shared()
+    test_plan_runs_keeps_sharing()
+    test_model_as_record_keeps_sharing()
+    print("ok")
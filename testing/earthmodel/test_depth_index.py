@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#
+# Depth queries must put a depth on an interface in the layer below, find
+# the interfaces, and the kept depth index must follow changes to the
+# layers. Run with pytest or directly.
+#
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel
+from pyreflect.velocitymodel import VelocityModelLayer
+
+def three_layer_model():
+    model = EarthModel()
+    model.__set_owned__("layers", [VelocityModelLayer(20, 6.0, 3.5, 2.7), VelocityModelLayer(15, 6.5, 3.7, 2.8),
+                                   VelocityModelLayer(0, 8.1, 4.67, 3.32)])
+    return model
+
+def test_layer_number_at_interfaces():
+    model = three_layer_model()
+    depths = [0.0, 10.0, 20.0, 20.0-1e-9, 35.0, 34.0, 100.0]
+    assert model.layer_number_at(depths).tolist() == [0, 0, 1, 0, 2, 1, 2]
+    sampled = model.sample([20.0, 35.0])
+    assert sampled["vp"].tolist() == [6.5, 8.1]
+    assert sampled["layer"].tolist() == [1, 2]
+
+def test_on_layer_boundary():
+    model = three_layer_model()
+    depths = [0.0, 10.0, 20.0, 20.0+1e-7, 20.001, 35.0, 100.0]
+    assert model.on_layer_boundary(depths).tolist() == [False, False, True, True, False, True, False]
+    assert model.on_layer_boundary([20.001], tolerance=0.01).tolist() == [True]
+    halfspace = EarthModel()
+    halfspace.__set_owned__("layers", [VelocityModelLayer(0, 8.1, 4.67, 3.32)])
+    assert halfspace.on_layer_boundary([0.0, 10.0]).tolist() == [False, False]
+
+def test_negative_depth():
+    try:
+        three_layer_model().layer_number_at([-1.0])
+    except ValueError:
+        return
+    raise AssertionError("no ValueError for negative depth")
+
+def test_index_kept():
+    model = three_layer_model()
+    assert model.depth_index() is model.depth_index()
+    clone = model.clone()
+    assert clone.depth_index() is model.depth_index()
+    model.__set_owned__("layers", [VelocityModelLayer(10, 5.0, 3.0, 2.5), VelocityModelLayer(0, 8.1, 4.67, 3.32)])
+    assert model.layer_number_at([15.0]).tolist() == [1]
+    assert clone.layer_number_at([15.0]).tolist() == [0]
+
+def test_index_follows_changed_layers():
+    model = three_layer_model()
+    model.sample([5.0])
+    layers = model.layers
+    layers[0].thick = 5.0
+    layers[1].vp = 7.0
+    assert model.layer_number_at([10.0]).tolist() == [1]
+    assert model.sample([10.0])["vp"].tolist() == [7.0]
+    model.layers = [VelocityModelLayer(0, 8.1, 4.67, 3.32)]
+    assert model.layer_number_at([10.0]).tolist() == [0]
+
+if __name__ == "__main__":
+    test_layer_number_at_interfaces()
+    test_on_layer_boundary()
+    test_negative_depth()
+    test_index_kept()
+    test_index_follows_changed_layers()
+    print("ok")
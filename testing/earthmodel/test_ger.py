@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+#
+# GER output must match formatting each layer value with format(x, precision),
+# the original per line output, for printf like and other format specs, and
+# parse back to the same model. Run with pytest or directly.
+#
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel, GER_LAYER_COLUMNS
+
+PRECISIONS = [".4f", "", "g", ".2e", "<9.3f"]
+
+def reference_layer_lines(model, precision):
+    out = f"{len(model.layers)}\n"
+    for l in model.layers:
+        out += " ".join(format(getattr(l, key), precision) for key in GER_LAYER_COLUMNS)+"\n"
+    return out
+
+def models():
+    return [EarthModel(), EarthModel.loadAk135f(200).eft()]
+
+@pytest.mark.parametrize("precision", PRECISIONS)
+def test_same_as_per_line(precision):
+    for model in models():
+        ger = model.asGER(precision=precision)
+        expected = reference_layer_lines(model, precision) + model.ger_parameter_lines()
+        assert ger == expected
+
+def test_integer_values_with_empty_spec():
+    ger = EarthModel().asGER(precision="")
+    assert ger.splitlines()[1].split()[0] == "35"
+    assert EarthModel().asGER().splitlines()[1].split()[0] == "35.0000"
+
+def test_round_trip():
+    for model in models():
+        ger = model.asGER()
+        parsed = EarthModel.parseGER(ger.splitlines(keepends=True)).asGER()
+        # parameters are read as floats, so 100 comes back as 100.0, layers are unchanged
+        num_lines = len(model.layers)+1
+        assert parsed.splitlines()[:num_lines] == ger.splitlines()[:num_lines]
+        assert EarthModel.parseGER(parsed.splitlines(keepends=True)).asGER() == parsed
+
+if __name__ == "__main__":
+    for precision in PRECISIONS:
+        test_same_as_per_line(precision)
+    test_integer_values_with_empty_spec()
+    test_round_trip()
+    print("ok")
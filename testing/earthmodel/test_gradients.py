@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+#
+# evalGradients skips interior zero thickness layers but still rejects a
+# gradient in the halfspace. Run with pytest or directly.
+#
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel
+from pyreflect.velocitymodel import VelocityModelLayer
+
+def three_layer_model():
+    model = EarthModel()
+    model.layers = [VelocityModelLayer(35, 6.5, 3.5, 2.7), VelocityModelLayer(0, 7.0, 4.0, 3.0),
+                    VelocityModelLayer(0, 8.1, 4.67, 3.32)]
+    return model
+
+def test_halfspace_gradient_raises():
+    model = EarthModel()
+    model.layers[-1].vp_gradient = 0.01
+    with pytest.raises(ValueError, match="halfspace"):
+        model.evalGradients()
+
+def test_interior_zero_thick_skipped():
+    model = three_layer_model()
+    model.layers[1].vp_gradient = 0.01
+    out = model.evalGradients()
+    assert [l.vp for l in out.layers] == [6.5, 7.0, 8.1]
+
+def test_gradient_applied():
+    model = three_layer_model()
+    model.layers[0].vp_gradient = 0.01
+    out = model.evalGradients()
+    assert len(out.layers) > 3
+    assert sum(l.thick for l in out.layers) == pytest.approx(35)
+    assert all(l.vp_gradient == 0.0 for l in out.layers)
+
+if __name__ == "__main__":
+    test_halfspace_gradient_raises()
+    test_interior_zero_thick_skipped()
+    test_gradient_applied()
+    print("ok")
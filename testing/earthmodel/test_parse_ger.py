@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# parseGER must read every layer column, distance and source depth lists
+# that wrap over lines and an optional moment tensor, and
+# load_many_from_files must return the models in file order. Run with
+# pytest or directly.
+#
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel, DIST_IRREGULAR, DIST_REGULAR, DIST_SINGLE, load_many_from_files
+
+PARAMETER_LINES = [
+    "0.005 0.01 0.5 0.6 1.0",
+    "0.0 1.0 1.0 1024",
+]
+
+def ger_lines(layer_lines, distance_lines, source_lines, tail):
+    return [str(len(layer_lines))] + layer_lines + PARAMETER_LINES + distance_lines + source_lines + tail
+
+def test_layer_columns():
+    lines = ger_lines(["35 6.5 3.5 2.7 1400 600 2000 0.5 3000 0.25",
+                       "0 8.1 4.67 3.32 1400 600"],
+                      ["100 45"], ["1", "10"], ["0"])
+    layers = EarthModel.parseGER(lines).layers
+    assert [layers[0].tp1, layers[0].tp2, layers[0].ts1, layers[0].ts2] == [2000, 0.5, 3000, 0.25]
+    # missing columns have the VelocityModelLayer defaults
+    assert [layers[1].tp1, layers[1].tp2, layers[1].ts1, layers[1].ts2] == [1.0e4, 0.0001, 1.0e4, 0.0001]
+    assert [layers[1].thick, layers[1].vp, layers[1].vs, layers[1].rho, layers[1].qp, layers[1].qs] == \
+            [0, 8.1, 4.67, 3.32, 1400, 600]
+
+def test_short_layer_line():
+    with pytest.raises(ValueError):
+        EarthModel.parseGER(ger_lines(["35 6.5 3.5 2.7 1400"], ["100 45"], ["1", "10"], ["0"]))
+
+def test_wrapped_lists():
+    lines = ger_lines(["0 8.1 4.67 3.32 1400 600"],
+                      ["-1 30", "5", "100 150 200", "250 330"],
+                      ["4", "1.0 2.0", "3.0", "4.0"],
+                      ["0.5", "0.0 0.707 -0.707 0.0 0.0 0.0"])
+    model = EarthModel.parseGER(lines)
+    assert model.distance == {"type": DIST_IRREGULAR, "distanceList": [100, 150, 200, 250, 330], "azimuth": 30}
+    assert model.sourceDepths == [1.0, 2.0, 3.0, 4.0]
+    assert model.receiverDepth == 0.5
+    assert model.momentTensor["m_ne"] == 0.707
+    assert model.momentTensor["m_nd"] == -0.707
+
+def test_regular_and_single_distance():
+    regular = EarthModel.parseGER(ger_lines(["0 8.1 4.67 3.32 1400 600"], ["0 45", "100 50 4"], ["1", "10"], ["0"]))
+    assert regular.distance == {"type": DIST_REGULAR, "min": 100, "delta": 50, "num": 4, "azimuth": 45}
+    single = EarthModel.parseGER(ger_lines(["0 8.1 4.67 3.32 1400 600"], ["250 10"], ["1", "10"], ["0"]))
+    assert single.distance == {"type": DIST_SINGLE, "distance": 250, "azimuth": 10}
+
+def test_blank_trailing_line():
+    model = EarthModel.parseGER(ger_lines(["0 8.1 4.67 3.32 1400 600"], ["100 45"], ["1", "10"], ["0", ""]))
+    assert model.momentTensor == EarthModel().momentTensor
+
+def test_round_trip_irregular():
+    model = EarthModel()
+    model.distance = {"type": DIST_IRREGULAR, "distanceList": [100.0, 150.0, 330.0], "azimuth": 45.0}
+    model.sourceDepths = [1.0, 5.0]
+    model.receiverDepth = 0.0
+    parsed = EarthModel.parseGER(model.asGER())
+    assert parsed.distance == model.distance
+    assert parsed.sourceDepths == model.sourceDepths
+    assert parsed.asGER() == model.asGER()
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_load_many_from_files(use_processes):
+    models = [EarthModel.loadAk135f(50+10*idx) for idx in range(5)]
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = []
+        for idx, model in enumerate(models):
+            filename = os.path.join(directory, f"model_{idx}.ger")
+            model.writeToFile(filename)
+            filenames.append(filename)
+        loaded = load_many_from_files(filenames, max_workers=2, use_processes=use_processes)
+    assert [m.name for m in loaded] == [os.path.basename(f) for f in filenames]
+    for got, model in zip(loaded, models):
+        assert got.asGER().splitlines()[:len(model.layers)+1] == model.asGER().splitlines()[:len(model.layers)+1]
+
+if __name__ == "__main__":
+    test_layer_columns()
+    test_short_layer_line()
+    test_wrapped_lists()
+    test_regular_and_single_distance()
+    test_blank_trailing_line()
+    test_round_trip_irregular()
+    test_load_many_from_files(False)
+    test_load_many_from_files(True)
+    print("ok")
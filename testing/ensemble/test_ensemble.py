@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# GER text for a whole ensemble must be the same as flattening and
+# formatting each member model on its own, and perturbed layers must keep
+# the constraints of generate_ensemble. Run with pytest or directly.
+#
+import math
+import os
+import sys
+import tempfile
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel
+from pyreflect.velocitymodel import VelocityModelLayer
+from pyreflect.ensemble import generate_ensemble, ensemble_models, ensemble_as_GER, write_ensemble, \
+        __erf__, MIN_THICK
+
+PERTURBATIONS = {
+    "thick": {"dist": "normal", "scale": 0.1, "relative": True},
+    "vp": {"dist": "uniform", "scale": 0.2},
+    "vs": {"dist": "normal", "scale": 0.1},
+    "rho": {"dist": "normal", "scale": 0.02, "relative": True},
+}
+
+def base_model():
+    model = EarthModel.loadAk135f(200)
+    layers = model.layers
+    layers[1].vp_gradient = 0.01
+    return model
+
+@pytest.mark.parametrize("precision", [".4f", ".2e", "g"])
+def test_same_as_member_eft(precision):
+    model = base_model()
+    ensemble = generate_ensemble(model, 5, PERTURBATIONS, correlation_length=20.0, seed=1)
+    expected = [m.eft().asGER(precision=precision) for m in ensemble_models(model, ensemble)]
+    assert ensemble_as_GER(model, ensemble, precision=precision) == expected
+
+def test_same_as_member_without_eft():
+    model = base_model()
+    ensemble = generate_ensemble(model, 4, PERTURBATIONS, seed=2)
+    expected = [m.asGER() for m in ensemble_models(model, ensemble)]
+    assert ensemble_as_GER(model, ensemble, eft=False) == expected
+
+def test_write_ensemble():
+    model = base_model()
+    ensemble = generate_ensemble(model, 3, PERTURBATIONS, seed=3)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_ensemble(model, ensemble, directory, filename="run_{idx}/model.ger")
+        texts = []
+        for path in paths:
+            with open(path, "r") as f:
+                texts.append(f.read())
+    assert [os.path.relpath(p, directory) for p in paths] == [os.path.join(f"run_{idx}", "model.ger")
+                                                             for idx in range(3)]
+    assert texts == ensemble_as_GER(model, ensemble)
+
+def test_constraints():
+    model = EarthModel()
+    model.__set_owned__("layers", [VelocityModelLayer(3, 1.5, 0.0, 1.0), VelocityModelLayer(30, 6.5, 3.7, 2.8),
+                                   VelocityModelLayer(0, 8.1, 4.67, 3.32)])
+    ensemble = generate_ensemble(model, 200, {"thick": {"scale": 5.0}, "vp": {"scale": 0.5}},
+                                 vpvs="fixed", seed=4)
+    assert numpy.all(ensemble["thick"][:, 2] == 0.0)
+    assert numpy.all(ensemble["thick"][:, :2] >= MIN_THICK)
+    assert numpy.all(ensemble["vs"][:, 0] == 0.0)
+    assert numpy.allclose(ensemble["vp"][:, 1:]/ensemble["vs"][:, 1:], [6.5/3.7, 8.1/4.67])
+    clipped = generate_ensemble(model, 200, {"vs": {"scale": 1.0}}, vpvs=(1.6, 1.9), seed=5)
+    ratio = clipped["vp"][:, 1:]/clipped["vs"][:, 1:]
+    assert numpy.all((ratio >= 1.6-1e-12) & (ratio <= 1.9+1e-12))
+
+def test_erf():
+    x = numpy.linspace(-4, 4, 801)
+    assert numpy.max(numpy.abs(__erf__(x) - [math.erf(v) for v in x])) < 1.5e-7
+
+if __name__ == "__main__":
+    for precision in [".4f", ".2e", "g"]:
+        test_same_as_member_eft(precision)
+    test_same_as_member_without_eft()
+    test_write_ensemble()
+    test_constraints()
+    test_erf()
+    print("ok")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+#
+# A finite fault of one subfault on a Green's function node must be the
+# point source synthetic, the mechanism Green's functions from
+# to_time_domain weighted by its moment tensor, and sums, delays,
+# interpolation and rotation of subfaults must follow from that. Run with
+# pytest or directly.
+#
+import math
+import os
+import sys
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.finitefault import green_spectra, subfault_table, superpose_spectra, superpose, \
+        INTERP_NEAREST, INTERP_LINEAR
+from pyreflect.momenttensor import mechanism_weights, moment_scale_factor, sdr_to_ned, rotate_ned_horizontal
+from pyreflect.specfile import MECH_NAMES, to_time_domain
+
+STATION_AZIMUTH = 30.0
+RANGES = [100.0, 200.0, 300.0]
+DEPTHS = [5.0, 15.0]
+
+def spectral_results(nfpts=129, nffpts=100, seed=0):
+    """Results as from load_specfile, random spectra for each range, depth and mechanism."""
+    rng = numpy.random.default_rng(seed)
+    delta = 0.05
+    frequency = {"min": delta, "max": nffpts*delta, "delta": delta, "nffpts": nffpts,
+                 "nyquist": (nfpts-1)*delta, "nfpts": nfpts}
+    timeseries = []
+    for distance in RANGES:
+        for depth in DEPTHS:
+            for mech_idx in range(len(MECH_NAMES)):
+                raw = {}
+                for key in ["u0", "w0", "tn"]:
+                    raw[key] = numpy.zeros(nfpts, dtype=complex)
+                    raw[key][1:nffpts+1] = rng.standard_normal(nffpts) + 1j*rng.standard_normal(nffpts)
+                timeseries.append({"timeReduce": None, "distance": distance, "depth": depth,
+                                   "mech": MECH_NAMES[mech_idx], "z": None, "r": None, "t": None, "raw": raw})
+    inputs = {"frequency": frequency, "numranges": len(RANGES), "numdepths": len(DEPTHS),
+              "numsources": len(MECH_NAMES), "station_azimuth": STATION_AZIMUTH,
+              "ranges": tuple(RANGES), "depths": tuple(DEPTHS)}
+    return {"inputs": inputs, "timeseries": timeseries}
+
+def point_source(results, distance, depth, tensor, reduceVel=8.0, offset=-5.0):
+    """Mechanism weighted sum of the Green's functions at a node, from to_time_domain."""
+    weights = mechanism_weights(moment_scale_factor(tensor))[0]
+    timeseries = to_time_domain(results, reduceVel=reduceVel, offset=offset)["timeseries"]
+    out = {comp: 0.0 for comp in ["z", "r", "t"]}
+    for ts in timeseries:
+        if ts["distance"] == distance and ts["depth"] == depth:
+            mech_idx = {name: idx for idx, name in MECH_NAMES.items()}[ts["mech"]]
+            for comp in out:
+                out[comp] = out[comp] + weights[mech_idx]*ts[comp]
+    return out
+
+@pytest.mark.parametrize("interpolation", [INTERP_NEAREST, INTERP_LINEAR])
+def test_same_as_point_source(interpolation):
+    results = spectral_results()
+    tensor = sdr_to_ned(40, 60, 80, scalar_moment=1e17)
+    subfaults = subfault_table(15.0, 200.0, STATION_AZIMUTH, tensor)
+    got = superpose(results, subfaults, interpolation=interpolation, reduceVel=8.0, offset=-5.0)
+    expected = point_source(results, 200.0, 15.0, tensor)
+    assert got["timeReduce"] == pytest.approx(200.0/8.0-5.0)
+    for comp in ["z", "r", "t"]:
+        scale = numpy.max(numpy.abs(expected[comp]))
+        assert numpy.max(numpy.abs(got[comp]-expected[comp])) < 1e-12*scale, comp
+
+def test_sum_and_delay():
+    greens = green_spectra(spectral_results())
+    tensors = sdr_to_ned([10, 200], [45, 80], [90, -30], scalar_moment=1e16)
+    both = superpose_spectra(greens, subfault_table([5.0, 15.0], [100.0, 300.0], STATION_AZIMUTH, tensors,
+                                                    delay=[0.0, 2.0]))
+    first = superpose_spectra(greens, subfault_table(5.0, 100.0, STATION_AZIMUTH, tensors[:1]))
+    second = superpose_spectra(greens, subfault_table(15.0, 300.0, STATION_AZIMUTH, tensors[1:]))
+    freq = greens["frequency"]
+    omega = numpy.arange(freq["nfpts"])*freq["delta"]*2*math.pi
+    assert numpy.allclose(both, first + second*numpy.exp(-1j*omega*2.0))
+
+def test_linear_interpolation():
+    greens = green_spectra(spectral_results())
+    tensor = sdr_to_ned(0, 90, 0, scalar_moment=1e16)
+    middle = superpose_spectra(greens, subfault_table(5.0, 150.0, STATION_AZIMUTH, tensor))
+    near = superpose_spectra(greens, subfault_table(5.0, 100.0, STATION_AZIMUTH, tensor))
+    far = superpose_spectra(greens, subfault_table(5.0, 200.0, STATION_AZIMUTH, tensor))
+    assert numpy.allclose(middle, (near+far)/2)
+    nearest = superpose_spectra(greens, subfault_table(5.0, 140.0, STATION_AZIMUTH, tensor),
+                                interpolation=INTERP_NEAREST)
+    assert numpy.array_equal(nearest, near)
+
+def test_chunks():
+    greens = green_spectra(spectral_results())
+    rng = numpy.random.default_rng(1)
+    num = 50
+    subfaults = subfault_table(rng.uniform(5, 15, num), rng.uniform(100, 300, num),
+                               rng.uniform(20, 40, num), sdr_to_ned(rng.uniform(0, 360, num), 45, 90, 1e15),
+                               delay=rng.uniform(0, 3, num))
+    whole = superpose_spectra(greens, subfaults, chunk_size=num)
+    assert numpy.allclose(superpose_spectra(greens, subfaults, chunk_size=7), whole)
+
+def test_rotate_ned_horizontal():
+    rng = numpy.random.default_rng(2)
+    strike, dip, rake = rng.uniform(0, 360, 20), rng.uniform(0, 90, 20), rng.uniform(-180, 180, 20)
+    angle = rng.uniform(-180, 180, 20)
+    tensors = sdr_to_ned(strike, dip, rake)
+    rotated = rotate_ned_horizontal(tensors, angle)
+    # a fault at strike s is at strike s-angle after the rotation
+    assert numpy.allclose(rotated, sdr_to_ned(strike-angle, dip, rake))
+    assert numpy.allclose(rotate_ned_horizontal(rotated, -angle), tensors)
+    assert numpy.allclose(rotate_ned_horizontal(tensors, 0.0), tensors)
+
+def test_needs_six_mechanisms():
+    results = spectral_results()
+    results["inputs"]["numsources"] = 1
+    with pytest.raises(ValueError):
+        green_spectra(results)
+
+if __name__ == "__main__":
+    test_same_as_point_source(INTERP_NEAREST)
+    test_same_as_point_source(INTERP_LINEAR)
+    test_sum_and_delay()
+    test_linear_interpolation()
+    test_chunks()
+    test_rotate_ned_horizontal()
+    test_needs_six_mechanisms()
+    print("ok")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+#
+# Import time regression test, pyreflect modules must not load obspy or
+# crustone at import, and importing them, after numpy, must stay within
+# the budget. Run with pytest or directly.
+#
+import os
+import sys
+import subprocess
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+# microseconds, after numpy is already imported
+IMPORT_TIME_BUDGET_US = 100000
+HEAVY_PACKAGES = ["obspy", "crustone", "matplotlib", "scipy"]
+LEAN_MODULES = ["pyreflect", "pyreflect.specfile", "pyreflect.earthmodel", "pyreflect.velocitymodel",
+                "pyreflect.momenttensor", "pyreflect.optionalutil", "pyreflect.stationmetadata",
+                "pyreflect.finitefault", "pyreflect.misfit", "pyreflect.sacwriter"]
+
+def import_times(module):
+    """
+    Modules loaded by importing module after numpy, from python -X importtime,
+    as a dict of name to cumulative microseconds, and the total for module.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import numpy; import {module}"],
+                          stderr=subprocess.PIPE, stdout=subprocess.PIPE, env=env, check=True)
+    times = {}
+    total = 0
+    after_numpy = False
+    for line in proc.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[1].strip().isdigit():
+            continue # header line
+        name = fields[2][1:].rstrip()
+        cumulative = int(fields[1])
+        if after_numpy:
+            times[name.strip()] = cumulative
+            if not name.startswith(" "):
+                total += cumulative
+        elif name == "numpy":
+            after_numpy = True
+    return times, total
+
+def test_no_heavy_imports():
+    for module in LEAN_MODULES:
+        times, total = import_times(module)
+        loaded = [name for name in times if name.split(".")[0] in HEAVY_PACKAGES]
+        assert len(loaded) == 0, f"import {module} loads {loaded}"
+
+def test_import_time_budget():
+    for module in LEAN_MODULES:
+        # best of a few runs, to not fail on a slow start
+        total = min(import_times(module)[1] for i in range(3))
+        assert total <= IMPORT_TIME_BUDGET_US, f"import {module} took {total} us, budget {IMPORT_TIME_BUDGET_US} us"
+
+def test_all_submodules():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    code = "import pyreflect; print(all(hasattr(pyreflect, m) for m in pyreflect.__all__))"
+    proc = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, env=env, check=True)
+    assert proc.stdout.decode("utf-8").strip() == "True"
+
+if __name__ == "__main__":
+    for module in LEAN_MODULES:
+        times, total = import_times(module)
+        print(f"{module}: {total} us")
+    test_no_heavy_imports()
+    test_import_time_budget()
+    test_all_submodules()
+    print("ok")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Misfit measures on synthetics that are shifted and scaled copies of the
+# observed data, where the lag, correlation and amplitude ratio are known.
+# Run with pytest or directly.
+#
+import os
+import sys
+import numpy
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.misfit import misfit_block, rank_candidates, top_k, candidate_chunk_size, MEASURE_CC
+
+DT = 0.05
+NPTS = 400
+
+def pulse_observed(nstations=2, seed=7):
+    """Observed data, a smooth pulse per station and component, zero near the ends."""
+    rng = numpy.random.default_rng(seed)
+    t = numpy.arange(NPTS)
+    observed = numpy.zeros((nstations, 3, NPTS))
+    for s_idx in range(nstations):
+        for comp in range(3):
+            center = rng.uniform(150, 250)
+            observed[s_idx, comp] = numpy.exp(-((t-center)/8.0)**2) * numpy.cos((t-center)/5.0)
+    return observed
+
+def shifted(observed, shift, scale):
+    """Synthetic later than observed by shift samples, scaled by scale."""
+    return numpy.roll(observed, shift, axis=-1)*scale
+
+def test_lag_cc_amplitude():
+    observed = pulse_observed()
+    synthetics = numpy.stack([shifted(observed, 12, 2.0), shifted(observed, -7, 0.5)])
+    misfits = misfit_block(synthetics, observed, DT)
+    assert numpy.allclose(misfits["lag"][0], 12*DT)
+    assert numpy.allclose(misfits["lag"][1], -7*DT)
+    assert numpy.allclose(misfits["cc"], 1.0)
+    assert numpy.allclose(misfits["amplitude_ratio"][0], 2.0)
+    assert numpy.allclose(misfits["amplitude_ratio"][1], 0.5)
+    same = misfit_block(observed, observed, DT)
+    assert numpy.allclose(same["l2"], 0.0)
+    assert numpy.allclose(same["lag"], 0.0)
+
+def test_max_lag():
+    observed = pulse_observed()
+    misfits = misfit_block(shifted(observed, 12, 1.0), observed, DT, max_lag=5*DT)
+    assert numpy.all(numpy.abs(misfits["lag"]) <= 5*DT + 1e-12)
+    assert numpy.all(misfits["cc"] < 1.0)
+
+def test_missing_trace_nan():
+    observed = pulse_observed()
+    present = numpy.ones((2, 3), dtype=bool)
+    present[1, 2] = False
+    misfits = misfit_block(shifted(observed, 3, 1.5), observed, DT, present=present)
+    for key in ["l2", "cc", "lag", "amplitude_ratio"]:
+        assert numpy.isnan(misfits[key][0, 1, 2]), key
+        assert numpy.count_nonzero(numpy.isnan(misfits[key])) == 1, key
+
+def test_chunked_same_as_one_chunk():
+    observed = pulse_observed()
+    synthetics = numpy.stack([shifted(observed, shift, 1.0 + 0.1*shift) for shift in range(-5, 6)])
+    assert candidate_chunk_size(2, NPTS, memory_budget=1) == 1
+    whole = misfit_block(synthetics, observed, DT)
+    chunked = misfit_block(synthetics, observed, DT, memory_budget=1)
+    for key in whole:
+        assert numpy.allclose(chunked[key], whole[key], equal_nan=True), key
+
+def test_top_k():
+    scores = [3.0, numpy.nan, 1.0, 2.0, 5.0]
+    assert top_k(scores, 3).tolist() == [2, 3, 0]
+    assert top_k(scores, 2, largest=True).tolist() == [4, 0]
+    assert top_k(scores, 10).tolist() == [2, 3, 0, 4, 1]
+    assert len(top_k(scores, 0)) == 0
+
+def test_rank_candidates_cc():
+    observed = pulse_observed()
+    rng = numpy.random.default_rng(3)
+    noisy = [observed + rng.normal(0, level, observed.shape) for level in [0.5, 0.0, 0.2, 1.0]]
+    ranked = rank_candidates(numpy.stack(noisy), observed, DT, k=3, measure=MEASURE_CC)
+    assert ranked["index"].tolist() == [1, 2, 0]
+    assert numpy.isclose(ranked["score"][0], 1.0)
+    assert numpy.all(numpy.diff(ranked["score"]) <= 0)
+    by_l2 = rank_candidates(numpy.stack(noisy), observed, DT, k=3)
+    assert by_l2["index"].tolist() == [1, 2, 0]
+    assert numpy.all(numpy.diff(by_l2["score"]) >= 0)
+
+if __name__ == "__main__":
+    test_lag_cc_amplitude()
+    test_max_lag()
+    test_missing_trace_nan()
+    test_chunked_same_as_one_chunk()
+    test_top_k()
+    test_rank_candidates_cc()
+    print("ok")
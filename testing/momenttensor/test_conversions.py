@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#
+# Array moment tensor conversions must match the dict conversions for each
+# tensor, whatever form the tensors are given in. Run with pytest or
+# directly.
+#
+import os
+import sys
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.momenttensor import NED_COMPONENTS, RTP_COMPONENTS, rtp_to_ned, ned_to_rtp, \
+        ned_Nm_to_dynecm, ned_dynecm_to_gerscale, to_beachballarray, as_component_array, as_structured, \
+        rtp_to_ned_many, ned_to_rtp_many, ned_Nm_to_gerscale_many, to_beachballarray_many, ned_dict, \
+        mw_to_N_m, mw_scale_factor
+
+def random_tensors(num, seed=0):
+    return numpy.random.default_rng(seed).standard_normal((num, 6))
+
+def test_same_as_dict_conversions():
+    rtp = random_tensors(20)
+    ned = rtp_to_ned_many(rtp)
+    for rtp_row, ned_row in zip(rtp, ned):
+        expected = rtp_to_ned(dict(zip(RTP_COMPONENTS, rtp_row)))
+        assert ned_dict(ned_row) == pytest.approx(expected)
+    assert numpy.array_equal(ned_to_rtp_many(ned), rtp)
+    for row in ned:
+        assert [ned_to_rtp(ned_dict(row))[c] for c in RTP_COMPONENTS] == pytest.approx(ned_to_rtp_many(row)[0])
+
+def test_dict_round_trip():
+    rtp = dict(zip(RTP_COMPONENTS, [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]))
+    assert ned_to_rtp(rtp_to_ned(rtp)) == rtp
+
+def test_input_forms():
+    ned = random_tensors(5, seed=1)
+    rtp = ned_to_rtp_many(ned)
+    dicts = [ned_dict(row) for row in ned]
+    rtp_dicts = [dict(zip(RTP_COMPONENTS, row)) for row in rtp]
+    assert numpy.array_equal(as_component_array(dicts), ned)
+    assert numpy.allclose(as_component_array(rtp_dicts), ned)
+    assert numpy.allclose(as_component_array([{"tensor": d} for d in rtp_dicts]), ned)
+    assert numpy.array_equal(as_component_array(as_structured(ned)), ned)
+    assert numpy.allclose(as_component_array(as_structured(rtp, RTP_COMPONENTS)), ned)
+    assert numpy.allclose(as_component_array(as_structured(ned), RTP_COMPONENTS), rtp)
+    assert as_component_array(ned[0]).shape == (1, 6)
+    with pytest.raises(ValueError):
+        as_component_array(numpy.zeros((3, 5)))
+
+def test_scale():
+    ned = random_tensors(4, seed=2)*1e17
+    scaled = ned_Nm_to_gerscale_many(ned)
+    for row, scaled_row in zip(ned, scaled):
+        expected = ned_dynecm_to_gerscale(ned_Nm_to_dynecm(ned_dict(row)))
+        assert ned_dict(scaled_row) == pytest.approx(expected)
+    assert mw_to_N_m([4.0, 5.0]) == pytest.approx([mw_to_N_m(4.0), mw_to_N_m(5.0)])
+    assert mw_scale_factor(numpy.array([5.0]))[0] == pytest.approx(mw_scale_factor(5.0))
+
+def test_beachball():
+    ned = random_tensors(3, seed=3)
+    many = to_beachballarray_many(ned)
+    for row, bb in zip(ned, many):
+        assert to_beachballarray(ned_dict(row)) == pytest.approx(bb)
+        assert to_beachballarray({"tensor": ned_dict(row)}) == pytest.approx(bb)
+
+if __name__ == "__main__":
+    test_same_as_dict_conversions()
+    test_dict_round_trip()
+    test_input_forms()
+    test_scale()
+    test_beachball()
+    print("ok")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# Double couple tensors from strike, dip and rake must have the known
+# components for simple faults and the eigenvalues of a double couple, grids
+# must be the same however they are chunked, and the mechanism weights must
+# pick each Green's function's tensor component. Run with pytest or directly.
+#
+import os
+import sys
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.momenttensor import NED_COMPONENTS, MECH_COMPONENTS, sdr_to_ned, sdr_null_axis, \
+        mechanism_tensors, iter_sdr_grid, iter_focal_sphere, mechanism_weights, moment_scale_factor, ned_dict
+from pyreflect.specfile import MECH_NAMES
+
+def as_matrix(row):
+    m_nn, m_ne, m_nd, m_ee, m_ed, m_dd = row
+    return numpy.array([[m_nn, m_ne, m_nd], [m_ne, m_ee, m_ed], [m_nd, m_ed, m_dd]])
+
+def test_simple_faults():
+    # vertical strike slip on a north striking plane
+    assert ned_dict(sdr_to_ned(0, 90, 0)[0]) == pytest.approx(dict(zip(NED_COMPONENTS, [0, 1, 0, 0, 0, 0])))
+    # 45 degree thrust striking north
+    assert ned_dict(sdr_to_ned(0, 45, 90)[0]) == pytest.approx(dict(zip(NED_COMPONENTS, [0, 0, 0, -1, 0, 1])))
+    # normal fault is the opposite of the thrust
+    assert numpy.allclose(sdr_to_ned(0, 45, -90), -sdr_to_ned(0, 45, 90))
+
+def test_double_couple():
+    rng = numpy.random.default_rng(1)
+    strike, dip, rake = rng.uniform(0, 360, 50), rng.uniform(0, 90, 50), rng.uniform(-180, 180, 50)
+    tensors = sdr_to_ned(strike, dip, rake, scalar_moment=2.5)
+    null = sdr_null_axis(strike, dip, rake)
+    for row, b in zip(tensors, null):
+        m = as_matrix(row)
+        assert numpy.allclose(numpy.linalg.eigvalsh(m), [-2.5, 0.0, 2.5])
+        assert numpy.allclose(m @ b, 0.0)
+
+def test_isotropic_and_clvd():
+    tensors = mechanism_tensors(30, 60, 45, isotropic=0.2, clvd=0.3)
+    dc = sdr_to_ned(30, 60, 45)
+    b = sdr_null_axis(30, 60, 45)[0]
+    extra = as_matrix(tensors[0]-dc[0])
+    assert numpy.trace(extra) == pytest.approx(0.6)
+    clvd = extra - 0.2*numpy.eye(3)
+    assert numpy.allclose(numpy.linalg.eigvalsh(clvd), [-0.15, -0.15, 0.3])
+    assert numpy.allclose(clvd @ b, 0.3*b)
+
+def test_grid_chunks():
+    strikes, dips, rakes = [0, 90, 180], [30, 60], [-90, 0, 90, 180]
+    whole = list(iter_sdr_grid(strikes, dips, rakes, chunk_size=100))
+    assert len(whole) == 1
+    sdr, tensors = whole[0]
+    assert sdr.shape == (24, 3)
+    assert sdr[:4, 0].tolist() == [0]*4 and sdr[:4, 2].tolist() == rakes
+    chunks = list(iter_sdr_grid(strikes, dips, rakes, chunk_size=5))
+    assert [len(c[0]) for c in chunks] == [5, 5, 5, 5, 4]
+    assert numpy.array_equal(numpy.vstack([c[0] for c in chunks]), sdr)
+    assert numpy.array_equal(numpy.vstack([c[1] for c in chunks]), tensors)
+    assert numpy.allclose(tensors, sdr_to_ned(sdr[:, 0], sdr[:, 1], sdr[:, 2]))
+    scaled = next(iter_sdr_grid(strikes, dips, rakes, chunk_size=100, scalar_moment_N_m=1e17))[1]
+    assert numpy.allclose(scaled, tensors*moment_scale_factor(1e17))
+
+def test_focal_sphere():
+    first = numpy.vstack([c[0] for c in iter_focal_sphere(1000, chunk_size=300, seed=2)])
+    second = numpy.vstack([c[0] for c in iter_focal_sphere(1000, chunk_size=300, seed=2)])
+    assert first.shape == (1000, 3)
+    assert numpy.all((first[:, 1] >= 0) & (first[:, 1] <= 90))
+    assert numpy.array_equal(first, second)
+    # cosine of the dip is uniform, so half the dips are above 60 degrees
+    assert abs(numpy.mean(first[:, 1] > 60.0) - 0.5) < 0.1
+
+def test_mechanism_weights():
+    tensors = numpy.random.default_rng(3).standard_normal((4, 6))
+    weights = mechanism_weights(tensors)
+    for idx in range(len(MECH_NAMES)):
+        component = MECH_COMPONENTS[MECH_NAMES[idx]]
+        assert numpy.array_equal(weights[:, idx], tensors[:, NED_COMPONENTS.index(component)])
+    greens = numpy.random.default_rng(4).standard_normal((6, 10))
+    expected = [sum(ned_dict(t)[MECH_COMPONENTS[MECH_NAMES[idx]]]*greens[idx] for idx in range(6)) for t in tensors]
+    assert numpy.allclose(weights @ greens, expected)
+
+if __name__ == "__main__":
+    test_simple_faults()
+    test_double_couple()
+    test_isotropic_and_clvd()
+    test_grid_chunks()
+    test_focal_sphere()
+    test_mechanism_weights()
+    print("ok")
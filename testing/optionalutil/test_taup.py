@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#
+# The in memory TauP velocity model must match obspy reading the same
+# points from a .nd file, which also checks the obspy defaults copied into
+# optionalutil against the installed obspy version. Needs obspy, run with
+# pytest or directly.
+#
+import os
+import sys
+import tempfile
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+obspy = pytest.importorskip("obspy")
+import obspy.taup
+from obspy.taup.velocity_model import VelocityModel
+
+from pyreflect import optionalutil
+from pyreflect.earthmodel import EarthModel
+from pyreflect.velocitymodel import AK135F, PREM, load_nd_as_depth_points, save_nd
+
+def test_obspy_defaults():
+    defaults = obspy.taup._DEFAULT_VALUES
+    assert optionalutil.TAUP_DEFAULT_MOHO == defaults["default_moho"]
+    assert optionalutil.TAUP_DEFAULT_CMB == defaults["default_cmb"]
+    assert optionalutil.TAUP_DEFAULT_IOCB == defaults["default_iocb"]
+    assert optionalutil.TAUP_DEFAULT_QP == defaults["qp"]
+    assert optionalutil.TAUP_DEFAULT_QS == defaults["qs"]
+
+@pytest.mark.parametrize("modelname", [AK135F, PREM])
+def test_same_as_read_nd_file(modelname):
+    points = load_nd_as_depth_points(modelname)
+    v_mod = optionalutil.taup_velocity_model(points, model_name=modelname)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, modelname+".nd")
+        save_nd(points, filename)
+        expected = VelocityModel.read_nd_file(filename)
+    assert numpy.array_equal(v_mod.layers, expected.layers)
+    for key in ["radius_of_planet", "moho_depth", "cmb_depth", "iocb_depth"]:
+        assert getattr(v_mod, key) == getattr(expected, key)
+
+def test_create_taupymodel():
+    taup = optionalutil.create_taupymodel(EarthModel.loadAk135f(800))
+    assert isinstance(taup, obspy.taup.TauPyModel)
+    assert taup.model.radius_of_planet == 6371.0
+    arrivals = taup.get_travel_times(10.0, 30.0, phase_list=["P"])
+    assert len(arrivals) > 0
+
+def test_cached_same_as_in_memory():
+    model = EarthModel.loadAk135f(800)
+    optionalutil.__taup_memory_cache__.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        built = optionalutil.cached_taupymodel(model, directory=directory)
+        files = os.listdir(directory)
+        assert len(files) == 1
+        loaded = obspy.taup.TauPyModel(model=os.path.join(directory, files[0]))
+    for taup in [built, loaded]:
+        assert isinstance(taup, obspy.taup.TauPyModel)
+    expected = [a.time for a in built.get_travel_times(10.0, 30.0, phase_list=["P", "S"])]
+    assert [a.time for a in loaded.get_travel_times(10.0, 30.0, phase_list=["P", "S"])] == expected
+
+if __name__ == "__main__":
+    test_obspy_defaults()
+    test_same_as_read_nd_file(AK135F)
+    test_same_as_read_nd_file(PREM)
+    test_create_taupymodel()
+    test_cached_same_as_in_memory()
+    print("ok")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# Every event-station pair must map through the lookup to a job for its
+# key with a distance and source depth within the tolerances, and jobs must
+# respect the size limits. Run with pytest or directly.
+#
+import os
+import sys
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel, DIST_IRREGULAR
+from pyreflect.runplanner import cluster_values, plan_runs
+
+def random_pairs(num, seed):
+    rng = numpy.random.default_rng(seed)
+    depths = rng.uniform(0.0, 30.0, num)
+    distances = rng.uniform(50.0, 1000.0, num)
+    keys = rng.choice(["a", "b", "c"], num).tolist()
+    return depths, distances, keys
+
+def test_cluster_values():
+    values = numpy.array([5.0, 1.0, 1.4, 9.0, 2.1, 5.3, 1.0])
+    centers, labels = cluster_values(values, 0.5)
+    assert numpy.all(numpy.abs(centers[labels]-values) <= 0.5)
+    assert numpy.all(numpy.diff(centers) > 0)
+    assert len(centers) == 4
+    centers, labels = cluster_values(values, 0.0)
+    assert centers.tolist() == [1.0, 1.4, 2.1, 5.0, 5.3, 9.0]
+    assert numpy.array_equal(centers[labels], values)
+
+@pytest.mark.parametrize("max_distances,max_depths", [(None, None), (7, 3), (1, 1)])
+def test_lookup(max_distances, max_depths):
+    depths, distances, keys = random_pairs(300, 1)
+    models = {key: EarthModel.loadAk135f(100+idx*50) for idx, key in enumerate(["a", "b", "c"])}
+    plan = plan_runs(depths, distances, keys, models, distance_tolerance=10.0, depth_tolerance=2.0,
+                     max_distances=max_distances, max_depths=max_depths)
+    lookup = plan["lookup"]
+    assert plan["num_pairs"] == 300
+    assert plan["num_jobs"] == len(plan["jobs"]) == len(plan["job_keys"])
+    assert plan["reduction_factor"] == pytest.approx(300/plan["num_jobs"])
+    for idx in range(len(keys)):
+        job = plan["jobs"][lookup["job"][idx]]
+        assert plan["job_keys"][lookup["job"][idx]] == keys[idx]
+        assert job.peek_layers() is models[keys[idx]].peek_layers()
+        job_distance = job.distance["distanceList"][lookup["distance_index"][idx]]
+        job_depth = job.sourceDepths[lookup["depth_index"][idx]]
+        assert abs(job_distance-distances[idx]) <= 10.0
+        assert abs(job_depth-depths[idx]) <= 2.0
+        assert abs(job_distance-distances[idx]) <= plan["max_distance_error"]
+        assert abs(job_depth-depths[idx]) <= plan["max_depth_error"]
+    for job in plan["jobs"]:
+        assert job.distance["type"] == DIST_IRREGULAR
+        assert job.distance["azimuth"] == 45
+        if max_distances is not None:
+            assert len(job.distance["distanceList"]) <= max_distances
+        if max_depths is not None:
+            assert len(job.sourceDepths) <= max_depths
+
+def test_exact_pairs_share_job():
+    model = EarthModel.loadAk135f(100)
+    depths = [10.0, 10.0, 20.0, 10.0]
+    distances = [100.0, 200.0, 100.0, 100.0]
+    plan = plan_runs(depths, distances, ["x"]*4, model)
+    assert plan["num_jobs"] == 1
+    job = plan["jobs"][0]
+    assert job.distance["distanceList"] == [100.0, 200.0]
+    assert job.sourceDepths == [10.0, 20.0]
+    assert plan["lookup"]["distance_index"].tolist() == [0, 1, 0, 0]
+    assert plan["lookup"]["depth_index"].tolist() == [0, 0, 1, 0]
+    assert plan["max_distance_error"] == 0.0
+    # the base model is unchanged
+    assert model.peek("sourceDepths") == [0.001]
+
+def test_mismatched_lengths():
+    with pytest.raises(ValueError):
+        plan_runs([10.0, 20.0], [100.0], ["x", "x"], EarthModel())
+
+if __name__ == "__main__":
+    test_cluster_values()
+    for limits in [(None, None), (7, 3), (1, 1)]:
+        test_lookup(*limits)
+    test_exact_pairs_share_job()
+    test_mismatched_lengths()
+    print("ok")
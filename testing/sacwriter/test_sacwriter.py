@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+# SAC files written directly from the arrays must read back in obspy with
+# the same header values and data as the traces of results_to_stream, and
+# the traces written as SAC by obspy, and writing with threads must give the same files as writing in order.
+# Needs obspy, run with pytest or directly.
+#
+import io
+import os
+import sys
+import tempfile
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+obspy = pytest.importorskip("obspy")
+
+from pyreflect.crustonecache import CACHE_DIR_ENV
+from pyreflect.earthmodel import EarthModel
+from pyreflect.optionalutil import results_to_stream, results_to_sac
+from pyreflect.sacwriter import SAC_WRITE_CHUNK, write_results_sac
+from pyreflect.specfile import to_time_domain
+
+MECHS = ["zz", "xy", "xz", "xx", "yz", "yy"]
+
+def spectral_results(distances, depths, mechs=MECHS, nfpts=129, nffpts=100, seed=0):
+    """Results as from readSpecFile, random spectra for each distance, depth and mechanism."""
+    rng = numpy.random.default_rng(seed)
+    delta = 0.05
+    frequency = {"min": delta, "max": nffpts*delta, "delta": delta, "nffpts": nffpts,
+                 "nyquist": (nfpts-1)*delta, "nfpts": nfpts}
+    timeseries = []
+    for distance in distances:
+        for depth in depths:
+            for mech in mechs:
+                raw = {}
+                for key in ["u0", "w0", "tn"]:
+                    raw[key] = numpy.zeros(nfpts, dtype=complex)
+                    raw[key][1:nffpts+1] = rng.standard_normal(nffpts) + 1j*rng.standard_normal(nffpts)
+                timeseries.append({"timeReduce": None, "distance": distance, "depth": depth, "mech": mech,
+                                   "z": None, "r": None, "t": None, "raw": raw})
+    inputs = {"frequency": frequency, "numranges": len(distances), "numdepths": len(depths),
+              "numsources": len(mechs), "station_azimuth": 0.0,
+              "ranges": tuple(distances), "depths": tuple(depths)}
+    return {"inputs": inputs, "timeseries": timeseries}
+
+def obspy_sac_round_trip(tr):
+    """Trace tr as obspy writes it to a SAC file and reads it back."""
+    buffer = io.BytesIO()
+    tr.write(buffer, format="SAC")
+    buffer.seek(0)
+    return obspy.read(buffer, format="SAC")[0]
+
+def test_same_as_results_to_stream():
+    model = EarthModel.loadAk135f(800)
+    phase_list = ["P", "S"]
+    saved_env = os.environ.get(CACHE_DIR_ENV)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ[CACHE_DIR_ENV] = os.path.join(directory, "cache")
+        try:
+            stream, inv = results_to_stream(spectral_results([300.0, 1500.0], [10.0]), model,
+                                            reduceVel=8.0, offset=-5.0, phase_list=phase_list)
+            filenames = results_to_sac(spectral_results([300.0, 1500.0], [10.0]), model, directory,
+                                       reduceVel=8.0, offset=-5.0, phase_list=phase_list)
+            written = [obspy.read(filename)[0] for filename in filenames]
+        finally:
+            if saved_env is None:
+                del os.environ[CACHE_DIR_ENV]
+            else:
+                os.environ[CACHE_DIR_ENV] = saved_env
+    assert len(written) == len(stream) == 2*len(MECHS)*3
+    for tr, expected in zip(written, stream):
+        assert tr.id == expected.id
+        expected = obspy_sac_round_trip(expected)
+        assert numpy.allclose(tr.data, expected.data.astype(numpy.float32))
+        for key in ["b", "dist", "gcarc", "evdp", "t0"]:
+            assert tr.stats.sac[key] == pytest.approx(expected.stats.sac[key], rel=1e-6), key
+        for key in ["kstnm", "khole", "kcmpnm", "kt0"]:
+            assert tr.stats.sac[key] == expected.stats.sac[key], key
+        assert tr.stats.sac["idep"] == expected.stats.sac["idep"]
+        assert tr.stats.starttime == expected.stats.starttime
+        assert tr.stats.delta == pytest.approx(expected.stats.delta)
+
+def test_threaded_same_as_in_order():
+    # 6 distances, 3 depths, 6 mechanisms, 3 components is more than SAC_WRITE_CHUNK files
+    results = to_time_domain(spectral_results([100.0*(idx+1) for idx in range(6)], [5.0, 10.0, 15.0], seed=1))
+    assert 3*len(results["timeseries"]) > SAC_WRITE_CHUNK
+    with tempfile.TemporaryDirectory() as in_order, tempfile.TemporaryDirectory() as threaded:
+        expected = write_results_sac(results, in_order)
+        filenames = write_results_sac(results, threaded, max_workers=4)
+        assert [os.path.basename(f) for f in filenames] == [os.path.basename(f) for f in expected]
+        assert len(set(filenames)) == len(filenames)
+        for filename, expected_filename in zip(filenames, expected):
+            with open(filename, "rb") as f, open(expected_filename, "rb") as g:
+                assert f.read() == g.read()
+        tr = obspy.read(filenames[-1])[0]
+    ts = results["timeseries"][-1]
+    assert numpy.allclose(tr.data, numpy.asarray(ts["t"], dtype=numpy.float32))
+    assert tr.stats.sac["evdp"] == pytest.approx(15.0)
+
+if __name__ == "__main__":
+    test_same_as_results_to_stream()
+    test_threaded_same_as_in_order()
+    print("ok")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+#
+# Tiles must load as the model that was stored, be found by lookups even
+# when only another store's index has them, and least recently used tiles
+# must be evicted. Regions crossing the dateline must cover the right
+# columns. Building tiles needs crustone, run with pytest or directly.
+#
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.earthmodel import EarthModel
+from pyreflect.tilecache import TileStore, tile_key, tile_name, region_columns, build_tile_model, \
+        INDEX_FILENAME, TILE_SUFFIX
+from pyreflect.velocitymodel import AK135F
+
+def key_for(col, row=45):
+    return tile_key(AK135F, row, col, 100, 10, 5, 0.05, 0.05)
+
+def tile_model(vp):
+    model = EarthModel.loadAk135f(100)
+    model.__set_owned__("layers", [l for l in model.peek_layers()])
+    model.layers[0].vp = vp
+    model = model.eft()
+    model.__set_owned__("extra", dict(model.peek("extra"), elevation=-2.5))
+    return model
+
+def test_region_columns():
+    assert region_columns(0.0, 3.0) == [180, 181, 182]
+    assert region_columns(0.5, 2.5) == [180, 181, 182]
+    # crossing the dateline
+    assert region_columns(178.0, -178.0) == [358, 359, 0, 1]
+    assert region_columns(-180.0, 180.0) == list(range(360))
+    assert region_columns(10.0, 10.0) == [190]
+
+def test_put_get():
+    model = tile_model(5.5)
+    with tempfile.TemporaryDirectory() as directory:
+        store = TileStore(directory)
+        assert store.get(key_for(10)) is None
+        store.put(key_for(10), model)
+        got = store.get(key_for(10))
+        assert store.get(key_for(11)) is None
+        assert sorted(os.listdir(directory)) == sorted([INDEX_FILENAME, tile_name(key_for(10))+TILE_SUFFIX])
+    assert got.asGER() == model.asGER()
+    assert got.name == model.name
+    assert got.isEFT
+    assert got.peek("extra")["elevation"] == -2.5
+
+def test_index_advisory():
+    with tempfile.TemporaryDirectory() as directory:
+        first = TileStore(directory)
+        second = TileStore(directory)
+        first.put(key_for(10), tile_model(5.5))
+        # written by another store, so not in this index, but still found
+        assert tile_name(key_for(10)) not in second.index
+        assert second.get(key_for(10)) is not None
+        # a temporary file of a writer is not a tile
+        with open(os.path.join(directory, ".tile-partial"+TILE_SUFFIX), "wb") as f:
+            f.write(b"partial")
+        second.rebuild_index()
+        assert list(second.index.keys()) == [tile_name(key_for(10))]
+        assert TileStore(directory).index == second.index
+
+def test_evict_least_recently_used():
+    with tempfile.TemporaryDirectory() as directory:
+        store = TileStore(directory, max_tiles=2)
+        for idx, col in enumerate([10, 11]):
+            store.put(key_for(col), tile_model(5.0+idx))
+            path = store.tile_path(tile_name(key_for(col)))
+            os.utime(path, (1000+idx, 1000+idx))
+        # reading the older tile makes it the most recently used
+        assert store.get(key_for(10)) is not None
+        store.put(key_for(12), tile_model(7.0), update_index=False)
+        assert len(os.listdir(directory)) == 4
+        store.update_index()
+        assert store.get(key_for(11)) is None
+        assert store.get(key_for(10)) is not None
+        assert store.get(key_for(12)) is not None
+        assert sorted(store.index.keys()) == sorted([tile_name(key_for(10)), tile_name(key_for(12))])
+
+def test_warm_region():
+    pytest.importorskip("crustone")
+    with tempfile.TemporaryDirectory() as directory:
+        store = TileStore(directory)
+        built = store.warm_region(44.0, 46.0, 179.0, -179.0, maxdepth=100)
+        assert built == 4
+        assert store.warm_region(44.0, 46.0, 179.0, -179.0, maxdepth=100) == 0
+        assert len(store.index) == 4
+        model = store.get_model(45.5, -179.5, maxdepth=100)
+        expected = build_tile_model(tile_key(AK135F, 44, 0, 100, 10, 5, 0.05, 0.05))
+    assert model.asGER() == expected.asGER()
+    assert model.peek("extra")["elevation"] == expected.peek("extra")["elevation"]
+
+if __name__ == "__main__":
+    test_region_columns()
+    test_put_get()
+    test_index_advisory()
+    test_evict_least_recently_used()
+    test_warm_region()
+    print("ok")
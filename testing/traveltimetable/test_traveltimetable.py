@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+#
+# Travel times from the table, with exact TauP where interpolation is not
+# valid, must match get_travel_times for every point within the allowed
+# interpolation error, including near the upper mantle triplications.
+# Needs obspy, run with pytest or directly.
+#
+import os
+import sys
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+obspy = pytest.importorskip("obspy")
+
+from pyreflect.earthmodel import EarthModel
+from pyreflect.optionalutil import create_taupymodel
+from pyreflect.traveltimetable import DEFAULT_MAX_ERROR, exact_travel_times, travel_times_for_points, \
+        travel_time_error, build_travel_time_table, lookup_travel_times
+
+PHASES = ["P", "S", "PcP"]
+
+def get_travel_times(taupymodel, depth, distance, phase_list=PHASES):
+    arrivals = taupymodel.get_travel_times(source_depth_in_km=depth, distance_in_degree=distance,
+                                          phase_list=phase_list)
+    return [(a.name, float(a.time)) for a in arrivals]
+
+def test_exact_same_as_get_travel_times():
+    taup = create_taupymodel(EarthModel.loadAk135f(800))
+    phase_cache = {}
+    for depth, distance in [(10.0, 5.0), (10.0, 21.5), (35.0, 21.5), (10.0, 80.0)]:
+        expected = get_travel_times(taup, depth, distance)
+        assert exact_travel_times(taup, PHASES, depth, distance, phase_cache=phase_cache) == expected
+        assert exact_travel_times(taup, PHASES, depth, distance, names=["S"]) == \
+                [a for a in expected if a[0] == "S"]
+
+def test_table_same_as_get_travel_times():
+    taup = create_taupymodel(EarthModel.loadAk135f(800))
+    rng = numpy.random.default_rng(5)
+    num = 60
+    depths = rng.choice([10.0, 30.0], num)
+    # 12 to 32 degrees has the P and S triplications
+    distances = rng.uniform(12.0, 32.0, num)
+    arrivals = travel_times_for_points(taup, PHASES, depths, distances, table_delta=2.0)
+    for depth, distance, got in zip(depths.tolist(), distances.tolist(), arrivals):
+        expected = get_travel_times(taup, depth, distance)
+        assert [a[0] for a in got] == [a[0] for a in expected], (depth, distance)
+        assert travel_time_error(expected, got) <= DEFAULT_MAX_ERROR, (depth, distance)
+
+def test_lookup_without_taup():
+    taup = create_taupymodel(EarthModel.loadAk135f(800))
+    table = build_travel_time_table(taup, PHASES, [10.0], numpy.arange(40.0, 61.0, 2.0))
+    # outside the grid there is no interpolation
+    assert lookup_travel_times(table, [10.0, 10.0], [50.0, 70.0])[1] is None
+    got = lookup_travel_times(table, [10.0], [50.0])[0]
+    assert travel_time_error(get_travel_times(taup, 10.0, 50.0), got) <= DEFAULT_MAX_ERROR
+
+if __name__ == "__main__":
+    test_exact_same_as_get_travel_times()
+    test_table_same_as_get_travel_times()
+    test_lookup_without_taup()
+    print("ok")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+#
+# save_nd_arrays must write the same bytes as save_nd, and a model written
+# and loaded again must be unchanged. Run with pytest or directly.
+#
+import os
+import sys
+import tempfile
+import numpy
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+
+from pyreflect.velocitymodel import AK135F, ND_COLUMNS, load_nd_as_arrays, depth_points_from_arrays, \
+        save_nd, save_nd_arrays, VelocityModelPoint
+
+def saved_text(save, values):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "model.nd")
+        save(values, filename)
+        with open(filename, "r") as f:
+            return f.read()
+
+def test_same_as_save_nd():
+    arrays = load_nd_as_arrays(AK135F)
+    assert saved_text(save_nd_arrays, arrays) == saved_text(save_nd, depth_points_from_arrays(arrays))
+
+def test_round_trip():
+    arrays = load_nd_as_arrays(AK135F)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "model.nd")
+        save_nd_arrays(arrays, filename)
+        loaded = load_nd_as_arrays(filename)
+    for key in ND_COLUMNS[:4]:
+        assert numpy.array_equal(loaded[key], arrays[key])
+    assert numpy.array_equal(loaded["type"], arrays["type"])
+
+def test_integer_values():
+    points = []
+    for depth, vp, vs in [(0, 5.8, 3.2), (35, 6.5, 3.75), (35, 8.04, 4.48)]:
+        p = VelocityModelPoint(depth, vp, vs)
+        p.rho = 3
+        points.append(p)
+    arrays = {
+        "depth": numpy.array([0, 35, 35]),
+        "vp": numpy.array([5.8, 6.5, 8.04]),
+        "vs": numpy.array([3.2, 3.75, 4.48]),
+        "rho": numpy.array([3, 3, 3]),
+        "type": numpy.array(["unknown"]*3),
+    }
+    text = saved_text(save_nd_arrays, arrays)
+    assert text.splitlines()[1].split() == ["35", "6.5", "3.75", "3"]
+    assert text == saved_text(save_nd, points)
+
+if __name__ == "__main__":
+    test_same_as_save_nd()
+    test_round_trip()
+    test_integer_values()
+    print("ok")